@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Query-plan audit: fail when the API's SQL full-scans a hot table
+
+Generates a large database with db/generate_data.py, drives every API route
+through FastAPI's TestClient while collecting each statement the app runs
+(as SQLite expands it, bound parameters included), then runs EXPLAIN QUERY
+PLAN on one example of every distinct statement. Any plan step that SCANs
+a hot table and is not on the ALLOWED_SCANS list below is reported, and the
+exit status is 1, so the audit can gate a CI job.
+
+Usage: python backend/bench/audit_queries.py [--reservations 200000] [--tables reservations,payments] [--verbose]
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+
+from common import BACKEND_DIR, SRC_DIR, admin_headers, import_app, temp_db_path
+
+sys.path.insert(0, str(BACKEND_DIR / "db"))
+sys.path.insert(0, str(SRC_DIR))
+os.environ.setdefault("CARRENTAL_SLOW_QUERY_MS", "0")  # the audit's exports would all be "slow"
+
+import metrics  # noqa: E402  (the app's module; listeners must be added before it connects)
+from generate_data import generate  # noqa: E402
+
+HOT_TABLES = ('reservations', 'payments', 'users', 'car_features', 'daily_car_stats')
+
+# Scans that are the point of the statement, matched against the normalized SQL
+ALLOWED_SCANS = [
+    (re.compile(r"^SELECT id, car_id, start_epoch, end_epoch FROM reservations WHERE status IN \(\?\)$"),
+     "availability index load/verify reads every active reservation"),
+    (re.compile(r"^SELECT .* FROM (reservations r|payments p) JOIN .* ORDER BY [rp]\.id$"),
+     "admin export streams the table in id order; since/until only filter rows during that pass"),
+]
+
+STATEMENT_START = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+TABLE_REF = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+([A-Za-z_]\w*)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?", re.IGNORECASE)
+NOT_ALIASES = {'where', 'join', 'left', 'inner', 'cross', 'outer', 'natural', 'on', 'using', 'group', 'order',
+               'limit', 'set', 'values', 'select', 'union', 'except', 'intersect', 'indexed', 'not', 'window',
+               'as', 'default', 'returning'}
+
+
+def normalize(sql):
+    """Statement shape: literals replaced by ?, IN lists collapsed, whitespace squeezed"""
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"(?<![\w.])-?\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(?)", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def table_aliases(sql):
+    """alias (or bare table name) -> table, from the FROM/JOIN/UPDATE/INTO clauses"""
+    aliases = {}
+    for table, alias in TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias and alias.lower() not in NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+
+def hot_scans(conn, sql, hot_tables):
+    """(plan lines, [(table, plan detail)] of the hot-table scans) for one statement"""
+    plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    aliases = table_aliases(sql)
+    lines, scans = [], []
+    depth = {0: 0}
+    for node_id, parent, _, detail in plan:
+        depth[node_id] = depth.get(parent, 0) + 1
+        lines.append("  " * depth[node_id] + detail)
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and aliases.get(match.group(1), match.group(1)) in hot_tables:
+            scans.append((aliases.get(match.group(1), match.group(1)), detail))
+    return lines, scans
+
+
+def scenario(client, users, cars, admin):
+    """(label, method, url, kwargs) for one call of every route, with the interesting parameter mixes.
+
+    `admin` holds the request kwargs (headers) that authenticate as an admin.
+    """
+    day = date.today()
+
+    def days_ahead(first, last):
+        return {'start_datetime': f"{day + timedelta(days=first)}T10:00:00",
+                'end_datetime': f"{day + timedelta(days=last)}T10:00:00"}
+
+    # Far enough ahead to be past the generated bookings of most cars
+    period, moved = days_ahead(6000, 6003), days_ahead(6010, 6012)
+    month = {'start': (day - timedelta(days=30)).isoformat(), 'end': day.isoformat()}
+    car, user = cars // 2, users // 2
+
+    yield "GET /api/cars", "GET", "/api/cars", {}
+    for sort in ('id', 'daily_rate_cents', 'year', '-daily_rate_cents'):
+        yield "GET /api/cars", "GET", "/api/cars", {'params': {'limit': 20, 'sort': sort}}
+    yield "GET /api/cars", "GET", "/api/cars", {'params': {
+        'limit': 20, 'make': 'Toyota', 'model': 'Camry', 'year_min': 2020, 'year_max': 2024}}
+    yield "GET /api/cars", "GET", "/api/cars", {'params': {
+        'limit': 20, 'seats': 5, 'transmission': 'Automatic', 'min_rate_cents': 3000, 'max_rate_cents': 9000,
+        'status': 'available', 'features': 'bluetooth,gps'}}
+    yield "GET /api/cars/available", "GET", "/api/cars/available", {'params': {
+        'start': period['start_datetime'], 'end': period['end_datetime']}}
+    yield "GET /api/cars/available", "GET", "/api/cars/available", {'params': {
+        'start': period['start_datetime'], 'end': period['end_datetime'], 'make': 'Honda', 'seats': 5,
+        'transmission': 'Automatic', 'features': 'bluetooth'}}
+    yield "GET /api/features", "GET", "/api/features", {}
+    yield "GET /api/cars/{car_id}/bookings", "GET", f"/api/cars/{car}/bookings", {}
+    for granularity, days in (('day', 42), ('hour', 7)):
+        yield "GET /api/cars/{car_id}/availability", "GET", f"/api/cars/{car}/availability", {'params': {
+            'from': month['start'], 'days': days, 'granularity': granularity}}
+    yield "POST /api/login", "POST", "/api/login", {'json': {
+        'email': "nobody@example.com", 'password_hash': "wrong"}}
+    yield "POST /api/users", "POST", "/api/users", {'json': {
+        'full_name': "Audit User", 'email': "audit.user@example.com", 'password_hash': "audit"}}
+    yield "GET /api/reservations/user/{user_id}", "GET", f"/api/reservations/user/{user}", {}
+    for scope in ('upcoming', 'past'):
+        response = yield "GET /api/reservations/user/{user_id}", "GET", f"/api/reservations/user/{user}", {
+            'params': {'scope': scope, 'limit': 2}}
+        if response.headers.get('X-Next-Cursor'):
+            yield "GET /api/reservations/user/{user_id}", "GET", f"/api/reservations/user/{user}", {
+                'params': {'scope': scope, 'limit': 2, 'cursor': response.headers['X-Next-Cursor']}}
+
+    response = yield "POST /api/reservations", "POST", "/api/reservations", {'json': {
+        'user_id': user, 'car_id': car, **period}}
+    reservation_id = response.json().get('id') if response.status_code == 200 else None
+    yield "POST /api/reservations/batch", "POST", "/api/reservations/batch", {'json': {
+        'user_id': user, 'items': [{'car_id': car + 1, **period}, {'car_id': car + 2, **period}]}}
+    if reservation_id is not None:
+        yield "PUT /api/reservations/{id}", "PUT", f"/api/reservations/{reservation_id}", {'json': moved}
+        response = yield "POST /api/payments", "POST", "/api/payments", {'json': {
+            'reservation_id': reservation_id, 'amount_cents': 15000, 'card_number': "4242424242424242",
+            'card_holder': "Audit User", 'expiry_date': "12/34", 'cvv': "123"}}
+        if response.status_code == 202:
+            yield "GET /api/payments/{payment_id}", "GET", f"/api/payments/{response.json()['id']}", {
+                'params': {'wait': 5}, **admin}
+        yield "DELETE /api/reservations/{id}", "DELETE", f"/api/reservations/{reservation_id}", {}
+
+    for dataset in ('reservations', 'payments'):
+        yield "GET /api/admin/export/{dataset}", "GET", f"/api/admin/export/{dataset}", admin
+        yield "GET /api/admin/export/{dataset}", "GET", f"/api/admin/export/{dataset}", {'params': {
+            'format': 'csv', 'since': month['start'], 'until': month['end']}, **admin}
+    for encoding in ('bitmap', 'rle'):
+        yield "GET /api/admin/fleet/heatmap", "GET", "/api/admin/fleet/heatmap", {'params': {
+            'from': month['start'], 'days': 30, 'encoding': encoding}, **admin}
+    yield "GET /api/admin/stats/daily", "GET", "/api/admin/stats/daily", {'params': month, **admin}
+    yield "GET /api/admin/stats/daily", "GET", "/api/admin/stats/daily", {
+        'params': {**month, 'car_id': car}, **admin}
+    yield "GET /api/admin/stats/cars", "GET", "/api/admin/stats/cars", {'params': month, **admin}
+    yield "GET /api/admin/availability-index/check", "GET", "/api/admin/availability-index/check", admin
+    yield "GET /api/admin/images/check", "GET", "/api/admin/images/check", admin
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cars", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--reservations", type=int, default=200_000)
+    parser.add_argument("--tables", default=",".join(HOT_TABLES), help="comma-separated hot tables")
+    parser.add_argument("--verbose", action="store_true", help="print every statement's plan")
+    args = parser.parse_args()
+    hot_tables = {name.strip() for name in args.tables.split(",") if name.strip()}
+
+    db_path = temp_db_path("audit")
+    print(f"Generating {args.cars} cars, {args.users} users, {args.reservations} reservations ...")
+    generate(db_path, cars=args.cars, users=args.users, reservations=args.reservations, verbose=False)
+
+    # normalized SQL -> {'example': expanded SQL, 'routes': {label: count}}
+    statements = {}
+    current = ["(startup)"]
+
+    def collect(sql):
+        if not STATEMENT_START.match(sql):
+            return
+        entry = statements.setdefault(normalize(sql), {'example': sql, 'routes': {}})
+        entry['routes'][current[0]] = entry['routes'].get(current[0], 0) + 1
+
+    metrics.statement_listeners.append(collect)
+    app_module = import_app(db_path)
+    with TestClient(app_module.app) as client:
+        steps = scenario(client, args.users, args.cars, {'headers': admin_headers(app_module, db_path)})
+        response = None
+        while True:
+            try:
+                label, method, url, kwargs = steps.send(response)
+            except StopIteration:
+                break
+            current[0] = label
+            response = client.request(method, url, **kwargs)
+            if response.status_code >= 500 or response.status_code in (401, 403):
+                print(f"warning: {label} returned {response.status_code}: {response.text[:200]}")
+            current[0] = "(background)"
+    metrics.statement_listeners.remove(collect)
+
+    conn = sqlite3.connect(str(db_path))
+    findings = []
+    for shape, entry in sorted(statements.items()):
+        try:
+            lines, scans = hot_scans(conn, entry['example'], hot_tables)
+        except sqlite3.Error as e:
+            print(f"warning: could not explain ({e}): {shape[:120]}")
+            continue
+        allowed = next((reason for pattern, reason in ALLOWED_SCANS if pattern.search(shape)), None)
+        if scans and allowed is None:
+            findings.append((shape, entry, lines, scans))
+        if args.verbose:
+            routes = ", ".join(sorted(entry['routes']))
+            status = "SCAN" if scans and allowed is None else ("allowed" if scans else "ok")
+            print(f"\n[{status}] {routes}\n  {shape}")
+            print("\n".join("  " + line for line in lines))
+    conn.close()
+
+    print(f"\n{len(statements)} distinct statements from {sum(len(e['routes']) for e in statements.values())} "
+          f"route/statement pairs; hot tables: {', '.join(sorted(hot_tables))}")
+    if not findings:
+        print("No unexpected full scans.")
+        return 0
+    print(f"{len(findings)} statement(s) scan a hot table:")
+    for shape, entry, lines, scans in findings:
+        print(f"\n  routes: {', '.join(f'{route} x{count}' for route, count in sorted(entry['routes'].items()))}")
+        print(f"  scans:  {', '.join(f'{table} ({detail})' for table, detail in scans)}")
+        print(f"  sql:    {shape}")
+        print("\n".join("    " + line for line in lines))
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark for GET /api/cars/available
+
+Compares the client-side fan-out the frontend had to do before (catalog plus
+one bookings lookup per car, overlap computed in Python) with the single
+anti-join in fetch_available_cars(), on 10k cars and 1M reservations.
+
+Usage: python backend/bench/bench_available.py [--cars N] [--reservations N]
+"""
+
+import argparse
+import sqlite3
+import time
+from datetime import datetime
+
+from common import build_database, epoch, fetch_car_catalog, import_app, temp_db_path, timeit
+
+
+def fetch_car_bookings(app, conn, car_id):
+    """GET /api/cars/{car_id}/bookings as dicts"""
+    cursor = app.tuple_cursor(conn)
+    cursor.execute(app.CAR_BOOKINGS_SQL, (car_id,))
+    return app.rows_to_dicts(app.column_names(cursor), cursor.fetchall())
+
+
+def available_by_fanout(app, conn, start, end):
+    """What the client had to do: every car, then every car's bookings"""
+    free = []
+    for car in fetch_car_catalog(app, conn):
+        if car['status'] != 'available':
+            continue
+        bookings = fetch_car_bookings(app, conn, car['id'])
+        if not any(b['start_datetime'] < end and b['end_datetime'] > start for b in bookings):
+            free.append(car)
+    return free
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cars", type=int, default=10_000)
+    parser.add_argument("--reservations", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    db_path = build_database(temp_db_path("available"), cars=args.cars, reservations=args.reservations)
+    print(f"built {args.cars} cars / {args.reservations} reservations in {time.perf_counter() - started:.1f}s")
+
+    app = import_app(db_path)
+    conn = sqlite3.connect(str(db_path))
+    conn.row_factory = sqlite3.Row
+    conn.execute("ANALYZE")
+    app.feature_bits.load(conn)
+
+    windows = [
+        ("1 day", datetime(2024, 6, 1, 10), datetime(2024, 6, 2, 10)),
+        ("2 weeks", datetime(2024, 6, 1, 10), datetime(2024, 6, 15, 10)),
+    ]
+    print(f"{'window':>8} {'free cars':>10} {'fan-out (ms)':>14} {'anti-join (ms)':>16}")
+    for label, start, end in windows:
+        start_epoch, end_epoch = epoch(start), epoch(end)
+        expected = available_by_fanout(app, conn, start.isoformat(), end.isoformat())
+        result = app.fetch_available_cars(conn, start_epoch, end_epoch)
+        assert [car['id'] for car in expected] == [car['id'] for car in result]
+        fanout_ms = timeit(lambda: available_by_fanout(app, conn, start.isoformat(), end.isoformat()), repeat=1)
+        join_ms = timeit(lambda: app.fetch_available_cars(conn, start_epoch, end_epoch), repeat=3)
+        print(f"{label:>8} {len(result):>10} {fanout_ms:>14.1f} {join_ms:>16.1f}")
+
+    filtered_ms = timeit(lambda: app.fetch_available_cars(
+        conn, epoch(datetime(2024, 6, 1, 10)), epoch(datetime(2024, 6, 2, 10)),
+        make="Toyota", seats=5, feature_mask=app.feature_bits.mask_for(["bluetooth", "gps"])), repeat=3)
+    print(f"\nwith make/seats/feature filters: {filtered_ms:.1f} ms")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Benchmark: payload size and latency of the booking calendar's data
+
+Compares, for one car with a long booking history, what CarCalendar used to
+fetch (GET /api/cars/{id}/bookings, every active booking) with the month
+bitmap it fetches now (GET /api/cars/{id}/availability), both cold (cache
+miss) and warm (LRU hit). Requests go through the full ASGI stack with
+FastAPI's TestClient.
+
+Usage: python backend/bench/bench_calendar.py [--bookings 20000]
+"""
+
+import argparse
+import time
+
+from fastapi.testclient import TestClient
+
+from common import build_database, import_app, temp_db_path
+
+
+def per_request_ms(func, requests):
+    started = time.perf_counter()
+    for i in range(requests):
+        func(i)
+    return (time.perf_counter() - started) * 1000 / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bookings", type=int, default=20_000, help="reservations of the benchmarked car")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    db_path = build_database(temp_db_path("calendar"), cars=1, reservations=args.bookings)
+    app_module = import_app(db_path)
+
+    with TestClient(app_module.app) as client:
+        bookings = client.get("/api/cars/1/bookings")
+        month = client.get("/api/cars/1/availability", params={"from": "2024-03-01", "days": 31})
+        print(f"car 1: {len(bookings.json())} active bookings\n")
+        print(f"{'request':>28} {'bytes':>9} {'ms/request':>11}")
+
+        runs = [
+            ("bookings (old)", bookings, lambda i: client.get("/api/cars/1/bookings")),
+            # A different month each time, so every request misses the cache
+            ("availability, cold", month, lambda i: client.get(
+                "/api/cars/1/availability", params={"from": f"{2024 + i // 12}-{i % 12 + 1:02d}-01", "days": 31})),
+            ("availability, cached", month, lambda i: client.get(
+                "/api/cars/1/availability", params={"from": "2024-03-01", "days": 31})),
+        ]
+        for label, sample, run in runs:
+            print(f"{label:>28} {len(sample.content):>9} {per_request_ms(run, args.requests):>11.2f}")
+        print(f"\ncache: {app_module.occupancy_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
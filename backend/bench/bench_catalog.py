@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark for GET /api/cars catalog loading
+
+Compares the old per-car feature lookup (one query per car) with the
+endpoint's set-based batches (app.fetch_catalog_batch(), driven by
+common.fetch_car_catalog() as the unpaged stream does) at several fleet sizes.
+
+Usage: python backend/bench/bench_catalog.py
+"""
+
+import sqlite3
+
+from common import build_database, fetch_car_catalog, import_app, temp_db_path, timeit
+
+FLEET_SIZES = [10, 1_000, 10_000]
+
+
+def catalog_per_car(app, conn):
+    """The original N+1 implementation, kept here for comparison"""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {app.CAR_COLUMNS} FROM cars")
+    cars = [dict(row) for row in cursor.fetchall()]
+    for car in cars:
+        cursor.execute("""
+            SELECT f.name
+            FROM features f
+            JOIN car_features cf ON f.id = cf.feature_id
+            WHERE cf.car_id = ?
+            ORDER BY f.name
+        """, (car['id'],))
+        car['features'] = [row['name'] for row in cursor.fetchall()]
+    return app.attach_images(cars)
+
+
+def main():
+    print(f"{'cars':>8} {'per-car (ms)':>14} {'set-based (ms)':>16} {'speedup':>9}")
+    for size in FLEET_SIZES:
+        db_path = build_database(temp_db_path(f"catalog-{size}"), cars=size)
+        app = import_app(db_path)
+        conn = sqlite3.connect(str(db_path))
+        conn.row_factory = sqlite3.Row
+
+        assert catalog_per_car(app, conn) == fetch_car_catalog(app, conn)
+        old_ms = timeit(lambda: catalog_per_car(app, conn))
+        new_ms = timeit(lambda: fetch_car_catalog(app, conn))
+        conn.close()
+        print(f"{size:>8} {old_ms:>14.2f} {new_ms:>16.2f} {old_ms / new_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
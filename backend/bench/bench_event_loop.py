@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cheap-request latency while an expensive query is running
+
+Drives the FastAPI app in-process with httpx. Cheap GET /api/cars/{id}/bookings
+requests arrive on a fixed schedule (open loop), and latency is measured from
+each request's scheduled arrival, so time spent waiting on a blocked event
+loop is counted. Meanwhile a SQL-heavy aggregate keeps running through
+database.run().
+
+Runs twice: with DB work on the worker threads (current code) and with DB work
+executed inline on the event loop (the old behaviour).
+
+Usage: python backend/bench/bench_event_loop.py
+"""
+
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from common import build_database, import_app, percentile, temp_db_path
+
+FLEET_SIZE = 2_000
+RESERVATIONS = 200_000
+CHEAP_REQUESTS = 300
+ARRIVAL_INTERVAL_MS = 10
+
+
+def expensive_query(conn):
+    """A deliberately slow, SQL-bound report (self-join over reservations)"""
+    return conn.execute("""
+        SELECT COUNT(*)
+        FROM reservations a
+        JOIN reservations b ON b.car_id = a.car_id AND b.id < a.id
+        WHERE a.car_id <= 40
+    """).fetchone()[0]
+
+
+async def run_inline(database, func, *args, **kwargs):
+    """Old behaviour: blocking sqlite3 call directly on the event loop"""
+    with database.connection() as conn:
+        return func(conn, *args, **kwargs)
+
+
+async def measure(app_module, inline):
+    database = app_module.database
+    original_run = database.run
+    if inline:
+        database.run = lambda func, *a, **kw: run_inline(database, func, *a, **kw)
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    latencies = []
+    stop = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def expensive():
+            while not stop.is_set():
+                await database.run(expensive_query)
+                await asyncio.sleep(0)
+
+        async def cheap(i, scheduled):
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            response = await client.get(f"/api/cars/{i % FLEET_SIZE + 1}/bookings")
+            latencies.append((time.perf_counter() - scheduled) * 1000)
+            assert response.status_code == 200
+
+        background = asyncio.create_task(expensive())
+        await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            cheap(i, start + i * ARRIVAL_INTERVAL_MS / 1000) for i in range(CHEAP_REQUESTS)
+        ))
+        stop.set()
+        await background
+
+    database.run = original_run
+    return latencies
+
+
+def main():
+    db_path = build_database(temp_db_path("event-loop"), cars=FLEET_SIZE, reservations=RESERVATIONS)
+    app_module = import_app(db_path)
+
+    started = time.perf_counter()
+    with app_module.database.connection() as conn:
+        expensive_query(conn)
+    print(f"expensive query alone: {(time.perf_counter() - started) * 1000:.1f} ms\n")
+
+    print(f"{'mode':>14} {'p50 (ms)':>10} {'p99 (ms)':>10} {'mean (ms)':>10}")
+    for label, inline in (("inline (old)", True), ("db threads", False)):
+        latencies = asyncio.run(measure(app_module, inline))
+        print(f"{label:>14} {percentile(latencies, 50):>10.2f} {percentile(latencies, 99):>10.2f} "
+              f"{statistics.mean(latencies):>10.2f}")
+    app_module.database.close()
+
+
+if __name__ == "__main__":
+    main()
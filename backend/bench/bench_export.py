@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memory and throughput of GET /api/admin/export/reservations
+
+Streams the full reservations export (NDJSON and CSV) by calling the ASGI
+app directly (httpx's ASGITransport would buffer the whole body and measure
+the client instead) and samples the process RSS every 10 ms while it runs. A
+constant-memory export shows the same RSS at the start and at the peak no
+matter how many rows are exported; for comparison the old approach of
+fetchall() + building the whole body is measured on the same query.
+
+Usage: python backend/bench/bench_export.py [--reservations 1000000]
+"""
+
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+from common import admin_headers, build_database, import_app, temp_db_path
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE / 2**20
+
+
+class RssSampler:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start = self.peak = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+async def stream(app_module, headers, path, query=""):
+    """GET path?query against the ASGI app, counting body bytes as they are sent"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"bench")] + [(name.lower().encode(), value.encode())
+                                            for name, value in headers.items()],
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+    requested = False
+    totals = {"status": None, "bytes": 0, "lines": 0}
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            totals["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            totals["bytes"] += len(message.get("body", b""))
+            totals["lines"] += message.get("body", b"").count(b"\n")
+
+    await app_module.app(scope, receive, send)
+    assert totals["status"] == 200
+    return totals["bytes"], totals["lines"]
+
+
+def fetchall_export(app_module):
+    """The fetchall() approach: every row in memory, then one big body"""
+    import exports
+    import fastjson
+    sql, params = exports.build_export_query('reservations')
+    with app_module.database.connection() as conn:
+        cursor = fastjson.tuple_cursor(conn)
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        body = fastjson.encoder_for(fastjson.column_names(cursor)).encode_lines(rows)
+    return len(body), body.count(b"\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cars", type=int, default=1_000)
+    parser.add_argument("--reservations", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    db_path = build_database(temp_db_path("export"), cars=args.cars, reservations=args.reservations)
+    app_module = import_app(db_path)
+    headers = admin_headers(app_module, db_path)
+    print(f"database: {os.path.getsize(db_path) / 2**20:.0f} MiB\n")
+
+    print(f"{'export':>18} {'rows':>9} {'MiB out':>8} {'rows/s':>9} {'RSS start':>10} {'RSS peak':>9}")
+    runs = [
+        ("ndjson stream", lambda: asyncio.run(stream(app_module, headers, "/api/admin/export/reservations"))),
+        ("csv stream", lambda: asyncio.run(stream(app_module, headers, "/api/admin/export/reservations",
+                                                  "format=csv"))),
+        ("fetchall (old)", lambda: fetchall_export(app_module)),
+    ]
+    for label, run in runs:
+        with RssSampler() as rss:
+            started = time.perf_counter()
+            received, lines = run()
+            elapsed = time.perf_counter() - started
+        print(f"{label:>18} {lines:>9} {received / 2**20:>8.1f} {lines / elapsed:>9.0f} "
+              f"{rss.start:>8.1f}MB {rss.peak:>7.1f}MB")
+    app_module.database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET /api/admin/fleet/heatmap for a large fleet
+
+Builds a fleet with back-to-back bookings and times the heatmap (cars x
+days) end to end through FastAPI's TestClient, plus the pieces on their own:
+collecting the intervals from the availability index, painting the matrix
+and encoding it. Runs with NumPy and, for comparison, with the pure-Python
+fallback.
+
+Usage: python backend/bench/bench_heatmap.py [--cars 10000] [--days 90]
+"""
+
+import argparse
+
+from fastapi.testclient import TestClient
+
+from common import admin_headers, build_database, import_app, temp_db_path, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cars", type=int, default=10_000)
+    parser.add_argument("--per-car", type=int, default=30, help="reservations per car")
+    parser.add_argument("--days", type=int, default=90)
+    args = parser.parse_args()
+
+    db_path = build_database(temp_db_path("heatmap"), cars=args.cars, reservations=args.cars * args.per_car)
+    app_module = import_app(db_path)
+    import heatmap  # importable once import_app() has put src/ on sys.path
+    from datetimes import epoch_of
+
+    start = epoch_of("2024-01-15")
+    end = start + args.days * 86400
+    params = {"from": "2024-01-15", "days": args.days}
+
+    with TestClient(app_module.app, headers=admin_headers(app_module, db_path)) as client:
+        intervals = app_module.availability.window(start, end)
+        car_ids = list(range(1, args.cars + 1))
+        count = sum(len(starts) for starts, _ in intervals.values())
+        print(f"{args.cars} cars x {args.days} days, {count} intervals in the window\n")
+        print(f"{'implementation':>15} {'encoding':>9} {'index':>7} {'paint+encode':>13} {'request':>9} {'bytes':>9}")
+
+        numpy_module = heatmap.np
+        for label, module in (("numpy", numpy_module), ("python", None)):
+            if label == "numpy" and module is None:
+                print(f"{label:>15} (not installed)")
+                continue
+            heatmap.np = module
+            for encoding in heatmap.ENCODINGS:
+                index_ms = timeit(lambda: app_module.availability.window(start, end))
+                paint_ms = timeit(lambda: heatmap.fleet_heatmap(car_ids, intervals, start, args.days, encoding))
+                request_ms = timeit(lambda: client.get("/api/admin/fleet/heatmap",
+                                                       params={**params, "encoding": encoding}))
+                size = len(client.get("/api/admin/fleet/heatmap", params={**params, "encoding": encoding}).content)
+                print(f"{label:>15} {encoding:>9} {index_ms:>5.1f}ms {paint_ms:>11.1f}ms "
+                      f"{request_ms:>7.1f}ms {size:>9}")
+        heatmap.np = numpy_module
+
+
+if __name__ == "__main__":
+    main()
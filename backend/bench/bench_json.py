@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: JSON serialization cost per row for the list endpoints
+
+For each endpoint's query, compares (in microseconds per row, query included):
+
+  fastapi (old)  - sqlite3.Row -> dict, validation against the route's
+                   List[Dict[str, Any]] return type, JSON-mode dump, json.dumps
+  stdlib         - tuple rows through the precompiled RecordEncoder (no orjson)
+  orjson         - tuple rows -> dicts -> orjson.dumps (skipped if not installed)
+
+and asserts that all of them produce byte-identical JSON.
+
+Usage: python backend/bench/bench_json.py [--reservations 100000] [--catalog-cars 5000]
+"""
+
+import argparse
+import sqlite3
+from typing import Any, Dict, List
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from common import build_database, fetch_car_catalog, import_app, temp_db_path, timeit
+
+LIST_OF_DICTS = TypeAdapter(List[Dict[str, Any]])
+
+
+def fastapi_encode(rows):
+    """What FastAPI did for a handler annotated `-> List[Dict[str, Any]]`"""
+    content = LIST_OF_DICTS.validate_python([dict(row) for row in rows])
+    return JSONResponse(LIST_OF_DICTS.dump_python(content, mode="json")).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cars", type=int, default=20)
+    parser.add_argument("--reservations", type=int, default=100_000)
+    parser.add_argument("--catalog-cars", type=int, default=5_000)
+    args = parser.parse_args()
+
+    db_path = build_database(temp_db_path("json"), cars=args.cars, reservations=args.reservations, users=1)
+    app = import_app(db_path)
+    import fastjson  # importable once import_app() has put src/ on sys.path
+    conn = sqlite3.connect(str(db_path))
+    conn.row_factory = sqlite3.Row
+    user_id = conn.execute("SELECT id FROM users").fetchone()[0]
+
+    workloads = [
+        ("car bookings", app.CAR_BOOKINGS_SQL, (1,)),
+        ("user reservations", *app.build_rentals_query(user_id, None, 0)),
+    ]
+
+    print(f"{'endpoint':>18} {'rows':>7} {'fastapi (old)':>14} {'stdlib':>8} {'orjson':>8}   (us/row)")
+    for label, sql, params in workloads:
+        rows = conn.execute(sql, params).fetchall()
+        old = fastapi_encode(rows)
+
+        def run_stdlib():
+            cursor = fastjson.tuple_cursor(conn)
+            cursor.execute(sql, params)
+            return fastjson.encoder_for(fastjson.column_names(cursor)).encode_stdlib(cursor.fetchall())
+
+        assert run_stdlib() == old
+        old_us = timeit(lambda: fastapi_encode(conn.execute(sql, params).fetchall())) * 1000 / len(rows)
+        stdlib_us = timeit(run_stdlib) * 1000 / len(rows)
+        orjson_us = float("nan")
+        if fastjson.orjson is not None:
+            assert fastjson.query_json(conn, sql, params) == old
+            orjson_us = timeit(lambda: fastjson.query_json(conn, sql, params)) * 1000 / len(rows)
+        print(f"{label:>18} {len(rows):>7} {old_us:>14.2f} {stdlib_us:>8.2f} {orjson_us:>8.2f}")
+
+    conn.close()
+
+    # Catalog rows carry nested features/images, so they are dicts either way
+    catalog_path = build_database(temp_db_path("json-catalog"), cars=args.catalog_cars)
+    conn = sqlite3.connect(str(catalog_path))
+    conn.row_factory = sqlite3.Row
+    cars = fetch_car_catalog(app, conn)
+    old = JSONResponse(LIST_OF_DICTS.dump_python(LIST_OF_DICTS.validate_python(cars), mode="json")).body
+    assert fastjson.dumps(cars) == old
+    old_us = timeit(lambda: JSONResponse(LIST_OF_DICTS.dump_python(
+        LIST_OF_DICTS.validate_python(cars), mode="json")).body) * 1000 / len(cars)
+    new_us = timeit(lambda: fastjson.dumps(cars)) * 1000 / len(cars)
+    print(f"{'catalog (encode)':>18} {len(cars):>7} {old_us:>14.2f} {'':>8} {new_us:>8.2f}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Load test: mixed traffic against the whole API with per-route latency percentiles
+
+Builds a synthetic database, starts the app (in-process through httpx's
+ASGITransport, or under uvicorn in a child process with --mode uvicorn) and
+runs `--concurrency` virtual users for `--duration` seconds. Each user loops
+over a weighted mix of requests:
+
+  browse    GET /api/cars (a filtered/sorted page), /api/cars/available,
+            /api/features
+  lookups   GET /api/cars/{car_id}/bookings, /api/cars/{car_id}/availability,
+            /api/reservations/user/{user_id}
+  account   POST /api/login
+  booking   POST /api/reservations, PUT/DELETE /api/reservations/{id} on the
+            user's own bookings, POST /api/payments for unpaid ones
+
+Per route it reports requests/s and p50/p95/p99/max latency plus status
+codes, and writes everything to a JSON file. Pass an earlier result with
+--compare to print the change per route, e.g. before and after a commit:
+
+  python backend/bench/bench_load.py --output /tmp/before.json
+  git checkout <next>
+  python backend/bench/bench_load.py --output /tmp/after.json --compare /tmp/before.json
+
+Under --mode inproc the client shares the process (and GIL) with the app, so
+absolute numbers are lower than under uvicorn; compare runs of the same mode.
+
+Usage: python backend/bench/bench_load.py [--mode inproc|uvicorn] [--concurrency 50] [--duration 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+from common import BACKEND_DIR, MAKES, build_database, import_app, percentile, temp_db_path
+
+# operation -> weight in the traffic mix
+MIX = {
+    'catalog': 20,
+    'available': 8,
+    'features': 4,
+    'car_bookings': 8,
+    'car_availability': 10,
+    'user_reservations': 8,
+    'login': 8,
+    'create_reservation': 14,
+    'update_reservation': 6,
+    'cancel_reservation': 5,
+    'payment': 9,
+}
+PERCENTILES = (50, 95, 99)
+BOOKING_BASE = datetime(2031, 1, 1)
+
+
+def run_server(db_path, port):
+    import uvicorn
+    app_module = import_app(db_path)
+    uvicorn.run(app_module.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def serve(db_path):
+    """Start the app under uvicorn in a child process; returns (process, base_url)"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, __file__, "--serve", str(db_path), "--port", str(port)])
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(500):
+        try:
+            httpx.get(base_url + "/health")
+            return process, base_url
+        except httpx.TransportError:
+            time.sleep(0.02)
+    process.kill()
+    raise RuntimeError("load test server did not start")
+
+
+class VirtualUser:
+    """One simulated customer: browses, looks things up and books under its own account"""
+
+    def __init__(self, client, rng, user_id, cars, record):
+        self.client = client
+        self.rng = rng
+        self.user_id = user_id
+        self.email = f"bench{user_id - 1}@example.com"
+        self.cars = cars
+        self.record = record
+        self.unpaid = []
+        self.paid = []
+
+    async def request(self, route, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError:
+            response, status = None, 'error'
+        self.record(route, status, (time.perf_counter() - started) * 1000)
+        return response
+
+    def period(self):
+        start = BOOKING_BASE + timedelta(days=self.rng.randint(0, 700), hours=self.rng.randint(8, 18))
+        end = start + timedelta(days=self.rng.randint(1, 7))
+        return {'start_datetime': start.isoformat(), 'end_datetime': end.isoformat()}
+
+    async def catalog(self):
+        params = {'limit': 20, 'sort': self.rng.choice(['id', 'daily_rate_cents', 'year'])}
+        if self.rng.random() < 0.5:
+            params['make'] = self.rng.choice(MAKES)[0]
+        if self.rng.random() < 0.3:
+            params['seats'] = self.rng.choice([4, 5, 7])
+        await self.request("GET /api/cars", "GET", "/api/cars", params=params)
+
+    async def available(self):
+        period = self.period()
+        await self.request("GET /api/cars/available", "GET", "/api/cars/available",
+                           params={'start': period['start_datetime'], 'end': period['end_datetime']})
+
+    async def features(self):
+        await self.request("GET /api/features", "GET", "/api/features")
+
+    async def car_bookings(self):
+        car_id = self.rng.randint(1, self.cars)
+        await self.request("GET /api/cars/{car_id}/bookings", "GET", f"/api/cars/{car_id}/bookings")
+
+    async def car_availability(self):
+        car_id = self.rng.randint(1, self.cars)
+        month = BOOKING_BASE + timedelta(days=30 * self.rng.randint(0, 23))
+        await self.request("GET /api/cars/{car_id}/availability", "GET", f"/api/cars/{car_id}/availability",
+                           params={'from': month.strftime("%Y-%m-01"), 'days': 31})
+
+    async def user_reservations(self):
+        await self.request("GET /api/reservations/user/{user_id}", "GET", f"/api/reservations/user/{self.user_id}")
+
+    async def login(self):
+        await self.request("POST /api/login", "POST", "/api/login",
+                           json={'email': self.email, 'password_hash': "bench_password"})
+
+    async def create_reservation(self):
+        payload = {'user_id': self.user_id, 'car_id': self.rng.randint(1, self.cars), **self.period()}
+        response = await self.request("POST /api/reservations", "POST", "/api/reservations", json=payload)
+        if response is not None and response.status_code == 200:
+            self.unpaid.append(response.json()['id'])
+
+    async def update_reservation(self):
+        if not self.unpaid:
+            return await self.create_reservation()
+        reservation_id = self.rng.choice(self.unpaid)
+        await self.request("PUT /api/reservations/{id}", "PUT", f"/api/reservations/{reservation_id}",
+                           json=self.period())
+
+    async def cancel_reservation(self):
+        pool = self.unpaid if self.unpaid else self.paid
+        if not pool:
+            return await self.create_reservation()
+        reservation_id = pool.pop(self.rng.randrange(len(pool)))
+        await self.request("DELETE /api/reservations/{id}", "DELETE", f"/api/reservations/{reservation_id}")
+
+    async def payment(self):
+        if not self.unpaid:
+            return await self.create_reservation()
+        reservation_id = self.unpaid.pop(self.rng.randrange(len(self.unpaid)))
+        response = await self.request("POST /api/payments", "POST", "/api/payments", json={
+            'reservation_id': reservation_id, 'amount_cents': 15000, 'card_number': "4242424242424242",
+            'card_holder': "Bench User", 'expiry_date': "12/34", 'cvv': "123",
+        })
+        if response is not None and response.status_code == 202:
+            self.paid.append(reservation_id)
+
+    async def run(self, deadline):
+        operations = list(MIX)
+        weights = [MIX[name] for name in operations]
+        while time.perf_counter() < deadline:
+            await getattr(self, self.rng.choices(operations, weights)[0])()
+
+
+async def drive(client, args, users):
+    """Run the virtual users for warmup + duration seconds; returns (samples, measured seconds)"""
+    samples = {}
+    measuring = False
+
+    def record(route, status, latency_ms):
+        if measuring:
+            samples.setdefault(route, []).append((status, latency_ms))
+
+    rng = random.Random(args.seed)
+    virtual_users = [
+        VirtualUser(client, random.Random(rng.random()), user_id=i % users + 1, cars=args.cars, record=record)
+        for i in range(args.concurrency)
+    ]
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(user.run(started + args.warmup + args.duration)) for user in virtual_users]
+    await asyncio.sleep(args.warmup)
+    measuring = True
+    measure_started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    return samples, time.perf_counter() - measure_started
+
+
+def summarize(samples, elapsed):
+    routes = {}
+    for route in sorted(samples):
+        latencies = [latency for _, latency in samples[route]]
+        statuses = {}
+        for status, _ in samples[route]:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        routes[route] = {
+            'requests': len(latencies),
+            'rps': round(len(latencies) / elapsed, 1),
+            **{f'p{pct}_ms': round(percentile(latencies, pct), 2) for pct in PERCENTILES},
+            'max_ms': round(max(latencies), 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'status': statuses,
+        }
+    total = sum(route['requests'] for route in routes.values())
+    errors = sum(count for route in routes.values() for status, count in route['status'].items()
+                 if status == 'error' or status.startswith('5'))
+    every = [latency for route_samples in samples.values() for _, latency in route_samples]
+    totals = {
+        'requests': total,
+        'rps': round(total / elapsed, 1),
+        'errors': errors,
+        **{f'p{pct}_ms': round(percentile(every, pct), 2) for pct in PERCENTILES if every},
+        'max_ms': round(max(every), 2) if every else 0,
+    }
+    return totals, routes
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result, baseline=None):
+    print(f"{'route':>36} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  status codes")
+    for route, stats in list(result['routes'].items()) + [("TOTAL", result['totals'])]:
+        line = (f"{route:>36} {stats['rps']:>8.1f} {stats.get('p50_ms', 0):>8.2f} {stats.get('p95_ms', 0):>8.2f} "
+                f"{stats.get('p99_ms', 0):>8.2f} {stats.get('max_ms', 0):>8.2f}  ")
+        line += json.dumps(stats['status'], sort_keys=True) if 'status' in stats else f"{stats['errors']} errors"
+        print(line)
+
+    if baseline is None:
+        return
+    print(f"\nvs {baseline['meta'].get('revision') or 'baseline'} "
+          f"({baseline['meta']['mode']}, concurrency {baseline['meta']['concurrency']}):")
+    print(f"{'route':>36} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    old_routes = dict(baseline['routes'], TOTAL=baseline['totals'])
+    for route, stats in list(result['routes'].items()) + [("TOTAL", result['totals'])]:
+        old = old_routes.get(route)
+        if old is None:
+            print(f"{route:>36} {'(new)':>9}")
+            continue
+        changes = [change(stats.get(key), old.get(key)) for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"{route:>36} " + " ".join(f"{text:>9}" for text in changes))
+
+
+def change(new, old):
+    if not new or not old:
+        return "-"
+    return f"{(new - old) * 100 / old:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inproc", "uvicorn"), default="inproc")
+    parser.add_argument("--concurrency", type=int, default=50, help="virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of traffic before measuring")
+    parser.add_argument("--cars", type=int, default=1_000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--reservations", type=int, default=100_000, help="pre-existing reservations")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="result file (default: load-<revision>-<mode>.json in the temp dir)")
+    parser.add_argument("--compare", type=Path, help="earlier result file to compare against")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        run_server(args.serve, args.port)
+        return
+
+    db_path = build_database(temp_db_path("load"), cars=args.cars, reservations=args.reservations, users=args.users)
+    print(f"{args.mode}: {args.concurrency} virtual users, {args.warmup:g}s warmup + {args.duration:g}s, "
+          f"{args.cars} cars / {args.users} users / {args.reservations} reservations\n")
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(60.0)
+    if args.mode == "uvicorn":
+        process, base_url = serve(db_path)
+        try:
+            async def run():
+                async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+                    return await drive(client, args, args.users)
+            samples, elapsed = asyncio.run(run())
+        finally:
+            process.terminate()
+            process.wait()
+    else:
+        app_module = import_app(db_path)
+
+        async def run():
+            async with app_module.app.router.lifespan_context(app_module.app):
+                transport = httpx.ASGITransport(app=app_module.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limits,
+                                             timeout=timeout) as client:
+                    return await drive(client, args, args.users)
+        samples, elapsed = asyncio.run(run())
+
+    totals, routes = summarize(samples, elapsed)
+    result = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            'mode': args.mode,
+            'concurrency': args.concurrency,
+            'duration_s': round(elapsed, 2),
+            'warmup_s': args.warmup,
+            'dataset': {'cars': args.cars, 'users': args.users, 'reservations': args.reservations},
+            'mix': MIX,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        'totals': totals,
+        'routes': routes,
+    }
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_report(result, baseline)
+
+    output = args.output or Path(tempfile.gettempdir()) / f"load-{result['meta']['revision']}-{args.mode}.json"
+    output.write_text(json.dumps(result, indent=2) + "\n")
+    print(f"\nresults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark: requests/sec for 100 concurrent image fetches from /uploads
+
+Serves backend/uploads with plain StaticFiles (the old mount) and with
+CachedStaticFiles (current code) from a uvicorn server in a separate process
+on localhost, then fetches images with 100 concurrent httpx connections:
+
+  original     - full-size JPEG from uploads/cars
+  card         - the card-size derivative a catalog page now loads
+  revalidate   - conditional GET with the ETag from a previous visit (304)
+
+Derivatives must have been built first (python backend/src/images.py build).
+With `Cache-Control: immutable` a browser doesn't even send the revalidation
+request for derived files on repeat visits; the last row shows what each
+revisit still costs the server when it does.
+
+The httpx client is usually the bottleneck for small files, so compare rows
+with each other rather than reading them as the server's ceiling.
+
+Usage: python backend/bench/bench_static.py [--concurrency 100] [--rounds 10]
+"""
+
+import argparse
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.staticfiles import StaticFiles
+
+from common import SRC_DIR
+
+sys.path.insert(0, str(SRC_DIR))
+from images import UPLOADS_DIR, ImageManifest  # noqa: E402
+from static import CachedStaticFiles  # noqa: E402
+
+
+SERVERS = {"old": StaticFiles, "cached": CachedStaticFiles}
+
+
+def run_server(kind, port):
+    app = Starlette()
+    app.mount("/uploads", SERVERS[kind](directory=str(UPLOADS_DIR)))
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def serve(kind):
+    """Start uvicorn in a child process on a free port; returns (process, base_url)"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, __file__, "--serve", kind, "--port", str(port)])
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(500):
+        try:
+            httpx.get(base_url + "/uploads/")
+            return process, base_url
+        except httpx.TransportError:
+            time.sleep(0.02)
+    process.kill()
+    raise RuntimeError("benchmark server did not start")
+
+
+async def fetch_all(base_url, urls, concurrency, rounds, conditional):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        etags = {}
+        if conditional:
+            for url in urls:
+                etags[url] = (await client.get(url)).headers["etag"]
+
+        transferred = 0
+        statuses = {}
+
+        async def fetch(url):
+            nonlocal transferred
+            headers = {"If-None-Match": etags[url]} if conditional else {}
+            response = await client.get(url, headers=headers)
+            transferred += len(response.content)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await asyncio.gather(*(fetch(urls[i % len(urls)]) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return concurrency * rounds / elapsed, transferred / (concurrency * rounds), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--serve", choices=SERVERS, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        run_server(args.serve, args.port)
+        return
+
+    manifest = ImageManifest()
+    manifest.load()
+    originals = sorted(url for url in manifest.urls())
+    if not originals:
+        sys.exit("No derivative manifest found; run `python backend/src/images.py build` first")
+    cards = [manifest.derivatives(url)['card']['jpeg'] for url in originals]
+
+    print(f"{args.concurrency} concurrent fetches x {args.rounds} rounds over {len(originals)} images\n")
+    print(f"{'server':>18} {'workload':>11} {'req/s':>9} {'bytes/req':>10}  cache-control / status codes")
+    for label, kind in (("StaticFiles (old)", "old"), ("CachedStaticFiles", "cached")):
+        process, base_url = serve(kind)
+        cache_control = {
+            name: httpx.get(base_url + urls[0]).headers.get("cache-control", "-")
+            for name, urls in (("original", originals), ("card", cards))
+        }
+        for workload, urls, conditional in (("original", originals, False), ("card", cards, False),
+                                            ("revalidate", cards, True)):
+            rate, size, statuses = asyncio.run(fetch_all(base_url, urls, args.concurrency, args.rounds, conditional))
+            note = cache_control.get(workload, dict(sorted(statuses.items())))
+            print(f"{label:>18} {workload:>11} {rate:>9.0f} {size:>10.0f}  {note}")
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
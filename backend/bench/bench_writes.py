@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark: 500 concurrent reservation writes
+
+Fires a burst of POST /api/reservations requests at the in-process app with
+httpx and reports throughput, latency percentiles, failures and how many
+transactions were committed. Two workloads:
+
+  spread     - every request books a different car (no conflicts)
+  contended  - requests pile onto a few cars with overlapping dates; the
+               database is checked for double bookings afterwards
+
+Runs each workload through the single writer with group commit (current code)
+and through per-request transactions on the DB worker threads (the old
+behaviour: BEGIN IMMEDIATE + COMMIT per request on pooled connections).
+
+Usage: python backend/bench/bench_writes.py [--requests 500]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from common import build_database, import_app, percentile, temp_db_path
+
+FLEET_SIZE = 500
+CONTENDED_CARS = 20
+
+
+def transaction_per_request(database):
+    """Old behaviour: each write runs and commits on its own pooled connection"""
+    stats = {'transactions': 0}
+
+    def call(conn, func, args, kwargs):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn, *args, **kwargs)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        stats['transactions'] += 1
+        return result
+
+    async def submit(func, *args, **kwargs):
+        return await database.run(call, func, args, kwargs)
+
+    return submit, stats
+
+
+def booking_payloads(workload, count, seed=7):
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(count):
+        if workload == 'spread':
+            car_id, day = i % FLEET_SIZE + 1, 10 + i // FLEET_SIZE * 3
+            length = 2
+        else:
+            car_id, day = rng.randint(1, CONTENDED_CARS), rng.randint(1, 25)
+            length = rng.randint(1, 4)
+        payloads.append({
+            'user_id': 1, 'car_id': car_id,
+            'start_datetime': f"2030-03-{day:02d}T10:00:00",
+            'end_datetime': f"2030-03-{day + length:02d}T10:00:00",
+        })
+    return payloads
+
+
+def double_bookings(conn):
+    return conn.execute("""
+        SELECT COUNT(*)
+        FROM reservations a
+        JOIN reservations b ON b.car_id = a.car_id AND b.id > a.id
+        WHERE a.status IN ('confirmed', 'pending') AND b.status IN ('confirmed', 'pending')
+        AND a.start_epoch < b.end_epoch AND a.end_epoch > b.start_epoch
+        AND a.start_epoch >= strftime('%s', '2030-01-01')
+    """).fetchone()[0]
+
+
+async def burst(app_module, payloads, grouped):
+    writer = app_module.writer
+    before = writer.transactions
+    if not grouped:
+        submit, stats = transaction_per_request(app_module.database)
+        app_module.writer = type("PerRequestWriter", (), {"submit": staticmethod(submit)})()
+
+    latencies, codes = [], {}
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def book(payload):
+            started = time.perf_counter()
+            response = await client.post("/api/reservations", json=payload)
+            latencies.append((time.perf_counter() - started) * 1000)
+            codes[response.status_code] = codes.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(book(payload) for payload in payloads))
+        elapsed = time.perf_counter() - started
+
+    app_module.writer = writer
+    transactions = writer.transactions - before if grouped else stats['transactions']
+    return elapsed, latencies, codes, transactions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'workload':>10} {'mode':>20} {'req/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'commits':>8} {'double':>7}  status codes")
+    for workload in ('spread', 'contended'):
+        for label, grouped in (("per-request (old)", False), ("single writer", True)):
+            db_path = build_database(temp_db_path(f"writes-{workload}"), cars=FLEET_SIZE, users=5)
+            app_module = import_app(db_path)
+            app_module.writer.start()
+            with app_module.database.connection() as conn:
+                app_module.availability.load(conn)
+
+            payloads = booking_payloads(workload, args.requests)
+            elapsed, latencies, codes, transactions = asyncio.run(burst(app_module, payloads, grouped))
+            with app_module.database.connection() as conn:
+                doubles = double_bookings(conn)
+            app_module.writer.stop()
+            app_module.database.close()
+
+            print(f"{workload:>10} {label:>20} {len(payloads) / elapsed:>8.0f} "
+                  f"{percentile(latencies, 50):>9.1f} {percentile(latencies, 99):>9.1f} "
+                  f"{transactions:>8} {doubles:>7}  {dict(sorted(codes.items()))}")
+    print("\n'commits' is the number of write transactions; 'double' counts overlapping"
+          " active bookings left in the database")
+
+
+if __name__ == "__main__":
+    main()
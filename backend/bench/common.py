@@ -0,0 +1,166 @@
+"""
+Shared helpers for the backend benchmarks.
+
+Each benchmark builds its own throwaway SQLite database from
+backend/db/database.sql and fills it with synthetic rows, so results never
+depend on (or modify) the development database.
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+SCHEMA_PATH = BACKEND_DIR / "db" / "database.sql"
+SRC_DIR = BACKEND_DIR / "src"
+
+MAKES = [
+    ('Toyota', ['Camry', 'Corolla', 'RAV4']),
+    ('Honda', ['Civic', 'CR-V', 'Accord']),
+    ('Ford', ['Explorer', 'F-150', 'Escape']),
+    ('Tesla', ['Model 3', 'Model Y']),
+    ('BMW', ['330i', 'X5']),
+    ('Subaru', ['Outback', 'Forester']),
+]
+COLORS = ['White', 'Black', 'Silver', 'Blue', 'Red', 'Gray']
+
+
+def temp_db_path(name):
+    """Return a fresh database path inside a temporary directory"""
+    return Path(tempfile.mkdtemp(prefix="carrental-bench-")) / f"{name}.db"
+
+
+def epoch(moment):
+    """UTC epoch seconds of a naive UTC datetime"""
+    return int(moment.replace(tzinfo=timezone.utc).timestamp())
+
+
+def build_database(path, cars=10, reservations=0, users=50, seed=42):
+    """Create a database at `path` with the schema and synthetic rows.
+
+    Cars get 3-6 random features each. Reservations are laid out back to back
+    per car so the active ones never overlap.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(str(path))
+    with open(SCHEMA_PATH, 'r') as f:
+        conn.executescript(f.read())
+
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("BEGIN")
+    conn.execute("DELETE FROM payments")
+    conn.execute("DELETE FROM reservations")
+    conn.execute("DELETE FROM car_features")
+    conn.execute("DELETE FROM cars")
+
+    feature_ids = [row[0] for row in conn.execute("SELECT id FROM features")]
+    car_rows = []
+    for i in range(cars):
+        make, models = MAKES[i % len(MAKES)]
+        car_rows.append((
+            i + 1, f"BENCH{i:012d}", make, rng.choice(models), rng.randint(2018, 2024),
+            rng.choice(['Automatic', 'Automatic', 'Manual']), rng.choice([4, 5, 7]), 4,
+            rng.choice(COLORS), rng.randint(3000, 12000), 'available',
+            f"/uploads/cars/{make.lower()}.jpg",
+        ))
+    conn.executemany("""
+        INSERT INTO cars (id, vin, make, model, year, transmission, seats, doors, color,
+                          daily_rate_cents, status, image_url)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, car_rows)
+    conn.executemany(
+        "INSERT INTO car_features (car_id, feature_id) VALUES (?, ?)",
+        ((car_id, feature_id)
+         for car_id in range(1, cars + 1)
+         for feature_id in rng.sample(feature_ids, rng.randint(3, min(6, len(feature_ids))))),
+    )
+
+    conn.executemany(
+        "INSERT INTO users (full_name, email, password_hash) VALUES (?, ?, ?)",
+        ((f"Bench User {i}", f"bench{i}@example.com", "bench_password") for i in range(users)),
+    )
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users")]
+
+    if reservations and cars:
+        per_car = reservations // cars
+        base = datetime(2024, 1, 1)
+
+        def reservation_rows():
+            for car_id in range(1, cars + 1):
+                start = base + timedelta(hours=rng.randint(0, 48))
+                for _ in range(per_car):
+                    end = start + timedelta(hours=rng.randint(4, 96))
+                    status = rng.choice(['confirmed', 'confirmed', 'pending', 'completed', 'cancelled'])
+                    yield (rng.choice(user_ids), car_id, start.isoformat(), end.isoformat(),
+                           epoch(start), epoch(end), status, 5000)
+                    start = end + timedelta(hours=rng.randint(1, 72))
+
+        conn.executemany("""
+            INSERT INTO reservations (user_id, car_id, start_datetime, end_datetime, start_epoch, end_epoch,
+                                      status, daily_rate_cents)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, reservation_rows())
+
+    conn.commit()
+    conn.close()
+    return path
+
+
+def import_app(db_path):
+    """Import backend/src/app.py bound to the given database file"""
+    os.environ["CARRENTAL_DB_PATH"] = str(db_path)
+    if str(SRC_DIR) not in sys.path:
+        sys.path.insert(0, str(SRC_DIR))
+    sys.modules.pop("app", None)
+    import app
+    return app
+
+
+def admin_headers(app, db_path):
+    """Authorization header of an admin account (created if needed), for the /api/admin routes"""
+    conn = sqlite3.connect(str(db_path))
+    with conn:
+        conn.execute("""
+            INSERT OR IGNORE INTO users (full_name, email, password_hash, role)
+            VALUES ('Bench Admin', 'bench.admin@example.com', 'bench_password', 'admin')
+        """)
+        user_id = conn.execute("SELECT id FROM users WHERE email = 'bench.admin@example.com'").fetchone()[0]
+    conn.close()
+    token, _ = app.session_tokens.issue(user_id)
+    return {"Authorization": f"Bearer {token}"}
+
+
+def fetch_car_catalog(app, conn):
+    """Every car with its feature names and images, read the way an unpaged GET /api/cars streams them.
+
+    Calls the endpoint's own app.fetch_catalog_batch() once per
+    CATALOG_STREAM_BATCH cars, so benchmarks measure the shipped code path.
+    """
+    cars, after = [], None
+    while True:
+        batch, after = app.fetch_catalog_batch(conn, {}, 'id', app.CATALOG_STREAM_BATCH, after)
+        cars += batch
+        if after is None:
+            return cars
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def timeit(func, repeat=5):
+    """Run `func` `repeat` times and return the best wall time in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
@@ -1,6 +1,10 @@
 PRAGMA foreign_keys = ON;
+-- Schema version; keep in step with the last entry in backend/src/migrations.py
+PRAGMA user_version = 7;
 
 -- ===== Drop (for dev resets) =====
+DROP TABLE IF EXISTS daily_car_stats;
+DROP TABLE IF EXISTS payment_queue;
 DROP TABLE IF EXISTS payments;
 DROP TABLE IF EXISTS reservations;
 DROP TABLE IF EXISTS car_features;
@@ -34,7 +38,8 @@ CREATE TABLE cars (
   color            TEXT,
   daily_rate_cents INTEGER NOT NULL,
   status           TEXT NOT NULL DEFAULT 'available', -- available | maintenance | retired
-  image_url        TEXT  -- NEW: Store image path
+  image_url        TEXT, -- NEW: Store image path
+  feature_mask     INTEGER NOT NULL DEFAULT 0 -- bit (feature_id - 1) set per car_features row (ids 1..63)
 );
 
 CREATE TABLE features (
@@ -58,6 +63,8 @@ CREATE TABLE reservations (
   car_id           INTEGER NOT NULL,
   start_datetime   DATETIME NOT NULL,
   end_datetime     DATETIME NOT NULL,
+  start_epoch      INTEGER, -- start_datetime as UTC unix seconds (filled by trigger if omitted)
+  end_epoch        INTEGER, -- end_datetime as UTC unix seconds
   status           TEXT NOT NULL DEFAULT 'pending', -- pending | confirmed | cancelled | completed
   daily_rate_cents INTEGER NOT NULL,
   created_at       DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
@@ -76,14 +83,92 @@ CREATE TABLE payments (
   provider_ref    TEXT,
   status          TEXT NOT NULL DEFAULT 'paid',  -- paid | failed | refunded | pending
   created_at      DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  failure_reason  TEXT,                          -- why a 'failed' payment failed, e.g. 'card_declined'
   FOREIGN KEY (reservation_id) REFERENCES reservations(id) ON DELETE CASCADE
 );
 
+-- Pending payments waiting for the payment processor (backend/src/payments.py),
+-- deleted once settled. Card details are never stored: the processor that
+-- accepted the payment holds them in memory under `submission`
+CREATE TABLE payment_queue (
+  payment_id      INTEGER PRIMARY KEY,
+  submission      TEXT NOT NULL,                 -- random id of this attempt to pay
+  owner           TEXT NOT NULL,                 -- id of the processor holding the card details
+  attempts        INTEGER NOT NULL DEFAULT 0,
+  available_at    INTEGER NOT NULL,              -- epoch seconds; next try, or end of a worker's lease
+  last_error      TEXT,
+  FOREIGN KEY (payment_id) REFERENCES payments(id) ON DELETE CASCADE
+);
+
+-- Daily per-car occupancy/revenue rollup, maintained by the API's write path
+-- (rebuild with `python backend/src/rollups.py rebuild`)
+CREATE TABLE daily_car_stats (
+  day             TEXT NOT NULL,                -- UTC day, YYYY-MM-DD
+  car_id          INTEGER NOT NULL,
+  booked_seconds  INTEGER NOT NULL DEFAULT 0,   -- seconds of the day covered by bookings
+  revenue_cents   INTEGER NOT NULL DEFAULT 0,   -- daily rate pro rata to booked_seconds
+  paid_cents      INTEGER NOT NULL DEFAULT 0,   -- 'paid' payments made that day
+  PRIMARY KEY (day, car_id)
+) WITHOUT ROWID;
+
 -- ===== Indexes =====
 CREATE INDEX idx_users_email ON users(email);
 CREATE INDEX idx_cars_status ON cars(status);
-CREATE INDEX idx_reservations_car_time ON reservations(car_id, start_datetime, end_datetime);
-CREATE INDEX idx_reservations_user ON reservations(user_id);
+-- Catalog filters and keyset sort orders (GET /api/cars)
+CREATE INDEX idx_cars_status_rate ON cars(status, daily_rate_cents);
+CREATE INDEX idx_cars_status_year ON cars(status, year);
+CREATE INDEX idx_cars_make_model_year ON cars(make COLLATE NOCASE, model COLLATE NOCASE, year);
+CREATE INDEX idx_cars_rate ON cars(daily_rate_cents);
+-- Covers the overlap test `start_epoch < :end AND end_epoch > :start` for active bookings
+CREATE INDEX idx_reservations_active_car_epoch ON reservations(car_id, start_epoch, end_epoch)
+  WHERE status IN ('confirmed', 'pending');
+CREATE INDEX idx_payment_queue_due ON payment_queue(owner, available_at);
+-- A user's history in start order, with the columns of the upcoming/past split (My Rentals)
+CREATE INDEX idx_reservations_user_start ON reservations(user_id, start_epoch, id, end_epoch, status);
+
+-- ===== Triggers =====
+-- Keep the epoch columns in step when rows are written with only the ISO strings
+CREATE TRIGGER trg_reservations_epoch_insert AFTER INSERT ON reservations
+WHEN NEW.start_epoch IS NULL OR NEW.end_epoch IS NULL
+BEGIN
+  UPDATE reservations
+  SET start_epoch = CAST(strftime('%s', NEW.start_datetime) AS INTEGER),
+      end_epoch   = CAST(strftime('%s', NEW.end_datetime) AS INTEGER)
+  WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER trg_reservations_epoch_update AFTER UPDATE OF start_datetime, end_datetime ON reservations
+WHEN NEW.start_epoch IS OLD.start_epoch AND NEW.end_epoch IS OLD.end_epoch
+BEGIN
+  UPDATE reservations
+  SET start_epoch = CAST(strftime('%s', NEW.start_datetime) AS INTEGER),
+      end_epoch   = CAST(strftime('%s', NEW.end_datetime) AS INTEGER)
+  WHERE id = NEW.id;
+END;
+
+-- Keep cars.feature_mask equal to the OR of its car_features bits
+CREATE TRIGGER trg_car_features_mask_insert AFTER INSERT ON car_features
+WHEN NEW.feature_id BETWEEN 1 AND 63
+BEGIN
+  UPDATE cars SET feature_mask = feature_mask | (1 << (NEW.feature_id - 1)) WHERE id = NEW.car_id;
+END;
+
+CREATE TRIGGER trg_car_features_mask_delete AFTER DELETE ON car_features
+WHEN OLD.feature_id BETWEEN 1 AND 63
+BEGIN
+  UPDATE cars SET feature_mask = feature_mask & ~(1 << (OLD.feature_id - 1)) WHERE id = OLD.car_id;
+END;
+
+CREATE TRIGGER trg_car_features_mask_update AFTER UPDATE ON car_features
+BEGIN
+  UPDATE cars
+  SET feature_mask = (
+    SELECT COALESCE(SUM(1 << (feature_id - 1)), 0)
+    FROM car_features
+    WHERE car_id = cars.id AND feature_id BETWEEN 1 AND 63
+  )
+  WHERE id IN (OLD.car_id, NEW.car_id);
+END;
 
 -- ===== Seed Features =====
 INSERT INTO features (key, name) VALUES
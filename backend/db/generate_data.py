@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Bulk data generator for the Car Rental database
+
+Builds a database from database.sql and fills it with synthetic but
+realistic data: cars modelled on the seeded fleet (same makes, images and
+price bands), users, reservations laid out back to back per car so active
+bookings never overlap, and payments for the paid ones. The same --seed
+always produces the same rows.
+
+The load runs as one transaction per table with executemany, journaling and
+fsync turned off, and the secondary indexes and triggers dropped; they are
+recreated (and ANALYZEd) once the rows are in. The daily_car_stats rollup
+is computed alongside the reservations instead of by rollups.rebuild(),
+which would take longer than the load itself at this size.
+
+Usage:
+    python generate_data.py --cars 1000 --users 10000 --reservations 1000000 [--seed 42] [--db path] [--force]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+DB_DIR = Path(__file__).parent
+SCHEMA_PATH = DB_DIR / "database.sql"
+DEFAULT_DB_PATH = Path(os.environ.get("CARRENTAL_DB_PATH", DB_DIR / "carrental.db"))
+sys.path.insert(0, str(DB_DIR.parent / "src"))
+
+from rollups import day_label  # noqa: E402
+
+HOUR = 3600
+DAY = 86400
+BATCH_SIZE = 50_000
+
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'David',
+               'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah',
+               'Carlos', 'Maria', 'Wei', 'Aisha', 'Hiroshi', 'Priya', 'Olga', 'Ahmed', 'Sofia', 'Liam']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+              'Martinez', 'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson',
+              'Chen', 'Kim', 'Patel', 'Nguyen', 'Khan', 'Ivanova', 'Tanaka', 'Silva', 'Murphy', 'Cohen']
+COLORS = ['White', 'Black', 'Silver', 'Gray', 'Blue', 'Red', 'Green', 'Beige']
+PROVIDERS = ['stripe', 'paypal', 'test']
+BOOKING_HOURS = (4, 8, 24, 24, 48, 48, 72, 96, 120, 168, 240)
+
+
+class HourFormatter:
+    """Epoch -> text for whole-hour timestamps, with the date part memoized per day"""
+
+    def __init__(self, separator):
+        self.hours = [f"{separator}{hour:02d}:00:00" for hour in range(24)]
+        self.days = {}
+
+    def __call__(self, epoch):
+        day, seconds = divmod(epoch, DAY)
+        label = self.days.get(day)
+        if label is None:
+            label = self.days[day] = day_label(day * DAY)
+        return label + self.hours[seconds // HOUR]
+
+
+def parse_day(value):
+    return int(datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+
+def create_schema(path, force):
+    if path.exists():
+        if not force:
+            sys.exit(f"❌ {path} already exists; pass --force to replace it")
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            Path(str(path) + suffix).unlink(missing_ok=True)
+    conn = sqlite3.connect(str(path), isolation_level=None)
+    with open(SCHEMA_PATH, 'r') as f:
+        conn.executescript(f.read())
+    return conn
+
+
+def drop_indexes_and_triggers(conn):
+    """Drop secondary indexes and triggers; returns their SQL for recreate()"""
+    objects = conn.execute("""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+    """).fetchall()
+    for kind, name, _ in objects:
+        conn.execute(f"DROP {kind.upper()} {name}")
+    return [sql for _, _, sql in objects]
+
+
+def generate_cars(conn, rng, count):
+    """Cars modelled on the seeded fleet; returns [(car_id, daily_rate_cents)]"""
+    templates = conn.execute("""
+        SELECT make, model, year, transmission, seats, doors, daily_rate_cents, image_url FROM cars ORDER BY id
+    """).fetchall()
+    feature_ids = [row[0] for row in conn.execute("SELECT id FROM features ORDER BY id")]
+    conn.execute("DELETE FROM car_features")
+    conn.execute("DELETE FROM cars")
+
+    cars, car_rows, feature_rows = [], [], []
+    for car_id in range(1, count + 1):
+        make, model, year, transmission, seats, doors, rate, image_url = templates[(car_id - 1) % len(templates)]
+        rate = max(1999, int(rate * rng.uniform(0.85, 1.2)) // 100 * 100 + 99)
+        features = rng.sample(feature_ids, rng.randint(3, min(8, len(feature_ids))))
+        mask = sum(1 << (feature_id - 1) for feature_id in features if 1 <= feature_id <= 63)
+        status = rng.choices(['available', 'maintenance', 'retired'], [95, 4, 1])[0]
+        car_rows.append((car_id, f"GEN{car_id:014d}", make, model, min(2025, year + rng.randint(-2, 2)),
+                         transmission, seats, doors, rng.choice(COLORS), rate, status, image_url, mask))
+        feature_rows.extend((car_id, feature_id) for feature_id in features)
+        cars.append((car_id, rate))
+
+    conn.executemany("""
+        INSERT INTO cars (id, vin, make, model, year, transmission, seats, doors, color,
+                          daily_rate_cents, status, image_url, feature_mask)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, car_rows)
+    conn.executemany("INSERT INTO car_features (car_id, feature_id) VALUES (?, ?)", feature_rows)
+    return cars
+
+
+def generate_users(conn, rng, count):
+    """One admin plus customers; returns the customer ids"""
+    conn.execute("DELETE FROM users")
+
+    def rows():
+        yield (1, "Admin User", "admin@carrental.com", "555-000-0000", "hashed_admin_password", "admin")
+        for user_id in range(2, count + 1):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            yield (user_id, f"{first} {last}", f"{first.lower()}.{last.lower()}.{user_id}@example.com",
+                   f"555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}", f"hashed_password_{user_id}",
+                   "customer")
+
+    conn.executemany("""
+        INSERT INTO users (id, full_name, email, phone, password_hash, role) VALUES (?, ?, ?, ?, ?, ?)
+    """, rows())
+    return range(2, max(count, 2) + 1) if count > 1 else range(1, 2)
+
+
+def generate_bookings(rng, cars, customer_ids, count, start, now, payments, rollup):
+    """Yield reservation rows, laid out back to back per car.
+
+    Each car's bookings start at `start` and follow each other with gaps of
+    a few hours to a few days; status follows from where a booking lies
+    relative to `now` (past ones are completed, current/future ones
+    confirmed or pending, ~8% cancelled anywhere). Payment rows and the
+    car's daily rollup rows (day number, car_id, booked_seconds,
+    revenue_cents, paid_cents; computed the way rollups.rebuild() does) are
+    appended to `payments` and `rollup` as each car is finished.
+    """
+    canonical = HourFormatter("T")
+    sqlite_ts = HourFormatter(" ")
+    rand = rng.random  # int(rand() * n) rather than randrange(n): this loop runs once per row
+    per_car, extra = divmod(count, len(cars)) if cars else (0, 0)
+    reservation_id = payment_id = 0
+    user_count = len(customer_ids)
+    first_user = customer_ids[0]
+
+    for index, (car_id, rate) in enumerate(cars):
+        days = {}  # UTC day number -> [booked_seconds, revenue_cents, paid_cents]
+        moment = start + int(rand() * 73) * HOUR
+        for _ in range(per_car + (1 if index < extra else 0)):
+            begin = moment
+            end = begin + BOOKING_HOURS[int(rand() * len(BOOKING_HOURS))] * HOUR
+            moment = end + (2 + int(rand() * 95)) * HOUR
+            created = begin - (1 + int(rand() * 720)) * HOUR
+
+            if rand() < 0.08:
+                status = 'cancelled'
+            elif end <= now:
+                status = 'completed'
+            else:
+                status = 'pending' if rand() < 0.15 else 'confirmed'
+
+            reservation_id += 1
+            yield (reservation_id, first_user + int(rand() * user_count), car_id,
+                   canonical(begin), canonical(end), begin, end, status, rate, sqlite_ts(created))
+
+            if status != 'cancelled':
+                day = begin // DAY
+                while day * DAY < end:
+                    seconds = min(end, (day + 1) * DAY) - max(begin, day * DAY)
+                    totals = days.get(day)
+                    if totals is None:
+                        totals = days[day] = [0, 0, 0]
+                    totals[0] += seconds
+                    totals[1] += rate * seconds // DAY
+                    day += 1
+
+            if status != 'pending' and (status != 'cancelled' or rand() < 0.3):
+                payment_id += 1
+                amount = rate * -(-(end - begin) // DAY)
+                payment_status = 'refunded' if status == 'cancelled' else ('paid' if rand() < 0.97 else 'failed')
+                provider = PROVIDERS[int(rand() * len(PROVIDERS))]
+                paid_at = created + HOUR
+                payments.append((payment_id, reservation_id, amount, 'USD', provider,
+                                 f"{provider}_{reservation_id:010d}", payment_status, sqlite_ts(paid_at)))
+                if payment_status == 'paid':
+                    totals = days.get(paid_at // DAY)
+                    if totals is None:
+                        totals = days[paid_at // DAY] = [0, 0, 0]
+                    totals[2] += amount
+
+        rollup.extend((day, car_id, booked, revenue, paid) for day, (booked, revenue, paid) in days.items())
+
+
+def insert_batches(conn, sql, rows, flush=None):
+    """executemany() in BATCH_SIZE chunks, calling flush() after each one"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(sql, batch)
+            batch.clear()
+            if flush is not None:
+                flush()
+    if batch:
+        conn.executemany(sql, batch)
+    if flush is not None:
+        flush()
+
+
+def generate(db_path, cars=1000, users=10_000, reservations=1_000_000, seed=42, start="2024-01-01",
+             now=None, force=False, verbose=True):
+    """Build a complete database at `db_path`; returns row counts per table"""
+    def log(message):
+        if verbose:
+            print(message, flush=True)
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    conn = create_schema(Path(db_path), force)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -262144")
+    recreate = drop_indexes_and_triggers(conn)
+
+    conn.execute("BEGIN")
+    car_rows = generate_cars(conn, rng, cars)
+    customer_ids = generate_users(conn, rng, users)
+    conn.execute("COMMIT")
+    log(f"✅ {cars} cars, {users} users ({time.perf_counter() - started:.1f}s)")
+
+    now_epoch = int(now.timestamp()) if now else int(time.time())
+    payments, rollup, totals = [], [], {'payments': 0}
+
+    def flush():
+        conn.executemany("""
+            INSERT INTO payments (id, reservation_id, amount_cents, currency, provider, provider_ref, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, payments)
+        conn.executemany("""
+            INSERT INTO temp.rollup (day, car_id, booked_seconds, revenue_cents, paid_cents) VALUES (?, ?, ?, ?, ?)
+        """, rollup)
+        totals['payments'] += len(payments)
+        payments.clear()
+        rollup.clear()
+
+    # Rollup rows come out per car; staging them in a rowid table and copying
+    # them over sorted keeps daily_car_stats (keyed by day first) from being
+    # built with random-order b-tree inserts.
+    conn.execute("""
+        CREATE TEMP TABLE rollup (day INTEGER, car_id INTEGER, booked_seconds INTEGER,
+                                  revenue_cents INTEGER, paid_cents INTEGER)
+    """)
+    conn.execute("BEGIN")
+    if car_rows and reservations:
+        bookings = generate_bookings(rng, car_rows, customer_ids, reservations, parse_day(start), now_epoch,
+                                     payments, rollup)
+        insert_batches(conn, """
+            INSERT INTO reservations (id, user_id, car_id, start_datetime, end_datetime, start_epoch, end_epoch,
+                                      status, daily_rate_cents, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, bookings, flush)
+        conn.execute(f"""
+            INSERT INTO daily_car_stats (day, car_id, booked_seconds, revenue_cents, paid_cents)
+            SELECT date(day * {DAY}, 'unixepoch'), car_id, booked_seconds, revenue_cents, paid_cents
+            FROM temp.rollup
+            ORDER BY day, car_id
+        """)
+    conn.execute("COMMIT")
+    conn.execute("DROP TABLE temp.rollup")
+    log(f"✅ {reservations} reservations, {totals['payments']} payments, daily_car_stats "
+        f"({time.perf_counter() - started:.1f}s)")
+
+    conn.execute("BEGIN")
+    for sql in recreate:
+        conn.execute(sql)
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    log(f"✅ Indexes and triggers rebuilt ({time.perf_counter() - started:.1f}s)")
+
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ('users', 'cars', 'car_features', 'reservations', 'payments', 'daily_car_stats')}
+    conn.execute("PRAGMA locking_mode = NORMAL")
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a large synthetic Car Rental database")
+    parser.add_argument("--cars", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--reservations", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start", default="2024-01-01", help="day the first bookings start (YYYY-MM-DD)")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH)
+    parser.add_argument("--force", action="store_true", help="replace an existing database file")
+    args = parser.parse_args(argv)
+    if args.cars < 1 or args.users < 1 or args.reservations < 0:
+        parser.error("--cars and --users must be at least 1, --reservations at least 0")
+
+    print(f"🚗 Generating {args.db} (seed {args.seed})")
+    started = time.perf_counter()
+    counts = generate(args.db, args.cars, args.users, args.reservations, args.seed, args.start, force=args.force)
+    print(f"\n🎉 Done in {time.perf_counter() - started:.1f}s")
+    for table, count in counts.items():
+        print(f"   • {table}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,41 @@
 # FastAPI equivalent of the Express.js server
 # Provides the same functionality as app.js but using Python and FastAPI
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles  # ADD THIS LINE
-from pydantic import BaseModel
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, Field, field_validator, model_validator
 import sqlite3
 import os
+import json
+import asyncio
+import base64
+import time
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+
+from availability import AvailabilityIndex
+from datetimes import CANONICAL_FORMAT, epoch_of, normalize_datetime, sqlite_timestamp
+from db import Database, LoopLagMonitor
+from exports import EXPORT_FORMATS, EXPORT_QUERIES, build_export_query, stream_export
+from fastjson import (FastJSONResponse, column_names, dumps, encoder_for, json_bytes_response,
+                      query_json, rows_to_dicts, tuple_cursor)
+from feature_bits import FeatureBits, UnknownFeature
+from heatmap import ENCODINGS, MAX_DAYS, fleet_heatmap
+from images import UPLOADS_DIR, ImageManifest, UnsafeImagePath, check_image_urls
+from metrics import (CONTENT_TYPE as METRICS_CONTENT_TYPE, METRICS_ENABLED, MetricsMiddleware, registry as metrics,
+                     slow_queries)
+from migrations import apply_migrations
+from occupancy import MAX_SLOTS, SLOT_SECONDS, OccupancyCache, encode_bitmap, occupancy_bitmap
+from passwords import HasherBusy, PasswordHasher
+from payments import PENDING, PaymentProcessor, enqueue_payment, load_provider, payment_status
+from rentals import RENTAL_SCOPES, RENTALS_MAX_PAGE_SIZE, RentalsCache, build_rentals_query
+from rollups import SECONDS_PER_DAY, car_totals, daily_totals, rollup_booking, rollup_reservation
+from sessions import REQUIRE_AUTH, InvalidToken, Principal, PrincipalCache, SessionTokens
+from static import CachedStaticFiles
+from writer import SingleWriter, after_commit
 
 # Create FastAPI app instance
 app = FastAPI(title="Car Rental Service API", version="1.0.0")
@@ -20,19 +47,62 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# ADD THIS LINE - Serve static files (images) from uploads directory
-app.mount("/uploads", StaticFiles(directory=str(Path(__file__).parent.parent / "uploads")), name="uploads")
+# Per-route request counts, latency and SQL statement timings for GET /metrics
+# (CARRENTAL_METRICS=0 leaves the middleware out altogether)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Serve static files (images) from uploads directory, with ETag/Cache-Control/Range support
+app.mount("/uploads", CachedStaticFiles(directory=str(UPLOADS_DIR)), name="uploads")
 
 # Database path - same location as the Node.js version
-DB_PATH = Path(__file__).parent.parent / "db" / "carrental.db"
+# (CARRENTAL_DB_PATH lets benchmarks and scratch setups point at another file)
+DB_PATH = Path(os.environ.get("CARRENTAL_DB_PATH", Path(__file__).parent.parent / "db" / "carrental.db"))
 
-def get_db_connection():
-    """Get a database connection"""
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row  # This allows accessing columns by name
-    return conn
+# Long-lived, pre-configured connections shared by all request handlers.
+# Handlers call `await database.run(func, ...)` so sqlite3 work happens on a
+# bounded pool of DB threads instead of blocking the event loop.
+database = Database(DB_PATH)
+
+# Every write goes through one writer thread and connection: handlers
+# `await writer.submit(func, ...)`, and queued writes are committed in groups
+writer = SingleWriter(DB_PATH)
+
+# Active reservation intervals per car, loaded at startup and kept in step
+# with every reservation write (the database remains the source of truth)
+availability = AvailabilityIndex()
+
+# Recently served availability bitmaps; entries go stale as soon as the
+# car's intervals in `availability` change
+occupancy_cache = OccupancyCache()
+
+# Cached feature key -> bit mapping for cars.feature_mask filtering
+feature_bits = FeatureBits()
+
+# Resized image URLs per source image (built by `python src/images.py build`)
+image_manifest = ImageManifest()
+
+# scrypt hashing/verification for login and sign-up, on worker processes
+password_hasher = PasswordHasher()
+
+# Signed bearer tokens issued by /api/login, and the accounts behind them
+# (checking a token needs no query; the account comes from the cache)
+session_tokens = SessionTokens()
+principal_cache = PrincipalCache()
+bearer_token = HTTPBearer(auto_error=False)
+
+# First pages of users' My Rentals histories, dropped on their reservation writes
+rentals_cache = RentalsCache()
+
+# Settles queued payments with the payment provider in the background
+# (CARRENTAL_PAYMENT_PROVIDER; the default is a local simulated processor)
+payment_processor = PaymentProcessor(writer, load_provider())
+
+# Optional event-loop lag logging (enable with CARRENTAL_LOOP_LAG_MS=<threshold>)
+loop_lag_monitor = LoopLagMonitor()
 
 def ensure_database_exists():
     """Ensure the database exists and has proper schema"""
@@ -46,9 +116,33 @@ def ensure_database_exists():
             conn.close()
             print("[DB] Schema loaded from database.sql")
 
+    # Bring databases created from an older schema up to date
+    conn = sqlite3.connect(str(DB_PATH))
+    apply_migrations(conn)
+    conn.close()
+
 # Initialize database on startup
 ensure_database_exists()
 
+@app.on_event("startup")
+async def start_background_tasks():
+    loop_lag_monitor.start()
+    writer.start()
+    payment_processor.start()
+    await password_hasher.start()
+    session_tokens.warn_if_ephemeral()
+    await database.run(availability.load)
+    await database.run(feature_bits.load)
+    image_manifest.load()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await loop_lag_monitor.stop()
+    await payment_processor.stop()
+    writer.stop()
+    password_hasher.close()
+    database.close()
+
 # Pydantic models for request/response validation
 class UserCreate(BaseModel):
     full_name: str
@@ -60,18 +154,57 @@ class UserResponse(BaseModel):
     full_name: str
     email: str
 
-class ReservationCreate(BaseModel):
-    user_id: int
-    car_id: int
+class ReservationPeriod(BaseModel):
+    """Start/end datetimes, normalized once here to canonical UTC ISO strings"""
     start_datetime: str
     end_datetime: str
 
+    @field_validator('start_datetime', 'end_datetime')
+    @classmethod
+    def normalize(cls, value: str) -> str:
+        try:
+            return normalize_datetime(value)
+        except ValueError:
+            raise ValueError("must be an ISO-8601 date or datetime")
+
+    @model_validator(mode='after')
+    def check_order(self):
+        if self.end_datetime <= self.start_datetime:
+            raise ValueError("end_datetime must be after start_datetime")
+        return self
+
+    @property
+    def start_epoch(self) -> int:
+        return epoch_of(self.start_datetime)
+
+    @property
+    def end_epoch(self) -> int:
+        return epoch_of(self.end_datetime)
+
+class ReservationCreate(ReservationPeriod):
+    user_id: int
+    car_id: int
+
 class ReservationResponse(BaseModel):
     id: int
 
-class ReservationUpdate(BaseModel):
-    start_datetime: str
-    end_datetime: str
+class ReservationUpdate(ReservationPeriod):
+    pass
+
+class ReservationBatchItem(ReservationPeriod):
+    car_id: int
+
+class ReservationBatchCreate(BaseModel):
+    user_id: int
+    items: List[ReservationBatchItem] = Field(..., min_length=1, max_length=100)
+
+class ReservationBatchResponse(BaseModel):
+    ids: List[int]
+
+class LoginResponse(UserResponse):
+    token: str
+    token_type: str = "bearer"
+    expires_at: str
 
 class UserLogin(BaseModel):
     email: str
@@ -95,364 +228,1195 @@ class PaymentResponse(BaseModel):
 async def root():
     return {"message": "Car Rental Service API is running"}
 
-# GET /api/cars - Retrieve all cars from the database
+# Columns returned for a car (feature_mask is internal and not part of the API)
+CAR_COLUMNS = ("id, vin, make, model, year, transmission, seats, doors, color, "
+               "daily_rate_cents, status, image_url")
+
+def split_csv(value: Optional[str]) -> List[str]:
+    """Turn a comma-separated query parameter into a list of non-empty items"""
+    if not value:
+        return []
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+async def resolve_feature_mask(keys: List[str]) -> int:
+    """Bitmask for the requested feature keys (400 for unknown keys)"""
+    if not keys:
+        return 0
+    if not feature_bits.knows(keys):
+        # Pick up features added since the mapping was cached
+        await database.run(feature_bits.load)
+    try:
+        return feature_bits.mask_for(keys)
+    except UnknownFeature as e:
+        raise HTTPException(status_code=400, detail=f"Unknown feature: {e.args[0]}")
+
+def attach_features(conn, cars: List[Dict[str, Any]], car_ids=None) -> List[Dict[str, Any]]:
+    """Fill in each car's sorted feature names with a single query.
+
+    Pass `car_ids` to restrict the lookup to a subset of the fleet; by
+    default the feature links of every car are read in one pass.
+    """
+    features_by_car: Dict[int, List[str]] = {}
+    sql = """
+        SELECT cf.car_id, f.name
+        FROM car_features cf
+        JOIN features f ON f.id = cf.feature_id
+    """
+    params = ()
+    if car_ids is not None:
+        sql += " WHERE cf.car_id IN (SELECT value FROM json_each(?))"
+        params = (json.dumps(list(car_ids)),)
+    sql += " ORDER BY cf.car_id, f.name"
+    for car_id, name in conn.execute(sql, params):
+        features_by_car.setdefault(car_id, []).append(name)
+
+    for car in cars:
+        car['features'] = features_by_car.get(car['id'], [])
+    return cars
+
+def attach_images(cars: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Add each car's resized image URLs from the derivative manifest (None if not built)"""
+    for car in cars:
+        car['images'] = image_manifest.derivatives(car['image_url'])
+    return cars
+
+# Keyset pagination for the catalog: sortable columns and page size limits
+CATALOG_SORT_COLUMNS = ('id', 'daily_rate_cents', 'year')
+CATALOG_MAX_PAGE_SIZE = 500
+CATALOG_STREAM_BATCH = 500
+
+def encode_cursor(sort_value, row_id: int) -> str:
+    return base64.urlsafe_b64encode(dumps([sort_value, row_id])).decode().rstrip('=')
+
+def decode_cursor(cursor: str):
+    """(sort_value, id) of a cursor; every sortable column is an integer, so both must be"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if type(sort_value) is not int or type(row_id) is not int:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return sort_value, row_id
+
+def build_catalog_query(filters: Dict[str, Any], sort: str, after=None):
+    """SQL + params for a filtered, keyset-ordered slice of the cars table.
+
+    Filters map onto the composite indexes on cars (status/daily_rate_cents,
+    status/year, make/model/year). `after` is a decoded (sort_value, id)
+    cursor; rows strictly after it are returned.
+    """
+    clauses = []
+    params: List[Any] = []
+    if filters.get('status'):
+        clauses.append("status = ?")
+        params.append(filters['status'])
+    if filters.get('make'):
+        clauses.append("make = ? COLLATE NOCASE")
+        params.append(filters['make'])
+    if filters.get('model'):
+        clauses.append("model = ? COLLATE NOCASE")
+        params.append(filters['model'])
+    if filters.get('year_min') is not None:
+        clauses.append("year >= ?")
+        params.append(filters['year_min'])
+    if filters.get('year_max') is not None:
+        clauses.append("year <= ?")
+        params.append(filters['year_max'])
+    if filters.get('seats'):
+        clauses.append("seats >= ?")
+        params.append(filters['seats'])
+    if filters.get('transmission'):
+        clauses.append("transmission = ? COLLATE NOCASE")
+        params.append(filters['transmission'])
+    if filters.get('min_rate_cents') is not None:
+        clauses.append("daily_rate_cents >= ?")
+        params.append(filters['min_rate_cents'])
+    if filters.get('max_rate_cents') is not None:
+        clauses.append("daily_rate_cents <= ?")
+        params.append(filters['max_rate_cents'])
+    if filters.get('feature_mask'):
+        clauses.append("(feature_mask & ?) = ?")
+        params += [filters['feature_mask'], filters['feature_mask']]
+    if after is not None:
+        if sort == 'id':
+            clauses.append("id > ?")
+            params.append(after[1])
+        else:
+            clauses.append(f"({sort}, id) > (?, ?)")
+            params += [after[0], after[1]]
+
+    sql = f"SELECT {CAR_COLUMNS} FROM cars"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY id" if sort == 'id' else f" ORDER BY {sort}, id"
+    return sql, params
+
+def fetch_catalog_batch(conn, filters: Dict[str, Any], sort: str, limit: int, after=None):
+    """Up to `limit` cars after the `after` key, plus the (sort_value, id) key
+    of the next batch (None on the last one)"""
+    sql, params = build_catalog_query(filters, sort, after)
+    cursor = tuple_cursor(conn)
+    cursor.execute(sql + " LIMIT ?", params + [limit + 1])
+    cars = rows_to_dicts(column_names(cursor), cursor.fetchall())
+    next_after = None
+    if len(cars) > limit:
+        cars.pop()
+        next_after = (cars[-1][sort], cars[-1]['id'])
+    attach_images(attach_features(conn, cars, [car['id'] for car in cars]))
+    return cars, next_after
+
+def fetch_catalog_page(conn, filters: Dict[str, Any], sort: str, limit: int, after=None):
+    """One page of cars plus the cursor of the next page (None on the last page)"""
+    cars, next_after = fetch_catalog_batch(conn, filters, sort, limit, after)
+    return cars, encode_cursor(*next_after) if next_after else None
+
+async def stream_catalog(filters: Dict[str, Any], sort: str, after=None):
+    """Yield the catalog as a JSON array, one keyset batch per DB call.
+
+    Each batch is read on a DB thread and its connection goes back to the
+    pool before the batch is sent, so a slow client never holds a connection
+    (or an open statement) while the response is written.
+    """
+    separator = b''
+    yield b'['
+    while True:
+        cars, after = await database.run(fetch_catalog_batch, filters, sort, CATALOG_STREAM_BATCH, after)
+        if cars:
+            yield separator + dumps(cars)[1:-1]  # the batch's objects without the enclosing []
+            separator = b','
+        if after is None:
+            break
+    yield b']'
+
+# GET /api/cars - Retrieve cars from the database, optionally filtered and paginated
 @app.get("/api/cars")
-async def get_cars() -> List[Dict[str, Any]]:
-    """Get all cars from the cars table with their features"""
+async def get_cars(
+    make: Optional[str] = None,
+    model: Optional[str] = None,
+    year_min: Optional[int] = None,
+    year_max: Optional[int] = None,
+    seats: Optional[int] = Query(None, description="Minimum number of seats"),
+    transmission: Optional[str] = None,
+    min_rate_cents: Optional[int] = None,
+    max_rate_cents: Optional[int] = None,
+    status: Optional[str] = None,
+    features: Optional[str] = Query(None, description="Comma-separated feature keys the car must all have"),
+    sort: str = Query('id', description="One of: id, daily_rate_cents, year"),
+    limit: Optional[int] = Query(None, ge=1, le=CATALOG_MAX_PAGE_SIZE, description="Page size; omit for all cars"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+):
+    """Get cars with their features.
+
+    Without `limit` the whole (filtered) catalog is streamed as before. With
+    `limit`, one page is returned and the `X-Next-Cursor` response header
+    holds the cursor for the next page (absent on the last page).
+    """
+    if sort not in CATALOG_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(CATALOG_SORT_COLUMNS)}")
+    filters = {
+        'make': make, 'model': model, 'year_min': year_min, 'year_max': year_max,
+        'seats': seats, 'transmission': transmission, 'min_rate_cents': min_rate_cents,
+        'max_rate_cents': max_rate_cents, 'status': status,
+        'feature_mask': await resolve_feature_mask(split_csv(features)),
+    }
+    after = decode_cursor(cursor) if cursor else None
+
+    if limit is None:
+        return StreamingResponse(stream_catalog(filters, sort, after), media_type="application/json")
+
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM cars")
-        cars = [dict(row) for row in cursor.fetchall()]
-        
-        # Get features for each car
-        for car in cars:
-            cursor.execute("""
-                SELECT f.name
-                FROM features f
-                JOIN car_features cf ON f.id = cf.feature_id
-                WHERE cf.car_id = ?
-                ORDER BY f.name
-            """, (car['id'],))
-            features = [row['name'] for row in cursor.fetchall()]
-            car['features'] = features
-        
-        conn.close()
-        return cars
+        cars, next_cursor = await database.run(fetch_catalog_page, filters, sort, limit, after)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return FastJSONResponse(cars, headers=headers)
+
+def fetch_available_cars(conn, start: int, end: int, make: Optional[str] = None,
+                         seats: Optional[int] = None, transmission: Optional[str] = None,
+                         feature_mask: int = 0) -> List[Dict[str, Any]]:
+    """Cars that are in service and have no active reservation overlapping [start, end).
+
+    `start`/`end` are UTC epoch seconds and `feature_mask` holds the bits of
+    features every returned car must have. Availability is a single
+    anti-join against reservations, so the cost doesn't depend on issuing
+    one bookings lookup per car.
+    """
+    sql = f"""
+        SELECT {CAR_COLUMNS}
+        FROM cars c
+        WHERE c.status = 'available'
+        AND NOT EXISTS (
+            SELECT 1 FROM reservations r
+            WHERE r.car_id = c.id
+            AND r.status IN ('confirmed', 'pending')
+            AND r.start_epoch < ? AND r.end_epoch > ?
+        )
+    """
+    params: List[Any] = [end, start]
+    if make:
+        sql += " AND c.make = ? COLLATE NOCASE"
+        params.append(make)
+    if seats:
+        sql += " AND c.seats >= ?"
+        params.append(seats)
+    if transmission:
+        sql += " AND c.transmission = ? COLLATE NOCASE"
+        params.append(transmission)
+    if feature_mask:
+        sql += " AND (c.feature_mask & ?) = ?"
+        params += [feature_mask, feature_mask]
+    sql += " ORDER BY c.id"
+
+    cursor = tuple_cursor(conn)
+    cursor.execute(sql, params)
+    cars = rows_to_dicts(column_names(cursor), cursor.fetchall())
+    return attach_images(attach_features(conn, cars, [car['id'] for car in cars]))
+
+# GET /api/cars/available - Cars free for the whole requested period
+@app.get("/api/cars/available", response_model=List[Dict[str, Any]])
+async def get_available_cars(
+    start: str,
+    end: str,
+    make: Optional[str] = None,
+    seats: Optional[int] = Query(None, description="Minimum number of seats"),
+    transmission: Optional[str] = None,
+    features: Optional[str] = Query(None, description="Comma-separated feature keys the car must all have"),
+) -> Response:
+    """Search the whole fleet for cars with no confirmed/pending booking between start and end"""
+    try:
+        start_epoch, end_epoch = epoch_of(start), epoch_of(end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO-8601 dates or datetimes")
+    if end_epoch <= start_epoch:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    try:
+        cars = await database.run(
+            fetch_available_cars, start_epoch, end_epoch,
+            make=make, seats=seats, transmission=transmission,
+            feature_mask=await resolve_feature_mask(split_csv(features))
+        )
+        return FastJSONResponse(cars)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+# GET /api/features - Feature catalog with the bit each key occupies in feature masks
+@app.get("/api/features")
+async def get_features():
+    """List features as {key, name, bit}; served from the in-memory cache"""
+    if not feature_bits.loaded:
+        try:
+            await database.run(feature_bits.load)
+        except sqlite3.Error as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return JSONResponse(feature_bits.mapping(), headers={"Cache-Control": "public, max-age=300"})
+
+CAR_BOOKINGS_SQL = """
+    SELECT id, start_datetime, end_datetime, status
+    FROM reservations
+    WHERE car_id = ?
+    AND status IN ('confirmed', 'pending')
+    ORDER BY start_epoch
+"""
+
+def car_bookings_json(conn, car_id: int) -> bytes:
+    return query_json(conn, CAR_BOOKINGS_SQL, (car_id,))
 
 # GET /api/cars/{car_id}/bookings - Get all bookings for a specific car
-@app.get("/api/cars/{car_id}/bookings")
-async def get_car_bookings(car_id: int):
+@app.get("/api/cars/{car_id}/bookings", response_model=List[Dict[str, Any]])
+async def get_car_bookings(car_id: int) -> Response:
     """Get all confirmed and pending reservations for a specific car"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, start_datetime, end_datetime, status
-            FROM reservations
-            WHERE car_id = ?
-            AND status IN ('confirmed', 'pending')
-            ORDER BY start_datetime
-        """, (car_id,))
-        bookings = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return bookings
+        return json_bytes_response(await database.run(car_bookings_json, car_id))
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+CAR_INTERVALS_SQL = """
+    SELECT start_epoch, end_epoch
+    FROM reservations
+    WHERE car_id = ?
+    AND status IN ('confirmed', 'pending')
+    AND start_epoch < ? AND end_epoch > ?
+"""
+
+def car_availability_json(conn, car_id: int, start: int, granularity: str, slots: int) -> Optional[bytes]:
+    """Encoded availability window for a car (None if there is no such car), cached by index version"""
+    if conn.execute("SELECT 1 FROM cars WHERE id = ?", (car_id,)).fetchone() is None:
+        return None
+    slot_seconds = SLOT_SECONDS[granularity]
+    end = start + slots * slot_seconds
+    snapshot = availability.snapshot(car_id, start, end)
+    if snapshot is None:
+        # Index not loaded yet: read the intervals, and don't cache the result
+        version, intervals = None, conn.execute(CAR_INTERVALS_SQL, (car_id, end, start)).fetchall()
+    else:
+        version, intervals = snapshot
+    body = dumps({
+        'car_id': car_id,
+        'from': datetime.fromtimestamp(start, timezone.utc).strftime(CANONICAL_FORMAT),
+        'granularity': granularity,
+        'slot_seconds': slot_seconds,
+        'slots': slots,
+        'bitmap': encode_bitmap(occupancy_bitmap(intervals, start, slot_seconds, slots)),
+    })
+    if version is not None:
+        occupancy_cache.put((car_id, start, granularity, slots), version, body)
+    return body
+
+# GET /api/cars/{car_id}/availability - Booked days (or hours) of a car as a bitmap
+@app.get("/api/cars/{car_id}/availability")
+async def get_car_availability(
+    car_id: int,
+    start: Optional[str] = Query(None, alias="from", description="Window start (ISO-8601, UTC); defaults to today"),
+    days: int = Query(42, ge=1, description="Window length in days"),
+    granularity: str = Query('day', description="day or hour"),
+) -> Response:
+    """Which slots of the window overlap a confirmed or pending reservation.
+
+    `bitmap` is base64 with one bit per slot, most significant bit first
+    (bit i set = slot i is booked). The window start is rounded down to a
+    whole UTC day or hour. The response size depends only on the window,
+    not on how many bookings the car has.
+    """
+    if granularity not in SLOT_SECONDS:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(SLOT_SECONDS)}")
+    slot_seconds = SLOT_SECONDS[granularity]
+    slots = days * (86400 // slot_seconds)
+    if slots > MAX_SLOTS[granularity]:
+        max_days = MAX_SLOTS[granularity] * slot_seconds // 86400
+        raise HTTPException(status_code=400, detail=f"days must be at most {max_days} for {granularity} granularity")
+    try:
+        start_epoch = epoch_of(start) if start else int(datetime.now(timezone.utc).timestamp())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from must be an ISO-8601 date or datetime")
+    start_epoch -= start_epoch % slot_seconds
+
+    body = occupancy_cache.get((car_id, start_epoch, granularity, slots), availability.version(car_id))
+    if body is None:
+        try:
+            body = await database.run(car_availability_json, car_id, start_epoch, granularity, slots)
+        except sqlite3.Error as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        if body is None:
+            raise HTTPException(status_code=404, detail="Car not found")
+    return json_bytes_response(body)
+
+def find_user_by_email(conn, email: str):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, full_name, email, role, password_hash FROM users WHERE email = ?",
+        (email,)
+    )
+    return cursor.fetchone()
+
+def update_password_hash(conn, user_id: int, old_hash: str, new_hash: str):
+    # Only replace the value that was verified, in case the password changed meanwhile
+    conn.execute("UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                 (new_hash, user_id, old_hash))
+    forget_principal(user_id)
+
+def find_principal(conn, user_id: int) -> Optional[Principal]:
+    row = conn.execute("SELECT id, full_name, email, role FROM users WHERE id = ?", (user_id,)).fetchone()
+    return Principal(row['id'], row['full_name'], row['email'], row['role']) if row else None
+
+def forget_principal(user_id: int):
+    """Drop the user's cached account once the write changing their row commits"""
+    after_commit(lambda: principal_cache.invalidate(user_id))
+
+def unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+async def current_principal(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_token),
+) -> Optional[Principal]:
+    """The account of the request's `Authorization: Bearer` token.
+
+    Requests without a token are anonymous (None) unless CARRENTAL_REQUIRE_AUTH
+    is on. The token is checked without the database, and the account is read
+    from principal_cache, so only a cache miss costs a query.
+    """
+    if credentials is None:
+        if REQUIRE_AUTH:
+            raise unauthorized("Not authenticated")
+        return None
+    try:
+        user_id = session_tokens.verify(credentials.credentials)
+    except InvalidToken as e:
+        raise unauthorized(str(e))
+
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        try:
+            principal = await database.run(find_principal, user_id)
+        except sqlite3.Error as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        if principal is None:
+            raise unauthorized("Account no longer exists")
+        principal_cache.put(principal)
+    return principal
+
+def check_user_access(principal: Optional[Principal], user_id: int):
+    """403 unless the request may act for `user_id` (its own account, or an admin's).
+
+    Anonymous requests only get here while CARRENTAL_REQUIRE_AUTH is off,
+    and are let through for the clients that don't send tokens yet.
+    """
+    if principal is not None and principal.id != user_id and not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Not allowed to access another user's data")
+
+async def require_principal(principal: Optional[Principal] = Depends(current_principal)) -> Principal:
+    """The account behind the request, for routes that need a token even with CARRENTAL_REQUIRE_AUTH off"""
+    if principal is None:
+        raise unauthorized("Not authenticated")
+    return principal
+
+async def require_admin(principal: Principal = Depends(require_principal)) -> Principal:
+    """The admin behind the request; admin routes need one whatever CARRENTAL_REQUIRE_AUTH says"""
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return principal
+
+HASHER_BUSY_DETAIL = "Too many sign-ins in progress, please try again in a moment"
+
+def session_response(user_id: int, full_name: str, email: str, role: str) -> LoginResponse:
+    """Sign the account in: cache it for token checks and issue its session token"""
+    principal_cache.put(Principal(user_id, full_name, email, role))
+    token, expires = session_tokens.issue(user_id)
+    return LoginResponse(
+        id=user_id,
+        full_name=full_name,
+        email=email,
+        token=token,
+        expires_at=datetime.fromtimestamp(expires, timezone.utc).strftime(CANONICAL_FORMAT),
+    )
+
 # POST /api/login - Login user by email and password
-@app.post("/api/login", response_model=UserResponse)
+@app.post("/api/login", response_model=LoginResponse)
 async def login_user(credentials: UserLogin):
-    """Login user by checking email and password"""
+    """Login user by checking email and password.
+
+    The password is checked against its scrypt hash on the hashing pool;
+    accounts still holding a plain or outdated value get a fresh hash.
+    The response carries a signed session token for `Authorization: Bearer`.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "SELECT id, full_name, email, password_hash FROM users WHERE email = ?",
-            (credentials.email,)
-        )
-        user = cursor.fetchone()
-        conn.close()
-        
+        user = await database.run(find_user_by_email, credentials.email)
+
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        
-        # Simple password check (in production, use proper password hashing)
-        if user['password_hash'] != credentials.password_hash:
+
+        try:
+            matches, new_hash = await password_hasher.verify(credentials.password_hash, user['password_hash'])
+        except HasherBusy:
+            raise HTTPException(status_code=503, detail=HASHER_BUSY_DETAIL, headers={"Retry-After": "1"})
+        if not matches:
             raise HTTPException(status_code=401, detail="Invalid password")
-        
-        return UserResponse(
-            id=user['id'],
-            full_name=user['full_name'],
-            email=user['email']
-        )
-        
+
+        if new_hash is not None:
+            await writer.submit(update_password_hash, user['id'], user['password_hash'], new_hash)
+
+        return session_response(user['id'], user['full_name'], user['email'], user['role'])
+
     except HTTPException:
         raise
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+def insert_user(conn, user: UserCreate, password_hash: str) -> int:
+    cursor = conn.cursor()
+
+    # Check if user already exists
+    cursor.execute("SELECT id FROM users WHERE email = ?", (user.email,))
+    existing = cursor.fetchone()
+    if existing:
+        raise HTTPException(status_code=400, detail="User with this email already exists")
+
+    cursor.execute(
+        "INSERT INTO users (full_name, email, password_hash) VALUES (?, ?, ?)",
+        (user.full_name, user.email, password_hash)
+    )
+
+    return cursor.lastrowid
+
 # POST /api/users - Insert data into users table
-@app.post("/api/users", response_model=UserResponse)
+@app.post("/api/users", response_model=LoginResponse)
 async def create_user(user: UserCreate):
-    """Create a new user in the users table"""
+    """Create a new user in the users table, storing a scrypt hash of the password.
+
+    The new account is signed in: the response carries a session token as
+    /api/login's does.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if user already exists
-        cursor.execute("SELECT id FROM users WHERE email = ?", (user.email,))
-        existing = cursor.fetchone()
-        if existing:
-            conn.close()
-            raise HTTPException(status_code=400, detail="User with this email already exists")
-        
-        cursor.execute(
-            "INSERT INTO users (full_name, email, password_hash) VALUES (?, ?, ?)",
-            (user.full_name, user.email, user.password_hash)
-        )
-        
-        user_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        return UserResponse(
-            id=user_id,
-            full_name=user.full_name,
-            email=user.email
-        )
-        
+        password_hash = await password_hasher.hash(user.password_hash)
+    except HasherBusy:
+        raise HTTPException(status_code=503, detail=HASHER_BUSY_DETAIL, headers={"Retry-After": "1"})
+    try:
+        user_id = await writer.submit(insert_user, user, password_hash)
+
+        return session_response(user_id, user.full_name, user.email, 'customer')
+
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"User creation failed: {str(e)}")
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+# An insert referencing a user that doesn't exist fails the users foreign key,
+# and one for an unknown car has no daily rate to copy (NOT NULL)
+UNKNOWN_USER_OR_CAR_DETAIL = "Reservation failed: unknown user or car"
+
+RESERVATION_CONFLICT_DETAIL = "This car is already reserved for the selected dates. Please choose different dates or another vehicle."
+
+# Overlap guard shared by reservation writes: true when no other active
+# reservation of the car intersects [start, end). The single
+# `start < :end AND end > :start` form on epoch columns is a range scan of
+# idx_reservations_active_car_epoch.
+NO_OVERLAP_SQL = """
+    NOT EXISTS (
+        SELECT 1 FROM reservations
+        WHERE car_id = ?
+        AND id != ?
+        AND status IN ('confirmed', 'pending')
+        AND start_epoch < ? AND end_epoch > ?
+    )
+"""
+
+def insert_reservation(conn, reservation: ReservationCreate) -> int:
+    start_epoch, end_epoch = reservation.start_epoch, reservation.end_epoch
+
+    # Fast path: the in-memory index rejects conflicting dates without a query
+    if availability.overlaps(reservation.car_id, start_epoch, end_epoch):
+        raise HTTPException(status_code=409, detail=RESERVATION_CONFLICT_DETAIL)
+
+    cursor = conn.cursor()
+
+    # Insert reservation with daily_rate_cents from cars table and status 'confirmed',
+    # but only if the database agrees the car is free for the requested dates
+    cursor.execute(f"""
+        INSERT INTO reservations (user_id, car_id, start_datetime, end_datetime, start_epoch, end_epoch,
+                                  daily_rate_cents, status)
+        SELECT ?, ?, ?, ?, ?, ?, (SELECT daily_rate_cents FROM cars WHERE id = ?), 'confirmed'
+        WHERE {NO_OVERLAP_SQL}
+    """, (
+        reservation.user_id,
+        reservation.car_id,
+        reservation.start_datetime,
+        reservation.end_datetime,
+        start_epoch,
+        end_epoch,
+        reservation.car_id,
+        reservation.car_id, 0,
+        end_epoch, start_epoch
+    ))
+
+    if cursor.rowcount == 0:
+        # An earlier write (in this commit group or another process) got there
+        # first and the index hasn't seen it, so resync this car from what
+        # is committed; this operation itself is rolled back
+        after_commit(lambda: availability.reload_car(conn, reservation.car_id), even_if_rolled_back=True)
+        raise HTTPException(status_code=409, detail=RESERVATION_CONFLICT_DETAIL)
+
+    reservation_id = cursor.lastrowid
+    rollup_reservation(conn, reservation_id)
+    after_commit(lambda: availability.add(reservation_id, reservation.car_id, start_epoch, end_epoch))
+    forget_rentals(reservation.user_id)
+    return reservation_id
+
 # POST /api/reservations - Insert reservation into reservations table
 @app.post("/api/reservations", response_model=ReservationResponse)
-async def create_reservation(reservation: ReservationCreate):
+async def create_reservation(reservation: ReservationCreate,
+                             principal: Optional[Principal] = Depends(current_principal)):
     """Create a new reservation in the reservations table"""
+    check_user_access(principal, reservation.user_id)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if car is available for the requested dates
-        cursor.execute("""
-            SELECT COUNT(*) as conflict_count
-            FROM reservations
-            WHERE car_id = ?
-            AND status IN ('confirmed', 'pending')
-            AND (
-                (start_datetime <= ? AND end_datetime > ?)
-                OR (start_datetime < ? AND end_datetime >= ?)
-                OR (start_datetime >= ? AND end_datetime <= ?)
-            )
-        """, (
-            reservation.car_id,
-            reservation.start_datetime, reservation.start_datetime,
-            reservation.end_datetime, reservation.end_datetime,
-            reservation.start_datetime, reservation.end_datetime
-        ))
-        
-        result = cursor.fetchone()
-        if result['conflict_count'] > 0:
-            conn.close()
-            raise HTTPException(
-                status_code=409, 
-                detail="This car is already reserved for the selected dates. Please choose different dates or another vehicle."
-            )
-        
-        # Insert reservation with daily_rate_cents from cars table and status 'confirmed'
-        cursor.execute("""
-            INSERT INTO reservations (user_id, car_id, start_datetime, end_datetime, daily_rate_cents, status)
-            VALUES (?, ?, ?, ?, (SELECT daily_rate_cents FROM cars WHERE id = ?), 'confirmed')
-        """, (
-            reservation.user_id,
-            reservation.car_id,
-            reservation.start_datetime,
-            reservation.end_datetime,
-            reservation.car_id
-        ))
-        
-        reservation_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
+        reservation_id = await writer.submit(insert_reservation, reservation)
         return ReservationResponse(id=reservation_id)
-        
+
+    except sqlite3.IntegrityError as e:
+        raise HTTPException(status_code=400, detail=f"{UNKNOWN_USER_OR_CAR_DETAIL} ({str(e)})")
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-# POST /api/payments - Process payment for a reservation
-@app.post("/api/payments", response_model=PaymentResponse)
-async def create_payment(payment: PaymentCreate):
-    """Process payment for a reservation"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if reservation exists
-        cursor.execute("SELECT id, status FROM reservations WHERE id = ?", (payment.reservation_id,))
-        reservation = cursor.fetchone()
-        
-        if not reservation:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Reservation not found")
-        
-        # No validation - accept any dummy card numbers
-        # In production, you would validate with a payment processor (Stripe, PayPal, etc.)
-        
-        # Store card info as-is (for demo purposes)
-        masked_card = payment.card_number
-        
+def find_batch_conflicts(conn, items: List[ReservationBatchItem]) -> List[Dict[str, Any]]:
+    """Every reason the batch can't be booked, found with one statement.
+
+    Items are first checked against each other in Python (two items for the
+    same car with overlapping dates), then against the cars table and the
+    active reservations in a single query over a VALUES list.
+    """
+    conflicts = []
+    # In (car, start) order an item overlaps an earlier one of its car exactly
+    # when it starts before the latest end seen so far for that car
+    by_car = sorted(range(len(items)), key=lambda i: (items[i].car_id, items[i].start_epoch))
+    latest = None  # index of the item with the latest end so far, for the current car
+    for current in by_car:
+        if latest is None or items[latest].car_id != items[current].car_id:
+            latest = current
+            continue
+        if items[latest].end_epoch > items[current].start_epoch:
+            conflicts.append({'index': current, 'car_id': items[current].car_id,
+                              'reason': 'overlaps_batch_item', 'other_index': latest})
+        if items[current].end_epoch > items[latest].end_epoch:
+            latest = current
+
+    values = ", ".join("(?, ?, ?, ?)" for _ in items)
+    params: List[Any] = []
+    for index, item in enumerate(items):
+        params += [index, item.car_id, item.start_epoch, item.end_epoch]
+    rows = conn.execute(f"""
+        WITH req(idx, car_id, s, e) AS (VALUES {values})
+        SELECT req.idx, req.car_id, 'unknown_car' AS reason, NULL AS reservation_id
+        FROM req
+        WHERE NOT EXISTS (SELECT 1 FROM cars WHERE cars.id = req.car_id)
+        UNION ALL
+        SELECT req.idx, req.car_id, 'already_reserved', r.id
+        FROM req
+        JOIN reservations r
+          ON r.car_id = req.car_id
+         AND r.status IN ('confirmed', 'pending')
+         AND r.start_epoch < req.e AND r.end_epoch > req.s
+    """, params)
+    for index, car_id, reason, reservation_id in rows:
+        conflict = {'index': index, 'car_id': car_id, 'reason': reason}
+        if reservation_id is not None:
+            conflict['reservation_id'] = reservation_id
+        conflicts.append(conflict)
+    return sorted(conflicts, key=lambda conflict: conflict['index'])
+
+def insert_reservation_batch(conn, batch: ReservationBatchCreate) -> List[int]:
+    cursor = conn.cursor()
+
+    conflicts = find_batch_conflicts(conn, batch.items)
+    if conflicts:
+        raise HTTPException(status_code=409, detail={
+            "message": "Some cars in this batch can't be reserved for the selected dates. Nothing was booked.",
+            "conflicts": conflicts,
+        })
+
+    # All-or-nothing: the writer rolls back every row if any insert fails
+    reservation_ids = []
+    for item in batch.items:
         cursor.execute("""
-            INSERT INTO payments (reservation_id, amount_cents, currency, provider, provider_ref, status)
-            VALUES (?, ?, 'USD', 'test', ?, 'paid')
+            INSERT INTO reservations (user_id, car_id, start_datetime, end_datetime, start_epoch, end_epoch,
+                                      daily_rate_cents, status)
+            VALUES (?, ?, ?, ?, ?, ?, (SELECT daily_rate_cents FROM cars WHERE id = ?), 'confirmed')
         """, (
-            payment.reservation_id,
-            payment.amount_cents,
-            masked_card
+            batch.user_id, item.car_id, item.start_datetime, item.end_datetime,
+            item.start_epoch, item.end_epoch, item.car_id
         ))
-        
+        reservation_ids.append(cursor.lastrowid)
+        rollup_reservation(conn, cursor.lastrowid)
+
+    def index_batch():
+        for reservation_id, item in zip(reservation_ids, batch.items):
+            availability.add(reservation_id, item.car_id, item.start_epoch, item.end_epoch)
+    after_commit(index_batch)
+    forget_rentals(batch.user_id)
+    return reservation_ids
+
+# POST /api/reservations/batch - Reserve several cars at once, all or nothing
+@app.post("/api/reservations/batch", response_model=ReservationBatchResponse)
+async def create_reservation_batch(batch: ReservationBatchCreate,
+                                   principal: Optional[Principal] = Depends(current_principal)):
+    """Create up to 100 reservations in one transaction.
+
+    If any item conflicts (with an existing booking, another item of the
+    batch, or an unknown car) nothing is booked and the 409 response lists
+    the offending items by their index in `items`.
+    """
+    check_user_access(principal, batch.user_id)
+    try:
+        reservation_ids = await writer.submit(insert_reservation_batch, batch)
+        return ReservationBatchResponse(ids=reservation_ids)
+
+    except sqlite3.IntegrityError as e:
+        raise HTTPException(status_code=400, detail=f"{UNKNOWN_USER_OR_CAR_DETAIL} ({str(e)})")
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+def queue_payment(conn, payment: PaymentCreate, submission: str, principal: Optional[Principal] = None) -> int:
+    """Record the payment as pending and queue it for the payment processor.
+
+    The card details are not written: the processor holds them under `submission`.
+    """
+    cursor = conn.cursor()
+
+    # Check if reservation exists
+    cursor.execute("SELECT id, status, user_id FROM reservations WHERE id = ?", (payment.reservation_id,))
+    reservation = cursor.fetchone()
+
+    if not reservation:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    check_user_access(principal, reservation['user_id'])
+
+    # One payment per reservation; a failed one may be tried again (with another card)
+    cursor.execute("SELECT id, status FROM payments WHERE reservation_id = ?", (payment.reservation_id,))
+    existing = cursor.fetchone()
+    if existing is not None and existing['status'] != 'failed':
+        raise HTTPException(status_code=409, detail=f"Reservation already has a {existing['status']} payment")
+
+    if existing is not None:
+        payment_id = existing['id']
+        cursor.execute("""
+            UPDATE payments
+            SET amount_cents = ?, provider = ?, provider_ref = NULL, status = ?, failure_reason = NULL
+            WHERE id = ?
+        """, (payment.amount_cents, payment_processor.provider.name, PENDING, payment_id))
+    else:
+        cursor.execute("""
+            INSERT INTO payments (reservation_id, amount_cents, currency, provider, status)
+            VALUES (?, ?, 'USD', ?, ?)
+        """, (payment.reservation_id, payment.amount_cents, payment_processor.provider.name, PENDING))
         payment_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
+
+    enqueue_payment(conn, payment_id, submission, payment_processor.owner, int(time.time()))
+    after_commit(payment_processor.notify)
+    return payment_id
+
+# POST /api/payments - Accept a payment for a reservation
+@app.post("/api/payments", response_model=PaymentResponse, status_code=202)
+async def create_payment(payment: PaymentCreate, principal: Optional[Principal] = Depends(current_principal)):
+    """Accept a payment for a reservation.
+
+    The payment is only queued here (status 'pending'); poll
+    GET /api/payments/{id} for the outcome, 'paid' or 'failed'.
+    """
+    # Held before the write so the processor has the card as soon as the job is visible
+    submission = payment_processor.hold({'card_number': payment.card_number, 'card_holder': payment.card_holder,
+                                         'expiry_date': payment.expiry_date, 'cvv': payment.cvv})
+    try:
+        payment_id = await writer.submit(queue_payment, payment, submission, principal)
+
         return PaymentResponse(
             id=payment_id,
             reservation_id=payment.reservation_id,
-            status='paid'
+            status=PENDING
         )
-        
+
     except HTTPException:
+        payment_processor.release(submission)
         raise
     except sqlite3.Error as e:
+        payment_processor.release(submission)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-# GET /api/reservations/user/{user_id} - Get all reservations for a specific user
-@app.get("/api/reservations/user/{user_id}")
-async def get_user_reservations(user_id: int) -> List[Dict[str, Any]]:
-    """Get all reservations for a specific user with car details"""
+PAYMENT_MAX_WAIT_SECONDS = 30
+
+# GET /api/payments/{payment_id} - Status of a payment
+@app.get("/api/payments/{payment_id}")
+async def get_payment(
+    payment_id: int,
+    wait: float = Query(0, ge=0, le=PAYMENT_MAX_WAIT_SECONDS,
+                        description="Seconds to wait for a pending payment to be settled before answering"),
+    principal: Principal = Depends(require_principal),
+):
+    """Status of a payment; with `wait`, a pending payment is answered once settled (long poll).
+
+    Only the user who booked the reservation, or an admin, may see it.
+    """
+    event = payment_processor.watch(payment_id)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT 
-                r.id,
-                r.user_id,
-                r.car_id,
-                r.start_datetime,
-                r.end_datetime,
-                r.status,
-                r.daily_rate_cents,
-                r.created_at,
-                c.make,
-                c.model,
-                c.year,
-                c.color,
-                c.transmission,
-                c.image_url
-            FROM reservations r
-            JOIN cars c ON r.car_id = c.id
-            WHERE r.user_id = ?
-            ORDER BY r.start_datetime DESC
-        """, (user_id,))
-        reservations = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return reservations
+        status = await database.run(payment_status, payment_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Payment not found")
+        check_user_access(principal, status['user_id'])
+        if status['status'] == PENDING and wait > 0:
+            try:
+                await asyncio.wait_for(event.wait(), wait)
+            except asyncio.TimeoutError:
+                return status
+            status = await database.run(payment_status, payment_id)
+        return status
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    finally:
+        payment_processor.unwatch(payment_id, event)
+
+def user_rentals_page(conn, user_id: int, scope: Optional[str], now: int, limit: Optional[int] = None,
+                      after=None) -> Tuple[bytes, Optional[str]]:
+    """(JSON array, cursor of the next page or None) of the user's reservations"""
+    sql, params = build_rentals_query(user_id, scope, now, after)
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    cursor = tuple_cursor(conn)
+    cursor.execute(sql, params)
+    columns, rows = column_names(cursor), cursor.fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows.pop()
+        next_cursor = encode_cursor(rows[-1][-1], rows[-1][0])
+    # Drop the trailing start_epoch, which is only there for the cursor
+    return encoder_for(columns[:-1]).encode([row[:-1] for row in rows]), next_cursor
+
+def forget_rentals(user_id: int):
+    """Drop the user's cached history pages once the current write commits"""
+    after_commit(lambda: rentals_cache.invalidate(user_id))
+
+# GET /api/reservations/user/{user_id} - Get all reservations for a specific user
+@app.get("/api/reservations/user/{user_id}", response_model=List[Dict[str, Any]])
+async def get_user_reservations(
+    user_id: int,
+    scope: Optional[str] = Query(None, description="upcoming (soonest first) or past (newest first); omit for all"),
+    limit: Optional[int] = Query(None, ge=1, le=RENTALS_MAX_PAGE_SIZE, description="Page size; omit for all"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    principal: Optional[Principal] = Depends(current_principal),
+) -> Response:
+    """Get reservations for a specific user with car details.
+
+    Without `limit` the whole history (or `scope`) is returned. With `limit`,
+    one page is returned and the `X-Next-Cursor` response header holds the
+    cursor for the next page (absent on the last page); first pages are
+    served from rentals_cache.
+    """
+    check_user_access(principal, user_id)
+    if scope is not None and scope not in RENTAL_SCOPES:
+        raise HTTPException(status_code=400, detail=f"scope must be one of {', '.join(RENTAL_SCOPES)}")
+    after = decode_cursor(cursor) if cursor else None
+    now = int(time.time())
+
+    cache_key = (scope, limit)
+    page, ticket = (None, None) if limit is None or after is not None else rentals_cache.get(user_id, cache_key)
+    if page is None:
+        try:
+            page = await database.run(user_rentals_page, user_id, scope, now, limit, after)
+        except sqlite3.Error as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        if ticket is not None:
+            rentals_cache.put(user_id, cache_key, ticket, page)
+
+    body, next_cursor = page
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return json_bytes_response(body, headers=headers)
+
+def apply_reservation_update(conn, reservation_id: int, reservation: ReservationUpdate,
+                             principal: Optional[Principal] = None):
+    cursor = conn.cursor()
+
+    # Check if reservation exists and is not cancelled or completed
+    cursor.execute("""
+        SELECT status, user_id, car_id, start_epoch, end_epoch, daily_rate_cents FROM reservations WHERE id = ?
+    """, (reservation_id,))
+    result = cursor.fetchone()
+
+    if not result:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    check_user_access(principal, result['user_id'])
+
+    if result['status'] in ['cancelled', 'completed']:
+        raise HTTPException(status_code=400, detail=f"Cannot update {result['status']} reservation")
+
+    # Check if car is available for the new dates (excluding current reservation)
+    conflict_detail = "This car is already reserved for the selected dates. Please choose different dates."
+    start_epoch, end_epoch = reservation.start_epoch, reservation.end_epoch
+    if availability.overlaps(result['car_id'], start_epoch, end_epoch, exclude_id=reservation_id):
+        raise HTTPException(status_code=409, detail=conflict_detail)
+
+    # Update the reservation, re-checking the dates in the same statement
+    cursor.execute(f"""
+        UPDATE reservations 
+        SET start_datetime = ?, end_datetime = ?, start_epoch = ?, end_epoch = ?
+        WHERE id = ?
+        AND status NOT IN ('cancelled', 'completed')
+        AND {NO_OVERLAP_SQL}
+    """, (
+        reservation.start_datetime, reservation.end_datetime, start_epoch, end_epoch, reservation_id,
+        result['car_id'], reservation_id,
+        end_epoch, start_epoch
+    ))
+
+    if cursor.rowcount == 0:
+        car_id = result['car_id']
+        after_commit(lambda: availability.reload_car(conn, car_id), even_if_rolled_back=True)
+        raise HTTPException(status_code=409, detail=conflict_detail)
+
+    # Move the booked days in the daily rollup from the old dates to the new ones
+    car_id, daily_rate_cents = result['car_id'], result['daily_rate_cents']
+    rollup_booking(conn, car_id, result['start_epoch'], result['end_epoch'], daily_rate_cents, -1)
+    rollup_booking(conn, car_id, start_epoch, end_epoch, daily_rate_cents)
+    after_commit(lambda: availability.move(reservation_id, start_epoch, end_epoch))
+    forget_rentals(result['user_id'])
 
 # PUT /api/reservations/{reservation_id} - Update a reservation
 @app.put("/api/reservations/{reservation_id}")
-async def update_reservation(reservation_id: int, reservation: ReservationUpdate):
+async def update_reservation(reservation_id: int, reservation: ReservationUpdate,
+                             principal: Optional[Principal] = Depends(current_principal)):
     """Update a reservation's dates"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if reservation exists and is not cancelled or completed
-        cursor.execute("SELECT status, car_id FROM reservations WHERE id = ?", (reservation_id,))
-        result = cursor.fetchone()
-        
-        if not result:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Reservation not found")
-        
-        if result['status'] in ['cancelled', 'completed']:
-            conn.close()
-            raise HTTPException(status_code=400, detail=f"Cannot update {result['status']} reservation")
-        
-        # Check if car is available for the new dates (excluding current reservation)
-        cursor.execute("""
-            SELECT COUNT(*) as conflict_count
-            FROM reservations
-            WHERE car_id = ?
-            AND id != ?
-            AND status IN ('confirmed', 'pending')
-            AND (
-                (start_datetime <= ? AND end_datetime > ?)
-                OR (start_datetime < ? AND end_datetime >= ?)
-                OR (start_datetime >= ? AND end_datetime <= ?)
-            )
-        """, (
-            result['car_id'],
-            reservation_id,
-            reservation.start_datetime, reservation.start_datetime,
-            reservation.end_datetime, reservation.end_datetime,
-            reservation.start_datetime, reservation.end_datetime
-        ))
-        
-        conflict_result = cursor.fetchone()
-        if conflict_result['conflict_count'] > 0:
-            conn.close()
-            raise HTTPException(
-                status_code=409, 
-                detail="This car is already reserved for the selected dates. Please choose different dates."
-            )
-        
-        # Update the reservation
-        cursor.execute("""
-            UPDATE reservations 
-            SET start_datetime = ?, end_datetime = ?
-            WHERE id = ?
-        """, (reservation.start_datetime, reservation.end_datetime, reservation_id))
-        
-        conn.commit()
-        conn.close()
-        
+        await writer.submit(apply_reservation_update, reservation_id, reservation, principal)
         return {"message": "Reservation updated successfully", "id": reservation_id}
-        
+
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+def apply_reservation_cancel(conn, reservation_id: int, principal: Optional[Principal] = None):
+    cursor = conn.cursor()
+
+    # Check if reservation exists
+    cursor.execute("SELECT status, user_id FROM reservations WHERE id = ?", (reservation_id,))
+    result = cursor.fetchone()
+
+    if not result:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    check_user_access(principal, result['user_id'])
+
+    if result['status'] == 'cancelled':
+        raise HTTPException(status_code=400, detail="Reservation is already cancelled")
+
+    if result['status'] == 'completed':
+        raise HTTPException(status_code=400, detail="Cannot cancel completed reservation")
+
+    # Take its days out of the daily rollup, then update status to cancelled
+    rollup_reservation(conn, reservation_id, -1)
+    cursor.execute("""
+        UPDATE reservations 
+        SET status = 'cancelled'
+        WHERE id = ?
+    """, (reservation_id,))
+
+    after_commit(lambda: availability.remove(reservation_id))
+    forget_rentals(result['user_id'])
+
 # DELETE /api/reservations/{reservation_id} - Cancel a reservation
 @app.delete("/api/reservations/{reservation_id}")
-async def cancel_reservation(reservation_id: int):
+async def cancel_reservation(reservation_id: int, principal: Optional[Principal] = Depends(current_principal)):
     """Cancel a reservation (set status to cancelled)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if reservation exists
-        cursor.execute("SELECT status FROM reservations WHERE id = ?", (reservation_id,))
-        result = cursor.fetchone()
-        
-        if not result:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Reservation not found")
-        
-        if result['status'] == 'cancelled':
-            conn.close()
-            raise HTTPException(status_code=400, detail="Reservation is already cancelled")
-        
-        if result['status'] == 'completed':
-            conn.close()
-            raise HTTPException(status_code=400, detail="Cannot cancel completed reservation")
-        
-        # Update status to cancelled
-        cursor.execute("""
-            UPDATE reservations 
-            SET status = 'cancelled'
-            WHERE id = ?
-        """, (reservation_id,))
-        
-        conn.commit()
-        conn.close()
-        
+        await writer.submit(apply_reservation_cancel, reservation_id, principal)
         return {"message": "Reservation cancelled successfully", "id": reservation_id}
-        
+
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+# GET /api/admin/availability-index/check - Compare the availability index with the database
+@app.get("/api/admin/availability-index/check", dependencies=[Depends(require_admin)])
+async def check_availability_index(repair: bool = False):
+    """Report reservations where the in-memory index disagrees with the database"""
+    try:
+        problems = await database.run(availability.verify)
+        if problems and repair:
+            await database.run(availability.load)
+        return {"consistent": not problems, "problems": problems, "repaired": bool(problems and repair)}
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+# GET /api/admin/slow-queries - Recent statements slower than CARRENTAL_SLOW_QUERY_MS
+@app.get("/api/admin/slow-queries", dependencies=[Depends(require_admin)])
+async def list_slow_queries(clear: bool = False):
+    """The slow-query log, oldest first, with literal values replaced by `?`.
+
+    Entries only include the statement as executed (`expanded_sql`) when
+    CARRENTAL_SLOW_QUERY_PARAMS is on. Pass `clear=true` to empty the log
+    after reading it.
+    """
+    entries = slow_queries.entries()
+    if clear:
+        slow_queries.clear()
+    return {
+        "enabled": slow_queries.enabled,
+        "threshold_ms": slow_queries.threshold * 1000,
+        "params_included": slow_queries.keep_params,
+        "total": slow_queries.total,
+        "entries": entries,
+    }
+
+# GET /api/admin/images/check - Find car images that are missing or have no derivatives
+@app.get("/api/admin/images/check", dependencies=[Depends(require_admin)])
+async def check_car_images(reload: bool = False):
+    """Report image_url values with no file on disk or no entry in the derivative manifest.
+
+    Pass `reload=true` after rebuilding derivatives to pick up the new manifest.
+    """
+    if reload:
+        image_manifest.load()
+    try:
+        report = await database.run(check_image_urls, UPLOADS_DIR, image_manifest)
+    except UnsafeImagePath as e:
+        raise HTTPException(status_code=400, detail=f"image_url escapes the uploads directory: {e}")
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return {"ok": not report['missing'], **report}
+
+# GET /api/admin/export/{dataset} - Stream every reservation or payment as NDJSON or CSV
+@app.get("/api/admin/export/{dataset}", dependencies=[Depends(require_admin)])
+async def export_dataset(
+    dataset: str,
+    format: str = Query('ndjson', description="ndjson or csv"),
+    since: Optional[str] = Query(None, description="Only rows created at or after this ISO-8601 time (UTC)"),
+    until: Optional[str] = Query(None, description="Only rows created before this ISO-8601 time (UTC)"),
+):
+    """Dump reservations (with user, car and payment) or payments (with reservation, user and car).
+
+    The body is streamed straight off the database cursor, so exports of any
+    size run in constant memory.
+    """
+    if dataset not in EXPORT_QUERIES:
+        raise HTTPException(status_code=404, detail=f"Unknown export: {dataset}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    try:
+        since_ts = sqlite_timestamp(since) if since else None
+        until_ts = sqlite_timestamp(until) if until else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since and until must be ISO-8601 dates or datetimes")
+
+    sql, params = build_export_query(dataset, since_ts, until_ts)
+    return StreamingResponse(
+        stream_export(DB_PATH, sql, params, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{format}"'},
+    )
+
+ACTIVE_INTERVALS_SQL = """
+    SELECT car_id, start_epoch, end_epoch
+    FROM reservations
+    WHERE status IN ('confirmed', 'pending')
+    AND start_epoch < ? AND end_epoch > ?
+"""
+
+def fleet_heatmap_json(conn, start: int, days: int, encoding: str) -> bytes:
+    car_ids = [row[0] for row in conn.execute("SELECT id FROM cars ORDER BY id")]
+    end = start + days * 86400
+    intervals = availability.window(start, end)
+    if intervals is None:
+        intervals = {}
+        for car_id, interval_start, interval_end in conn.execute(ACTIVE_INTERVALS_SQL, (end, start)):
+            starts, ends = intervals.setdefault(car_id, ([], []))
+            starts.append(interval_start)
+            ends.append(interval_end)
+    payload = {'from': datetime.fromtimestamp(start, timezone.utc).strftime(CANONICAL_FORMAT)}
+    payload.update(fleet_heatmap(car_ids, intervals, start, days, encoding))
+    return dumps(payload)
+
+# GET /api/admin/fleet/heatmap - Booked days of every car over the coming weeks
+@app.get("/api/admin/fleet/heatmap", dependencies=[Depends(require_admin)])
+async def get_fleet_heatmap(
+    start: Optional[str] = Query(None, alias="from", description="First day (ISO-8601, UTC); defaults to today"),
+    days: int = Query(90, ge=1, le=MAX_DAYS),
+    encoding: str = Query('bitmap', description="bitmap or rle"),
+) -> Response:
+    """Cars x days occupancy grid with each car's utilization over the window.
+
+    `cars` lists the car ids in row order and `utilization` the percentage
+    of the window each car is booked. `matrix` is either `bitmap` (base64,
+    each row packed into `row_bytes` bytes, most significant bit first, 1 =
+    booked that UTC day) or `rle` (per car, run lengths alternating free and
+    booked days, starting with a free run).
+    """
+    if encoding not in ENCODINGS:
+        raise HTTPException(status_code=400, detail=f"encoding must be one of {', '.join(ENCODINGS)}")
+    try:
+        start_epoch = epoch_of(start) if start else int(datetime.now(timezone.utc).timestamp())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from must be an ISO-8601 date or datetime")
+    start_epoch -= start_epoch % 86400
+    try:
+        return json_bytes_response(await database.run(fleet_heatmap_json, start_epoch, days, encoding))
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+def stats_range(start: Optional[str], end: Optional[str]):
+    """(first_day, last_day, days) for inclusive YYYY-MM-DD bounds, defaulting to the last 30 days"""
+    try:
+        last = date.fromisoformat(end) if end else datetime.now(timezone.utc).date()
+        first = date.fromisoformat(start) if start else last - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be dates (YYYY-MM-DD)")
+    if first > last:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return first.isoformat(), last.isoformat(), (last - first).days + 1
+
+def fleet_daily_stats(conn, first_day: str, last_day: str, car_id: Optional[int]):
+    fleet_size = 1 if car_id is not None else conn.execute("SELECT COUNT(*) FROM cars").fetchone()[0]
+    days = daily_totals(conn, first_day, last_day, car_id)
+    for day in days:
+        day['occupancy'] = round(day['booked_seconds'] / (SECONDS_PER_DAY * fleet_size), 4) if fleet_size else 0.0
+    return days
+
+# GET /api/admin/stats/daily - Fleet occupancy and revenue per day
+@app.get("/api/admin/stats/daily", dependencies=[Depends(require_admin)])
+async def get_daily_stats(
+    start: Optional[str] = Query(None, description="First day (YYYY-MM-DD, UTC); defaults to 29 days before end"),
+    end: Optional[str] = Query(None, description="Last day (YYYY-MM-DD, UTC), inclusive; defaults to today"),
+    car_id: Optional[int] = Query(None, description="Only this car"),
+):
+    """Booked seconds, occupancy, booked revenue and payments per day.
+
+    Read from the daily_car_stats rollup, so the cost depends on the number
+    of days and cars in the range, not on the number of reservations.
+    Days without any bookings or payments are left out.
+    """
+    first_day, last_day, _ = stats_range(start, end)
+    try:
+        days = await database.run(fleet_daily_stats, first_day, last_day, car_id)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return {"start": first_day, "end": last_day, "days": days}
+
+# GET /api/admin/stats/cars - Occupancy and revenue per car over a date range
+@app.get("/api/admin/stats/cars", dependencies=[Depends(require_admin)])
+async def get_car_stats(
+    start: Optional[str] = Query(None, description="First day (YYYY-MM-DD, UTC); defaults to 29 days before end"),
+    end: Optional[str] = Query(None, description="Last day (YYYY-MM-DD, UTC), inclusive; defaults to today"),
+):
+    """Per-car totals from the daily_car_stats rollup, highest booked revenue first"""
+    first_day, last_day, day_count = stats_range(start, end)
+    try:
+        cars = await database.run(car_totals, first_day, last_day)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    for car in cars:
+        car['occupancy'] = round(car['booked_seconds'] / (SECONDS_PER_DAY * day_count), 4)
+    return {"start": first_day, "end": last_day, "cars": cars}
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "car-rental-api"}
 
+def runtime_metrics():
+    """Gauges and counters read from the live objects on every scrape"""
+    cache = occupancy_cache.stats()
+    principals = principal_cache.stats()
+    rentals = rentals_cache.stats()
+    payments = payment_processor.stats()
+    return [
+        ("carrental_writer_transactions_total", "counter", "Write transactions committed", writer.transactions),
+        ("carrental_writer_operations_total", "counter", "Write operations committed", writer.operations),
+        ("carrental_occupancy_cache_hits_total", "counter", "Availability bitmap cache hits", cache['hits']),
+        ("carrental_occupancy_cache_misses_total", "counter", "Availability bitmap cache misses", cache['misses']),
+        ("carrental_occupancy_cache_entries", "gauge", "Availability bitmaps cached", cache['size']),
+        ("carrental_principal_cache_hits_total", "counter", "Session account cache hits", principals['hits']),
+        ("carrental_principal_cache_misses_total", "counter", "Session account cache misses", principals['misses']),
+        ("carrental_rentals_cache_hits_total", "counter", "My Rentals first-page cache hits", rentals['hits']),
+        ("carrental_rentals_cache_misses_total", "counter", "My Rentals first-page cache misses", rentals['misses']),
+        ("carrental_payments_in_flight", "gauge", "Payments being charged with the provider", payments['in_flight']),
+        ("carrental_payments_paid_total", "counter", "Payments settled as paid", payments['paid']),
+        ("carrental_payments_failed_total", "counter", "Payments settled as failed", payments['failed']),
+        ("carrental_payment_retries_total", "counter", "Provider calls that failed and were rescheduled",
+         payments['retries']),
+        ("carrental_payment_cards_held", "gauge", "Queued payments whose card details are held in memory",
+         payments['held_cards']),
+        ("carrental_password_hashes_pending", "gauge", "Password hashes queued or running", password_hasher.pending),
+        ("carrental_password_hashes_rejected_total", "counter", "Logins/sign-ups refused because the hash queue was full",
+         password_hasher.rejected),
+        ("carrental_availability_index_loaded", "gauge", "1 once the availability index is loaded",
+         int(availability.loaded)),
+        ("carrental_sql_slow_statements_total", "counter", "Statements recorded in the slow-query log",
+         slow_queries.total),
+        ("carrental_event_loop_max_lag_seconds", "gauge", "Worst event loop lag seen (needs CARRENTAL_LOOP_LAG_MS)",
+         f"{loop_lag_monitor.max_lag:.6f}"),
+    ]
+
+metrics.register_collector(runtime_metrics)
+
+# GET /metrics - Request, SQL and runtime metrics in the Prometheus text format
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     # Start the server on port 3001 to match the original Express server
-    uvicorn.run(app, host="0.0.0.0", port=3001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=3001)
@@ -0,0 +1,244 @@
+# In-process availability index for reservation conflict checks
+# Keeps the active (confirmed/pending) reservation intervals of every car in
+# sorted arrays so an overlap check is a binary search instead of a query.
+# Intervals are UTC epoch seconds (reservations.start_epoch/end_epoch).
+# The database stays authoritative: writes are still guarded in SQL, and the
+# index can be verified against (or rebuilt from) the reservations table.
+
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+ACTIVE_RESERVATIONS_SQL = """
+    SELECT id, car_id, start_epoch, end_epoch
+    FROM reservations
+    WHERE status IN ('confirmed', 'pending')
+"""
+
+
+class CarSchedule:
+    """Active intervals of one car, sorted by start time.
+
+    As long as the intervals don't overlap each other (which the booking
+    rules guarantee), both `starts` and `ends` are sorted and an overlap
+    check only has to look at the interval just before the insertion point.
+    Legacy rows that do overlap mark the schedule as `tangled`; overlap
+    checks then return None so callers fall back to the database.
+    """
+
+    __slots__ = ('starts', 'ends', 'ids', 'tangled')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        self.tangled = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, reservation_id, start, end):
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, reservation_id)
+        if (i > 0 and self.ends[i - 1] > start) or (i + 1 < len(self.starts) and end > self.starts[i + 1]):
+            self.tangled = True
+
+    def remove(self, reservation_id):
+        i = self.ids.index(reservation_id)
+        del self.starts[i], self.ends[i], self.ids[i]
+        if self.tangled:
+            self.tangled = any(self.ends[k] > self.starts[k + 1] for k in range(len(self.starts) - 1))
+
+    def overlaps(self, start, end, exclude_id=None) -> Optional[bool]:
+        """True/False for a conflict with [start, end), None if unknown"""
+        if self.tangled:
+            return None
+        i = bisect_left(self.starts, end) - 1  # last interval starting before `end`
+        if i >= 0 and self.ids[i] == exclude_id:
+            i -= 1
+        return i >= 0 and self.ends[i] > start
+
+    def intervals(self):
+        return list(zip(self.ids, self.starts, self.ends))
+
+
+class AvailabilityIndex:
+    """Per-car interval index over the active reservations.
+
+    All methods are thread-safe; handlers call them from the DB worker
+    threads and the writer thread. Mutations should be applied only after
+    the matching database write has committed.
+
+    Every change to a car's intervals bumps that car's version (and a full
+    load bumps all of them), so caches of per-car views can key on
+    `version(car_id)` instead of being told about each write.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cars: Dict[int, CarSchedule] = {}
+        self._reservations: Dict[int, Tuple[int, object, object]] = {}
+        self._generation = 0
+        self._versions: Dict[int, int] = {}
+        self.loaded = False
+
+    def load(self, conn):
+        """(Re)build the whole index from the reservations table"""
+        cars: Dict[int, CarSchedule] = {}
+        reservations = {}
+        for reservation_id, car_id, start, end in conn.execute(ACTIVE_RESERVATIONS_SQL):
+            cars.setdefault(car_id, CarSchedule()).add(reservation_id, start, end)
+            reservations[reservation_id] = (car_id, start, end)
+        with self._lock:
+            self._cars = cars
+            self._reservations = reservations
+            self._generation += 1
+            self.loaded = True
+
+    def reload_car(self, conn, car_id):
+        """Re-read one car's active reservations, e.g. after a missed write"""
+        rows = conn.execute(ACTIVE_RESERVATIONS_SQL + " AND car_id = ?", (car_id,)).fetchall()
+        schedule = CarSchedule()
+        for reservation_id, _, start, end in rows:
+            schedule.add(reservation_id, start, end)
+        with self._lock:
+            old = self._cars.get(car_id)
+            if old is not None:
+                for reservation_id in old.ids:
+                    self._reservations.pop(reservation_id, None)
+            self._cars[car_id] = schedule
+            for reservation_id, start, end in schedule.intervals():
+                self._reservations[reservation_id] = (car_id, start, end)
+            self._touch_locked(car_id)
+
+    def overlaps(self, car_id, start, end, exclude_id=None) -> Optional[bool]:
+        """Whether [start, end) collides with an active reservation of the car.
+
+        Returns None when the index can't answer (not loaded yet, or the car
+        has legacy overlapping bookings) and the caller must ask the database.
+        """
+        with self._lock:
+            if not self.loaded:
+                return None
+            schedule = self._cars.get(car_id)
+            if schedule is None:
+                return False
+            return schedule.overlaps(start, end, exclude_id)
+
+    def add(self, reservation_id, car_id, start, end):
+        with self._lock:
+            if reservation_id in self._reservations:
+                self._remove_locked(reservation_id)
+            self._cars.setdefault(car_id, CarSchedule()).add(reservation_id, start, end)
+            self._reservations[reservation_id] = (car_id, start, end)
+            self._touch_locked(car_id)
+
+    def move(self, reservation_id, start, end):
+        with self._lock:
+            entry = self._reservations.get(reservation_id)
+            if entry is None:
+                return
+            car_id = entry[0]
+            self._remove_locked(reservation_id)
+            self._cars.setdefault(car_id, CarSchedule()).add(reservation_id, start, end)
+            self._reservations[reservation_id] = (car_id, start, end)
+            self._touch_locked(car_id)
+
+    def remove(self, reservation_id):
+        with self._lock:
+            if reservation_id in self._reservations:
+                self._remove_locked(reservation_id)
+
+    def _remove_locked(self, reservation_id):
+        car_id, _, _ = self._reservations.pop(reservation_id)
+        self._cars[car_id].remove(reservation_id)
+        self._touch_locked(car_id)
+
+    def _touch_locked(self, car_id):
+        self._versions[car_id] = self._versions.get(car_id, 0) + 1
+
+    def version(self, car_id) -> Tuple[int, int]:
+        """Changes whenever the car's intervals (or the whole index) change"""
+        with self._lock:
+            return self._generation, self._versions.get(car_id, 0)
+
+    def snapshot(self, car_id, start, end) -> Optional[Tuple[Tuple[int, int], List[Tuple[object, object]]]]:
+        """(version, [(start, end), ...]) of the car's intervals that overlap [start, end).
+
+        Returns None when the index isn't loaded yet.
+        """
+        with self._lock:
+            if not self.loaded:
+                return None
+            version = (self._generation, self._versions.get(car_id, 0))
+            schedule = self._cars.get(car_id)
+            if schedule is None:
+                return version, []
+            hi = bisect_left(schedule.starts, end)
+            # Ends are sorted too unless the schedule is tangled
+            lo = 0 if schedule.tangled else bisect_right(schedule.ends, start)
+            return version, [(s, e) for s, e in zip(schedule.starts[lo:hi], schedule.ends[lo:hi]) if e > start]
+
+    def intervals(self, car_id) -> List[Tuple[int, object, object]]:
+        """(reservation_id, start, end) tuples of a car, sorted by start"""
+        with self._lock:
+            schedule = self._cars.get(car_id)
+            return schedule.intervals() if schedule is not None else []
+
+    def window(self, start, end) -> Optional[Dict[int, Tuple[List[object], List[object]]]]:
+        """car_id -> (starts, ends) of its intervals overlapping [start, end), cars with none left out.
+
+        One pass over the whole fleet under a single lock acquisition, so
+        the result is a consistent snapshot. None when the index isn't loaded.
+        """
+        cars: Dict[int, Tuple[List[object], List[object]]] = {}
+        with self._lock:
+            if not self.loaded:
+                return None
+            for car_id, schedule in self._cars.items():
+                hi = bisect_left(schedule.starts, end)
+                if schedule.tangled:
+                    picked = [k for k in range(hi) if schedule.ends[k] > start]
+                    if picked:
+                        cars[car_id] = ([schedule.starts[k] for k in picked], [schedule.ends[k] for k in picked])
+                    continue
+                lo = bisect_right(schedule.ends, start)
+                if lo < hi:
+                    cars[car_id] = (schedule.starts[lo:hi], schedule.ends[lo:hi])
+        return cars
+
+    def verify(self, conn) -> List[Dict[str, object]]:
+        """Compare the index with the reservations table.
+
+        Returns one entry per reservation that the index is missing, still
+        holds after it stopped being active, or holds with different dates;
+        an empty list means the index matches the database.
+        """
+        expected = {
+            reservation_id: (car_id, start, end)
+            for reservation_id, car_id, start, end in conn.execute(ACTIVE_RESERVATIONS_SQL)
+        }
+        with self._lock:
+            actual = dict(self._reservations)
+
+        problems = []
+        for reservation_id in sorted(expected.keys() | actual.keys()):
+            want = expected.get(reservation_id)
+            have = actual.get(reservation_id)
+            if want == have:
+                continue
+            if have is None:
+                issue = 'missing'
+            elif want is None:
+                issue = 'stale'
+            else:
+                issue = 'mismatch'
+            problems.append({
+                'reservation_id': reservation_id,
+                'issue': issue,
+                'database': list(want) if want else None,
+                'index': list(have) if have else None,
+            })
+        return problems
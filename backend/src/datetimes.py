@@ -0,0 +1,47 @@
+# Datetime normalization for the API edge
+# Clients send reservation times in several ISO-8601 spellings ("T" or space,
+# with or without seconds, fractions or a UTC offset). They are parsed once
+# here into a canonical string plus an integer UTC epoch, which is what the
+# database compares.
+
+from datetime import datetime, timezone
+
+CANONICAL_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# How SQLite's CURRENT_TIMESTAMP spells UTC times (created_at columns)
+SQLITE_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_datetime(value: str) -> datetime:
+    """Parse an ISO-8601 date/datetime into a naive UTC datetime.
+
+    Naive inputs are taken as UTC (the same convention SQLite's strftime
+    uses); values with an offset are converted to UTC. Raises ValueError for
+    anything that isn't ISO-8601.
+    """
+    text = value.strip()
+    if text.endswith(('Z', 'z')):
+        text = text[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.replace(microsecond=0)
+
+
+def to_epoch(moment: datetime) -> int:
+    """Seconds since the unix epoch for a naive UTC datetime"""
+    return int(moment.replace(tzinfo=timezone.utc).timestamp())
+
+
+def normalize_datetime(value: str) -> str:
+    """Canonical `YYYY-MM-DDTHH:MM:SS` (UTC) spelling of an ISO-8601 value"""
+    return parse_datetime(value).strftime(CANONICAL_FORMAT)
+
+
+def epoch_of(value: str) -> int:
+    """Integer UTC epoch of an ISO-8601 value"""
+    return to_epoch(parse_datetime(value))
+
+
+def sqlite_timestamp(value: str) -> str:
+    """An ISO-8601 value in CURRENT_TIMESTAMP form, comparable with created_at"""
+    return parse_datetime(value).strftime(SQLITE_TIMESTAMP_FORMAT)
@@ -0,0 +1,218 @@
+# Database access helpers for the FastAPI backend
+# Keeps a pool of long-lived SQLite connections so request handlers don't pay
+# for sqlite3.connect() and PRAGMA setup on every call, and runs the blocking
+# sqlite3 calls on worker threads so they never stall the asyncio event loop.
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from metrics import METRICS_ENABLED, end_statement, forget_connection, instrument_connection
+
+logger = logging.getLogger("carrental.db")
+
+# Tunables (override through environment variables)
+POOL_SIZE = int(os.environ.get("CARRENTAL_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT_SECONDS = float(os.environ.get("CARRENTAL_DB_POOL_TIMEOUT", "10"))
+BUSY_TIMEOUT_MS = int(os.environ.get("CARRENTAL_DB_BUSY_TIMEOUT_MS", "5000"))
+MMAP_SIZE_BYTES = int(os.environ.get("CARRENTAL_DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHED_STATEMENTS = int(os.environ.get("CARRENTAL_DB_CACHED_STATEMENTS", "256"))
+# Worker threads for DB calls; defaults to the pool size so a worker never waits on a connection
+DB_THREADS = int(os.environ.get("CARRENTAL_DB_THREADS", str(POOL_SIZE)))
+# Log a warning when the event loop was blocked longer than this (0 disables the monitor)
+LOOP_LAG_THRESHOLD_MS = float(os.environ.get("CARRENTAL_LOOP_LAG_MS", "0"))
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection became free in time"""
+
+
+def configure_connection(conn):
+    """Apply the per-connection PRAGMAs used by the API"""
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_BYTES}")
+    instrument_connection(conn)
+
+
+class ConnectionPool:
+    """A fixed-size pool of configured SQLite connections.
+
+    Connections are created lazily up to `size` and handed out LIFO, so a
+    lightly loaded server keeps reusing the same warm connection (and its
+    statement cache). Connections may move between threads but are only ever
+    used by one borrower at a time.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE, timeout=POOL_TIMEOUT_SECONDS):
+        self.db_path = Path(db_path)
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._all = []
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            str(self.db_path),
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        conn.row_factory = sqlite3.Row  # This allows accessing columns by name
+        configure_connection(conn)
+        return conn
+
+    def acquire(self):
+        """Borrow a connection, opening a new one if the pool isn't full yet"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+            with self._lock:
+                self._all.append(conn)
+            return conn
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any open transaction"""
+        if conn.in_transaction:
+            conn.rollback()
+        end_statement(conn)
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a `with` block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close every connection the pool has opened"""
+        with self._lock:
+            connections, self._all = self._all, []
+            self._created = 0
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for conn in connections:
+            forget_connection(conn)
+            conn.close()
+
+
+class Database:
+    """Async front door to the connection pool.
+
+    `await database.run(func, *args)` borrows a pooled connection on one of a
+    bounded set of worker threads and calls `func(conn, *args)` there. Any
+    exception raised by `func` (including HTTPException) is re-raised in the
+    awaiting handler.
+    """
+
+    def __init__(self, db_path, threads=DB_THREADS, pool_size=None):
+        self.pool = ConnectionPool(db_path, size=pool_size or max(threads, POOL_SIZE))
+        self.threads = threads
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="db")
+        return self._executor
+
+    def _call(self, func, args, kwargs):
+        with self.pool.connection() as conn:
+            return func(conn, *args, **kwargs)
+
+    async def run(self, func, *args, **kwargs):
+        """Run `func(conn, *args, **kwargs)` on a DB worker thread and await the result"""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self._call, func, args, kwargs)
+        if METRICS_ENABLED:
+            # run_in_executor doesn't carry context variables over; the SQL
+            # timings need the request's to be filed under its route
+            call = functools.partial(contextvars.copy_context().run, call)
+        return await loop.run_in_executor(self.executor, call)
+
+    def connection(self):
+        """Borrow a pooled connection synchronously (scripts and background threads)"""
+        return self.pool.connection()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.pool.close_all()
+
+
+class LoopLagMonitor:
+    """Logs whenever the event loop could not wake a timer on time.
+
+    A sleeping task checks how late it was woken up; anything later than
+    `threshold_ms` means some coroutine blocked the loop for about that long.
+    """
+
+    def __init__(self, threshold_ms=LOOP_LAG_THRESHOLD_MS, interval_ms=None):
+        self.threshold = threshold_ms / 1000
+        self.interval = (interval_ms if interval_ms is not None else max(threshold_ms / 2, 10)) / 1000
+        self.max_lag = 0.0
+        self._task = None
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - expected
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                logger.warning("Event loop blocked for %.1f ms", lag * 1000)
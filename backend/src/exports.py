@@ -0,0 +1,135 @@
+# Bulk exports for back-office jobs (finance, ops)
+# Streams reservations or payments, joined with their car/user/payment
+# details, as NDJSON or CSV. Rows are pulled from the SQLite cursor a batch
+# at a time and encoded batch by batch, so memory stays flat no matter how
+# many rows the export covers.
+#
+# Exports use their own read-only connection with memory-mapping turned off:
+# mmap'd database pages count towards the process RSS, and a full-table read
+# through a pooled connection (mmap_size 256 MiB) would grow it by that much.
+
+import csv
+import io
+import sqlite3
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+from db import BUSY_TIMEOUT_MS
+from fastjson import column_names, encoder_for
+from metrics import forget_connection, instrument_connection
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# Card details (payments.provider_ref) are deliberately not exported
+EXPORT_QUERIES = {
+    'reservations': """
+        SELECT
+            r.id AS reservation_id,
+            r.created_at,
+            r.status,
+            r.start_datetime,
+            r.end_datetime,
+            r.daily_rate_cents,
+            r.user_id,
+            u.full_name AS user_name,
+            u.email AS user_email,
+            r.car_id,
+            c.vin,
+            c.make,
+            c.model,
+            c.year,
+            p.id AS payment_id,
+            p.amount_cents AS payment_amount_cents,
+            p.currency AS payment_currency,
+            p.status AS payment_status
+        FROM reservations r
+        JOIN users u ON u.id = r.user_id
+        JOIN cars c ON c.id = r.car_id
+        LEFT JOIN payments p ON p.reservation_id = r.id
+    """,
+    'payments': """
+        SELECT
+            p.id AS payment_id,
+            p.created_at,
+            p.status,
+            p.amount_cents,
+            p.currency,
+            p.provider,
+            p.reservation_id,
+            r.status AS reservation_status,
+            r.start_datetime,
+            r.end_datetime,
+            r.user_id,
+            u.email AS user_email,
+            r.car_id,
+            c.vin
+        FROM payments p
+        JOIN reservations r ON r.id = p.reservation_id
+        JOIN users u ON u.id = r.user_id
+        JOIN cars c ON c.id = r.car_id
+    """,
+}
+# Table alias whose created_at / id the filters and ordering apply to
+EXPORT_ALIASES = {'reservations': 'r', 'payments': 'p'}
+
+
+def build_export_query(dataset: str, since: Optional[str] = None,
+                       until: Optional[str] = None) -> Tuple[str, List[Any]]:
+    """SQL + params for one dataset, created in [since, until), in id order.
+
+    `since`/`until` are CURRENT_TIMESTAMP-style strings. Rows come out in
+    primary key order, which SQLite can walk without sorting.
+    """
+    alias = EXPORT_ALIASES[dataset]
+    clauses, params = [], []
+    if since:
+        clauses.append(f"{alias}.created_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append(f"{alias}.created_at < ?")
+        params.append(until)
+    sql = EXPORT_QUERIES[dataset]
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return sql + f" ORDER BY {alias}.id", params
+
+
+def open_export_connection(db_path) -> sqlite3.Connection:
+    conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro", uri=True,
+                           timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.execute("PRAGMA mmap_size = 0")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    instrument_connection(conn)
+    return conn
+
+
+def encode_csv(rows: Sequence[tuple]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def stream_export(db_path, sql: str, params: Sequence[Any], fmt: str,
+                  batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """Yield the query result as NDJSON or CSV (with a header row), one batch per chunk"""
+    conn = open_export_connection(db_path)
+    try:
+        cursor = conn.execute(sql, params)
+        columns = column_names(cursor)
+        if fmt == 'csv':
+            yield encode_csv([columns])
+            encode = encode_csv
+        else:
+            encode = encoder_for(columns).encode_lines
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield encode(rows)
+    finally:
+        forget_connection(conn)
+        conn.close()
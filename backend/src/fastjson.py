@@ -0,0 +1,121 @@
+# Fast JSON encoding for large list responses
+# FastAPI's default path turns every sqlite3.Row into a dict, validates the
+# list against the route's return type, walks it again with the JSON-mode
+# serializer and only then calls json.dumps. For lists of flat rows all of
+# that is redundant. The helpers here read rows as plain tuples and encode
+# them straight to bytes, producing exactly the bytes JSONResponse would.
+#
+# orjson is used when installed; otherwise a per-column encoder compiled
+# once for each result shape does the work with the stdlib's C string escaper.
+
+import json
+from functools import lru_cache
+from json.encoder import encode_basestring
+from typing import Any, Iterable, List, Sequence, Tuple
+
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _stdlib_dumps(content: Any) -> bytes:
+    # Same options as fastapi.responses.JSONResponse.render
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode `content` to the bytes FastAPI's JSONResponse would send.
+
+    Values are limited to what SQLite returns (str, int, float, None) and
+    lists/dicts of those, which encode identically with orjson and json.
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return _stdlib_dumps(content)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with `dumps` (orjson when available)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_bytes_response(body: bytes, **kwargs) -> Response:
+    """Response for a body that is already encoded JSON"""
+    return Response(content=body, media_type="application/json", **kwargs)
+
+
+def tuple_cursor(conn):
+    """A cursor on `conn` that yields plain tuples instead of sqlite3.Row"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor
+
+
+def column_names(cursor) -> Tuple[str, ...]:
+    return tuple(description[0] for description in cursor.description)
+
+
+def rows_to_dicts(columns: Sequence[str], rows: Iterable[tuple]) -> List[dict]:
+    """Dicts for tuple rows; much cheaper than dict(sqlite3.Row)"""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _encode_value(value, _str=str, _int=int, _escape=encode_basestring):
+    kind = type(value)
+    if kind is _str:
+        return _escape(value)
+    if kind is _int:
+        return _int.__repr__(value)
+    if value is None:
+        return "null"
+    return _stdlib_dumps(value).decode("utf-8")
+
+
+class RecordEncoder:
+    """Encodes tuple rows with fixed columns as a JSON array of objects.
+
+    The `"column":` key prefixes are escaped once when the encoder is built;
+    encoding a row is then one escape/format call per value.
+    """
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = tuple(columns)
+        self._keys = tuple(encode_basestring(column) + ":" for column in self.columns)
+
+    def encode(self, rows: Iterable[tuple]) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(rows_to_dicts(self.columns, rows))
+        return self.encode_stdlib(rows)
+
+    def encode_stdlib(self, rows: Iterable[tuple]) -> bytes:
+        return ("[" + ",".join(self._objects(rows)) + "]").encode("utf-8")
+
+    def encode_lines(self, rows: Iterable[tuple]) -> bytes:
+        """One JSON object per line (NDJSON), each line ending in a newline"""
+        if orjson is not None:
+            columns = self.columns
+            return b"".join([orjson.dumps(dict(zip(columns, row))) + b"\n" for row in rows])
+        return "".join([line + "\n" for line in self._objects(rows)]).encode("utf-8")
+
+    def _objects(self, rows: Iterable[tuple]) -> List[str]:
+        keys, value = self._keys, _encode_value
+        return ["{" + ",".join([key + value(item) for key, item in zip(keys, row)]) + "}"
+                for row in rows]
+
+
+@lru_cache(maxsize=64)
+def encoder_for(columns: Tuple[str, ...]) -> RecordEncoder:
+    return RecordEncoder(columns)
+
+
+def query_json(conn, sql: str, params: Sequence[Any] = ()) -> bytes:
+    """Run a query and return its rows as a JSON array of objects"""
+    cursor = tuple_cursor(conn)
+    cursor.execute(sql, params)
+    return encoder_for(column_names(cursor)).encode(cursor.fetchall())
@@ -0,0 +1,54 @@
+# Feature bitmasks for "must have these features" filtering
+# Every feature with id 1..63 owns bit (id - 1) of cars.feature_mask, which
+# triggers on car_features keep up to date. Requiring a set of features is
+# then `(feature_mask & wanted) = wanted` instead of a join + GROUP BY/HAVING.
+
+import threading
+from typing import Dict, Iterable, List
+
+MAX_FEATURE_ID = 63
+
+
+class UnknownFeature(KeyError):
+    """A requested feature key has no bit (unknown or id above 63)"""
+
+
+class FeatureBits:
+    """Cached key -> bit mapping of the features table"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._features: List[Dict[str, object]] = []
+        self._bits: Dict[str, int] = {}
+        self.loaded = False
+
+    def load(self, conn):
+        features = [
+            {'key': key, 'name': name, 'bit': feature_id - 1}
+            for feature_id, key, name in conn.execute(
+                "SELECT id, key, name FROM features WHERE id BETWEEN 1 AND ? ORDER BY id",
+                (MAX_FEATURE_ID,)
+            )
+        ]
+        with self._lock:
+            self._features = features
+            self._bits = {feature['key']: feature['bit'] for feature in features}
+            self.loaded = True
+
+    def mapping(self) -> List[Dict[str, object]]:
+        with self._lock:
+            return list(self._features)
+
+    def knows(self, keys: Iterable[str]) -> bool:
+        with self._lock:
+            return all(key in self._bits for key in keys)
+
+    def mask_for(self, keys: Iterable[str]) -> int:
+        """OR of the bits of `keys`; raises UnknownFeature for keys without a bit"""
+        mask = 0
+        with self._lock:
+            for key in keys:
+                if key not in self._bits:
+                    raise UnknownFeature(key)
+                mask |= 1 << self._bits[key]
+        return mask
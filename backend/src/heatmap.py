@@ -0,0 +1,141 @@
+# Fleet x day occupancy heatmap
+# Rasterizes the active reservation intervals of every car into a
+# cars x days matrix (1 = the car is booked at some point that UTC day) plus
+# each car's utilization over the window, for spotting idle inventory.
+#
+# With NumPy installed the intervals are painted in one vectorized pass: each
+# interval adds +1 at its first day and -1 after its last day in a flat
+# difference array (np.bincount), and a cumulative sum along each row turns
+# that into occupancy. Without NumPy the same matrix is built row by row in
+# Python, which gives identical output but is much slower for large fleets.
+
+import base64
+from itertools import chain
+from typing import Any, Dict, List, Sequence, Tuple
+
+from occupancy import occupancy_bitmap
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+SLOT_SECONDS = 86400
+MAX_DAYS = 366
+ENCODINGS = ('bitmap', 'rle')
+
+# car_id -> (starts, ends) epoch lists, as AvailabilityIndex.window() returns them
+CarIntervals = Dict[int, Tuple[Sequence[int], Sequence[int]]]
+
+
+def paint_numpy(car_ids: Sequence[int], intervals: CarIntervals, start: int, days: int):
+    """(matrix uint8[cars, days], booked_seconds int64[cars]) with NumPy"""
+    cars = np.fromiter(car_ids, dtype=np.int64, count=len(car_ids))
+    spans = list(intervals.values())
+    counts = np.fromiter((len(span[0]) for span in spans), dtype=np.int64, count=len(spans))
+    total = int(counts.sum())
+    interval_cars = np.repeat(np.fromiter(intervals.keys(), dtype=np.int64, count=len(spans)), counts)
+    starts = np.fromiter(chain.from_iterable(span[0] for span in spans), dtype=np.int64, count=total)
+    ends = np.fromiter(chain.from_iterable(span[1] for span in spans), dtype=np.int64, count=total)
+
+    window_end = start + days * SLOT_SECONDS
+    clipped_starts = np.maximum(starts, start)
+    clipped_ends = np.minimum(ends, window_end)
+
+    # Keep intervals of cars in the grid that actually overlap the window
+    rows = np.searchsorted(cars, interval_cars)
+    keep = (rows < len(cars)) & (clipped_ends > clipped_starts)
+    keep[keep] = cars[rows[keep]] == interval_cars[keep]
+    rows, clipped_starts, clipped_ends = rows[keep], clipped_starts[keep], clipped_ends[keep]
+
+    booked_seconds = np.bincount(rows, weights=clipped_ends - clipped_starts, minlength=len(cars)).astype(np.int64)
+
+    first = (clipped_starts - start) // SLOT_SECONDS
+    after_last = (clipped_ends - 1 - start) // SLOT_SECONDS + 1
+    width = days + 1
+    diff = np.bincount(rows * width + first, minlength=len(cars) * width)
+    diff -= np.bincount(rows * width + after_last, minlength=len(cars) * width)
+    matrix = (np.cumsum(diff.reshape(len(cars), width), axis=1)[:, :days] > 0).astype(np.uint8)
+    return matrix, booked_seconds
+
+
+def paint_python(car_ids: Sequence[int], intervals: CarIntervals, start: int, days: int):
+    """(per-car bitmaps, booked seconds per car) without NumPy"""
+    window_end = start + days * SLOT_SECONDS
+    bitmaps, booked_seconds = [], []
+    for car_id in car_ids:
+        starts, ends = intervals.get(car_id, ((), ()))
+        bitmaps.append(occupancy_bitmap(zip(starts, ends), start, SLOT_SECONDS, days))
+        booked_seconds.append(sum(max(min(e, window_end) - max(s, start), 0) for s, e in zip(starts, ends)))
+    return bitmaps, booked_seconds
+
+
+def bits_of(bitmap: bytes, days: int) -> List[int]:
+    return [(bitmap[i >> 3] >> (7 - (i & 7))) & 1 for i in range(days)]
+
+
+def runs_of(bits: Sequence[int]) -> List[int]:
+    """Run lengths alternating free/booked, starting with a (possibly empty) free run"""
+    runs, current, length = [], 0, 0
+    for bit in bits:
+        if bit == current:
+            length += 1
+        else:
+            runs.append(length)
+            current, length = bit, 1
+    runs.append(length)
+    return runs
+
+
+def runs_numpy(matrix) -> List[List[int]]:
+    """runs_of() for every row of a 0/1 matrix"""
+    cars, days = matrix.shape
+    # A run boundary at column 0, wherever the value changes, and at the end of the row
+    boundaries = np.zeros((cars, days + 1), dtype=bool)
+    boundaries[:, 0] = boundaries[:, days] = True
+    boundaries[:, 1:days] = matrix[:, 1:] != matrix[:, :-1]
+    row_ids, cols = np.nonzero(boundaries)
+    runs = np.diff(cols)[row_ids[1:] == row_ids[:-1]].tolist()
+    counts = (boundaries.sum(axis=1) - 1).tolist()
+    starts_booked = matrix[:, 0].tolist() if days else [0] * cars
+    out, offset = [], 0
+    for count, booked in zip(counts, starts_booked):
+        row_runs = runs[offset:offset + count]
+        offset += count
+        out.append([0] + row_runs if booked else row_runs)
+    return out
+
+
+def fleet_heatmap(car_ids: Sequence[int], intervals: CarIntervals, start: int, days: int,
+                  encoding: str = 'bitmap') -> Dict[str, Any]:
+    """Heatmap payload for `car_ids` (sorted ascending) over `days` days from `start`.
+
+    `intervals` holds each car's booked [start, end) epochs. With the
+    `bitmap` encoding the matrix is base64 of every row packed to
+    ceil(days / 8) bytes, most significant bit first, rows in `cars` order;
+    with `rle` it is, per car, run lengths alternating free/booked days,
+    starting with a free run (0 when the window starts booked).
+    """
+    window_seconds = days * SLOT_SECONDS
+    if np is not None:
+        matrix, booked_seconds = paint_numpy(car_ids, intervals, start, days)
+        if encoding == 'rle':
+            encoded: Any = runs_numpy(matrix)
+        else:
+            encoded = base64.b64encode(np.packbits(matrix, axis=1).tobytes()).decode("ascii")
+        utilization = (np.minimum(booked_seconds, window_seconds) * 1000 // window_seconds / 10).tolist()
+    else:
+        bitmaps, booked_seconds = paint_python(car_ids, intervals, start, days)
+        if encoding == 'rle':
+            encoded = [runs_of(bits_of(bitmap, days)) for bitmap in bitmaps]
+        else:
+            encoded = base64.b64encode(b"".join(bitmaps)).decode("ascii")
+        utilization = [min(seconds, window_seconds) * 1000 // window_seconds / 10 for seconds in booked_seconds]
+    return {
+        'days': days,
+        'cars': list(car_ids),
+        'utilization': utilization,
+        'encoding': encoding,
+        'row_bytes': (days + 7) // 8,
+        'matrix': encoded,
+    }
@@ -0,0 +1,291 @@
+# Resized derivatives of the car photos in backend/uploads
+# `python src/images.py build` renders every source image under uploads/cars
+# into a few fixed sizes (WebP + JPEG) on a process pool, names each output by
+# the hash of its bytes and records everything in uploads/derived/manifest.json.
+# The API reads that manifest once and attaches the derivative URLs to each
+# car, so requests never touch the filesystem. Content-hashed names never
+# change meaning, which lets them be cached forever.
+#
+# Pillow is only needed to build derivatives, not to serve them.
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+UPLOADS_DIR = Path(__file__).parent.parent / "uploads"
+UPLOADS_URL = "/uploads"
+SOURCE_DIRS = ("cars",)
+SOURCE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+DERIVED_DIR = UPLOADS_DIR / "derived"
+MANIFEST_PATH = DERIVED_DIR / "manifest.json"
+MANIFEST_VERSION = 1
+
+# name -> bounding box; images are scaled down to fit, never up
+VARIANTS = {
+    'thumb': (160, 120),
+    'card': (480, 360),
+    'detail': (1280, 960),
+}
+# name -> (Pillow format, file suffix, encoder options)
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+HASH_LENGTH = 16
+
+
+def url_for(path: Path, root: Path = UPLOADS_DIR) -> str:
+    return f"{UPLOADS_URL}/{path.relative_to(root).as_posix()}"
+
+
+class UnsafeImagePath(ValueError):
+    """An /uploads/... URL whose path resolves outside the uploads directory (`..`, absolute parts, symlinks)"""
+
+
+def path_for(url: str, root: Path = UPLOADS_DIR) -> Optional[Path]:
+    """Filesystem path of an /uploads/... URL (None for anything else).
+
+    Raises UnsafeImagePath if the path leaves `root`.
+    """
+    prefix = UPLOADS_URL + "/"
+    if not url or not url.startswith(prefix):
+        return None
+    base = root.resolve()
+    path = (base / url[len(prefix):]).resolve()
+    try:
+        path.relative_to(base)
+    except ValueError:
+        raise UnsafeImagePath(url)
+    return path
+
+
+def file_digest(path: Path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def render_image(source: Path, output_dir: Path, root: Path = UPLOADS_DIR) -> Dict[str, Any]:
+    """Write every variant/format of one source image and describe them.
+
+    Runs in a worker process. Output files are named
+    `<stem>-<variant>.<content hash>.<suffix>`; a file that already exists
+    under its hash is left alone.
+    """
+    data = source.read_bytes()
+    with Image.open(io.BytesIO(data)) as opened:
+        image = ImageOps.exif_transpose(opened).convert('RGB')
+
+    derivatives: Dict[str, Dict[str, Any]] = {}
+    for variant, box in VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(box, Image.LANCZOS)
+        entry: Dict[str, Any] = {'width': resized.width, 'height': resized.height}
+        for name, (fmt, suffix, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, fmt, **options)
+            encoded = buffer.getvalue()
+            digest = hashlib.sha256(encoded).hexdigest()[:HASH_LENGTH]
+            target = output_dir / f"{source.stem}-{variant}.{digest}.{suffix}"
+            if not target.exists():
+                temporary = target.with_name(target.name + ".tmp")
+                temporary.write_bytes(encoded)
+                os.replace(temporary, target)
+            entry[name] = url_for(target, root)
+        derivatives[variant] = entry
+
+    return {
+        'source_sha256': hashlib.sha256(data).hexdigest(),
+        'width': image.width,
+        'height': image.height,
+        'derivatives': derivatives,
+    }
+
+
+def find_sources(root: Path = UPLOADS_DIR) -> List[Path]:
+    sources = []
+    for directory in SOURCE_DIRS:
+        for path in sorted((root / directory).glob("*")):
+            if path.is_file() and path.suffix.lower() in SOURCE_SUFFIXES:
+                sources.append(path)
+    return sources
+
+
+def read_manifest(path: Path = MANIFEST_PATH) -> Dict[str, Any]:
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {'version': MANIFEST_VERSION, 'images': {}}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'images': {}}
+    return manifest
+
+
+def is_current(entry: Optional[Dict[str, Any]], digest: str, root: Path) -> bool:
+    """Whether a manifest entry was built from this exact source and its files still exist"""
+    if not entry or entry.get('source_sha256') != digest:
+        return False
+    for variant in VARIANTS:
+        files = entry['derivatives'].get(variant, {})
+        for name in FORMATS:
+            try:
+                target = path_for(files.get(name, ''), root)
+            except UnsafeImagePath:
+                return False
+            if target is None or not target.exists():
+                return False
+    return True
+
+
+def build_derivatives(root: Path = UPLOADS_DIR, workers: Optional[int] = None, force: bool = False) -> Dict[str, Any]:
+    """Render derivatives for every source image and rewrite the manifest.
+
+    Sources whose bytes haven't changed since the last build (and whose
+    outputs still exist) are skipped unless `force` is set.
+    """
+    if Image is None:
+        raise RuntimeError("Building image derivatives requires Pillow (pip install Pillow)")
+
+    output_dir = root / "derived"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / "manifest.json"
+    previous = read_manifest(manifest_path)['images']
+
+    images: Dict[str, Any] = {}
+    pending: List[Path] = []
+    for source in find_sources(root):
+        url = url_for(source, root)
+        if not force and is_current(previous.get(url), file_digest(source), root):
+            images[url] = previous[url]
+        else:
+            pending.append(source)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {url_for(source, root): pool.submit(render_image, source, output_dir, root)
+                       for source in pending}
+            for url, future in futures.items():
+                images[url] = future.result()
+
+    manifest = {'version': MANIFEST_VERSION, 'images': dict(sorted(images.items()))}
+    temporary = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temporary, manifest_path)
+    return {'rendered': len(pending), 'reused': len(images) - len(pending), 'manifest': manifest}
+
+
+class ImageManifest:
+    """In-memory view of the derivative manifest used by the API.
+
+    `derivatives(image_url)` is a dict lookup; the file is only read by
+    `load()` (at startup, or after a rebuild).
+    """
+
+    def __init__(self, path: Path = MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._images: Dict[str, Dict[str, Any]] = {}
+        self.loaded = False
+
+    def load(self):
+        images = {url: entry['derivatives'] for url, entry in read_manifest(self.path)['images'].items()}
+        with self._lock:
+            self._images = images
+            self.loaded = True
+
+    def derivatives(self, image_url: Optional[str]) -> Optional[Dict[str, Any]]:
+        """{variant: {width, height, webp, jpeg}} for an image URL, None if it has none"""
+        if not image_url:
+            return None
+        with self._lock:
+            return self._images.get(image_url)
+
+    def urls(self):
+        with self._lock:
+            return set(self._images)
+
+
+def check_image_urls(conn, root: Path = UPLOADS_DIR, manifest: Optional[ImageManifest] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Report cars whose image_url points at a missing file or has no derivatives.
+
+    `missing` lists image URLs with no file on disk (or outside /uploads);
+    `no_derivatives` lists existing images the manifest doesn't cover yet.
+    Each entry names the affected car ids. An image_url whose path escapes
+    `root` raises UnsafeImagePath.
+    """
+    if manifest is None:
+        manifest = ImageManifest(root / "derived" / "manifest.json")
+        manifest.load()
+    known = manifest.urls()
+
+    missing, no_derivatives = [], []
+    rows = conn.execute("""
+        SELECT image_url, json_group_array(id)
+        FROM (SELECT id, image_url FROM cars WHERE image_url IS NOT NULL AND image_url != '' ORDER BY id)
+        GROUP BY image_url
+        ORDER BY image_url
+    """)
+    for image_url, car_ids in rows:
+        entry = {'image_url': image_url, 'car_ids': json.loads(car_ids)}
+        path = path_for(image_url, root)
+        if path is None or not path.is_file():
+            missing.append(entry)
+        elif image_url not in known:
+            no_derivatives.append(entry)
+    return {'missing': missing, 'no_derivatives': no_derivatives}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and check resized car image derivatives")
+    parser.add_argument("--uploads", type=Path, default=UPLOADS_DIR, help="uploads directory")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build", help="render derivatives and write the manifest")
+    build.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    build.add_argument("--force", action="store_true", help="re-render images that haven't changed")
+    check = subcommands.add_parser("check", help="report cars whose image_url is missing or not derived")
+    check.add_argument("--db", type=Path, default=Path(os.environ.get(
+        "CARRENTAL_DB_PATH", Path(__file__).parent.parent / "db" / "carrental.db")))
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        try:
+            result = build_derivatives(args.uploads, workers=args.workers, force=args.force)
+        except RuntimeError as e:
+            print(f"[IMAGES] {e}", file=sys.stderr)
+            return 1
+        print(f"[IMAGES] {result['rendered']} rendered, {result['reused']} unchanged, "
+              f"manifest: {args.uploads / 'derived' / 'manifest.json'}")
+        return 0
+
+    conn = sqlite3.connect(str(args.db))
+    try:
+        report = check_image_urls(conn, args.uploads)
+    except UnsafeImagePath as e:
+        print(f"[IMAGES] image_url escapes the uploads directory: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    for label, entries in (("missing file", report['missing']), ("no derivatives", report['no_derivatives'])):
+        for entry in entries:
+            print(f"[IMAGES] {label}: {entry['image_url']} (cars {', '.join(map(str, entry['car_ids']))})")
+    if not report['missing'] and not report['no_derivatives']:
+        print("[IMAGES] every car image exists and has derivatives")
+    return 1 if report['missing'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
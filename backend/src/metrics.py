@@ -0,0 +1,372 @@
+# Request and SQL metrics in the Prometheus text format (GET /metrics)
+# MetricsMiddleware counts requests and records their latency per route
+# template (/api/cars/{car_id}, not the raw path, so label values stay few).
+# Every pooled and writer connection gets a sqlite3 trace callback that times
+# each statement and files it under the route of the request that ran it;
+# statements run outside any request (startup, background work, the writer's
+# own BEGIN/COMMIT) are filed under "(none)".
+#
+# A statement is timed from the moment SQLite starts it until the next
+# statement starts on the same connection or the connection is handed back, so
+# the figure includes fetching (and handling) its rows, not just the first
+# step. Set CARRENTAL_METRICS=0 to turn all of this off: no middleware and
+# /metrics returns 404; connections get no trace callback unless the
+# slow-query log is on.
+#
+# The slow-query log is off by default. With CARRENTAL_SLOW_QUERY_MS set,
+# the same trace callback keeps and logs statements at or above it,
+# independently of CARRENTAL_METRICS (so every connection pays for tracing).
+# SQLite hands the callback statements with their bound parameters inlined,
+# and those include password hashes and emails, so the log keeps the
+# statement with every literal replaced by `?` (plus the literals' types).
+# CARRENTAL_SLOW_QUERY_PARAMS=1 also keeps the statement as executed, for
+# debugging on non-production data.
+
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("carrental.sql")
+
+METRICS_ENABLED = os.environ.get("CARRENTAL_METRICS", "1").lower() not in ("0", "false", "no", "off")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram bucket upper bounds, in seconds
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Statement label = first keyword; anything else is "other"
+STATEMENT_KINDS = frozenset(('select', 'insert', 'update', 'delete', 'with', 'begin', 'commit',
+                             'rollback', 'savepoint', 'release', 'pragma', 'create', 'drop', 'analyze'))
+
+NO_ROUTE = "(none)"
+UNMATCHED_ROUTE = "(unmatched)"
+
+# Statements taking at least this long go to the slow-query log (0, the default, disables it)
+SLOW_QUERY_MS = float(os.environ.get("CARRENTAL_SLOW_QUERY_MS", "0"))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("CARRENTAL_SLOW_QUERY_LOG_SIZE", "200"))
+SLOW_QUERY_MAX_SQL = 4000  # characters kept per logged statement
+# Keep slow statements with their literal values too (they may hold personal data)
+SLOW_QUERY_PARAMS = os.environ.get("CARRENTAL_SLOW_QUERY_PARAMS", "0").lower() in ("1", "true", "yes", "on")
+
+_request_sql: ContextVar[Optional["RequestSQL"]] = ContextVar("carrental_request_sql", default=None)
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts are per bucket and cumulated on render"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            yield f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}"
+        yield f"{name}_sum{format_labels(labels)} {self.sum:.6f}"
+        yield f"{name}_count{format_labels(labels)} {self.count}"
+
+
+def format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    text = ','.join(
+        f'{key}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels
+    )
+    return f"{{{text}}}" if text else ""
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms for the API"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: Dict[Tuple[str, str, str], int] = {}
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._sql: Dict[Tuple[str, str], Histogram] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, float]]]] = []
+
+    def observe_request(self, method, route, status, seconds, sql=()):
+        with self._lock:
+            key = (method, route, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            histogram = self._latency.get((method, route))
+            if histogram is None:
+                histogram = self._latency[(method, route)] = Histogram(REQUEST_BUCKETS)
+            histogram.observe(seconds)
+            for kind, statement_seconds in sql:
+                self._observe_sql_locked(route, kind, statement_seconds)
+
+    def observe_sql(self, route, kind, seconds):
+        with self._lock:
+            self._observe_sql_locked(route, kind, seconds)
+
+    def _observe_sql_locked(self, route, kind, seconds):
+        histogram = self._sql.get((route, kind))
+        if histogram is None:
+            histogram = self._sql[(route, kind)] = Histogram(SQL_BUCKETS)
+        histogram.observe(seconds)
+
+    def register_collector(self, collector):
+        """Add a callable returning (name, type, help, value) tuples, read on every scrape"""
+        self._collectors.append(collector)
+
+    def clear(self):
+        with self._lock:
+            self._requests.clear()
+            self._latency.clear()
+            self._sql.clear()
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            requests = sorted(self._requests.items())
+            latency = sorted((key, histogram.samples) for key, histogram in self._latency.items())
+            sql = sorted((key, histogram.samples) for key, histogram in self._sql.items())
+            lines = [
+                "# HELP carrental_http_requests_total HTTP requests by method, route template and status",
+                "# TYPE carrental_http_requests_total counter",
+            ]
+            lines.extend(
+                f"carrental_http_requests_total"
+                f"{format_labels((('method', method), ('route', route), ('status', status)))} {count}"
+                for (method, route, status), count in requests
+            )
+            lines += [
+                "# HELP carrental_http_request_duration_seconds Time until the response was fully sent",
+                "# TYPE carrental_http_request_duration_seconds histogram",
+            ]
+            for (method, route), samples in latency:
+                lines.extend(samples("carrental_http_request_duration_seconds",
+                                     (('method', method), ('route', route))))
+            lines += [
+                "# HELP carrental_sql_statement_duration_seconds SQL statement time by route and statement kind",
+                "# TYPE carrental_sql_statement_duration_seconds histogram",
+            ]
+            for (route, kind), samples in sql:
+                lines.extend(samples("carrental_sql_statement_duration_seconds",
+                                     (('route', route), ('statement', kind))))
+
+        for collector in self._collectors:
+            for name, kind, help_text, value in collector():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# ===== SQL statement timing and the slow-query log =====
+
+class RequestSQL:
+    """SQL timings of the request being served, merged into the registry once the response is sent"""
+
+    __slots__ = ('scope', 'timings')
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.timings: List[Tuple[str, float]] = []  # (statement kind, seconds)
+
+    @property
+    def route(self):
+        return route_of(self.scope)
+
+
+def route_of(scope) -> str:
+    # The router stores the matched route in the scope; fall back to a fixed
+    # label so unknown paths can't add label values
+    return getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+
+
+# SQL literals: blobs, strings (with '' escapes) and numbers not part of an
+# identifier; "quoted identifiers" are matched only so they are skipped whole
+_SQL_LITERAL = re.compile(r'"(?:[^"]|"")*"'
+                          r"|\b[xX]'[0-9a-fA-F]*'|'(?:[^']|'')*'|\b\d+(?:\.\d*)?(?:[eE][+-]?\d+)?\b")
+
+
+def _literal_type(literal: str) -> str:
+    if literal[0] in "xX":
+        return 'blob'
+    if literal[0] == "'":
+        return 'text'
+    return 'integer' if literal.isdigit() else 'real'
+
+
+def normalize_sql(sql: str) -> Tuple[str, List[str]]:
+    """(`sql` with every literal replaced by ?, the replaced literals' types in order)"""
+    types: List[str] = []
+
+    def replace(match):
+        literal = match.group()
+        if literal[0] == '"':
+            return literal
+        types.append(_literal_type(literal))
+        return '?'
+
+    return _SQL_LITERAL.sub(replace, sql), types
+
+
+class SlowQueryLog:
+    """The most recent statements that took at least `threshold_ms`, oldest first.
+
+    Entries carry the statement normalized by normalize_sql(), which drops
+    the bound parameter values SQLite inlines, and are also logged as
+    warnings. With `keep_params` entries also hold the statement as
+    executed (`expanded_sql`); the warnings never do.
+    """
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, size=SLOW_QUERY_LOG_SIZE, keep_params=SLOW_QUERY_PARAMS):
+        self.threshold = threshold_ms / 1000
+        self.keep_params = keep_params
+        self.total = 0
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def record(self, sql, kind, seconds, route):
+        expanded = " ".join(sql.split())
+        normalized, literal_types = normalize_sql(expanded)
+        entry = {
+            'at': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'route': route,
+            'statement': kind,
+            'ms': round(seconds * 1000, 3),
+            'sql': _truncate(normalized),
+            'literal_types': literal_types,
+        }
+        if self.keep_params:
+            entry['expanded_sql'] = _truncate(expanded)
+        with self._lock:
+            self._entries.append(entry)
+            self.total += 1
+        logger.warning("Slow SQL (%.1f ms, %s): %s", entry['ms'], route, entry['sql'])
+
+    def entries(self) -> List[Dict[str, object]]:
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _truncate(sql: str) -> str:
+    return sql[:SLOW_QUERY_MAX_SQL] + "..." if len(sql) > SLOW_QUERY_MAX_SQL else sql
+
+
+slow_queries = SlowQueryLog()
+
+# Callables given the (expanded) text of every statement any instrumented
+# connection runs; tools such as bench/audit_queries.py collect SQL this way
+statement_listeners: List[Callable[[str], None]] = []
+
+
+class StatementClock:
+    """Trace callback of one connection, timing the statement it is running"""
+
+    __slots__ = ('current',)
+
+    def __init__(self):
+        self.current = None  # (kind, started, request, sql) of the running statement
+
+    def trace(self, sql: str):
+        now = time.perf_counter()
+        if sql.startswith('--'):
+            return  # trigger sub-statements count toward the statement that fired them
+        self.finish(now)
+        for listener in statement_listeners:
+            listener(sql)
+        kind = sql.lstrip()[:10].split(None, 1)
+        kind = kind[0].lower() if kind else 'other'
+        self.current = (kind if kind in STATEMENT_KINDS else 'other', now, _request_sql.get(), sql)
+
+    def finish(self, now):
+        current = self.current
+        if current is None:
+            return
+        self.current = None
+        kind, started, request, sql = current
+        seconds = now - started
+        if request is not None:
+            request.timings.append((kind, seconds))
+        elif METRICS_ENABLED:
+            registry.observe_sql(NO_ROUTE, kind, seconds)
+        if slow_queries.enabled and seconds >= slow_queries.threshold:
+            slow_queries.record(sql, kind, seconds, request.route if request is not None else NO_ROUTE)
+
+
+# Keyed by id(conn): sqlite3 connections can't be weakly referenced or given attributes
+_clocks: Dict[int, StatementClock] = {}
+
+
+def instrument_connection(conn):
+    """Time every statement `conn` runs (no-op with metrics, slow-query log and listeners all off)"""
+    if METRICS_ENABLED or slow_queries.enabled or statement_listeners:
+        clock = _clocks[id(conn)] = StatementClock()
+        conn.set_trace_callback(clock.trace)
+
+
+def end_statement(conn):
+    """Stop the clock on the connection's last statement (call when its borrower is done with it)"""
+    clock = _clocks.get(id(conn))
+    if clock is not None:
+        clock.finish(time.perf_counter())
+
+
+def forget_connection(conn):
+    """end_statement() and drop the connection's clock; call before closing it"""
+    end_statement(conn)
+    _clocks.pop(id(conn), None)
+
+
+# ===== Request middleware =====
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts, latency and SQL time per route"""
+
+    def __init__(self, app, registry=registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        request = RequestSQL(scope)
+        token = _request_sql.set(request)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_sql.reset(token)
+            self.registry.observe_request(scope["method"], request.route, status, elapsed, request.timings)
@@ -0,0 +1,206 @@
+# Schema migrations for existing carrental.db files
+# database.sql always describes the current schema for fresh databases; the
+# steps below bring databases created from an older database.sql up to date.
+# Every step is idempotent, and PRAGMA user_version records the last one
+# applied so startup only does work once.
+
+RESERVATION_EPOCH_TRIGGERS = [
+    """
+CREATE TRIGGER IF NOT EXISTS trg_reservations_epoch_insert AFTER INSERT ON reservations
+WHEN NEW.start_epoch IS NULL OR NEW.end_epoch IS NULL
+BEGIN
+  UPDATE reservations
+  SET start_epoch = CAST(strftime('%s', NEW.start_datetime) AS INTEGER),
+      end_epoch   = CAST(strftime('%s', NEW.end_datetime) AS INTEGER)
+  WHERE id = NEW.id;
+END
+    """,
+    """
+CREATE TRIGGER IF NOT EXISTS trg_reservations_epoch_update AFTER UPDATE OF start_datetime, end_datetime ON reservations
+WHEN NEW.start_epoch IS OLD.start_epoch AND NEW.end_epoch IS OLD.end_epoch
+BEGIN
+  UPDATE reservations
+  SET start_epoch = CAST(strftime('%s', NEW.start_datetime) AS INTEGER),
+      end_epoch   = CAST(strftime('%s', NEW.end_datetime) AS INTEGER)
+  WHERE id = NEW.id;
+END
+    """,
+]
+
+
+def column_names(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def add_reservation_epochs(conn):
+    """Integer start/end epochs on reservations with a covering overlap index"""
+    columns = column_names(conn, "reservations")
+    for column in ("start_epoch", "end_epoch"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE reservations ADD COLUMN {column} INTEGER")
+
+    conn.execute("""
+        UPDATE reservations
+        SET start_epoch = CAST(strftime('%s', start_datetime) AS INTEGER),
+            end_epoch   = CAST(strftime('%s', end_datetime) AS INTEGER)
+        WHERE start_epoch IS NULL OR end_epoch IS NULL
+    """)
+    for trigger_sql in RESERVATION_EPOCH_TRIGGERS:
+        conn.execute(trigger_sql)
+    conn.execute("DROP INDEX IF EXISTS idx_reservations_car_time")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reservations_active_car_epoch
+        ON reservations(car_id, start_epoch, end_epoch)
+        WHERE status IN ('confirmed', 'pending')
+    """)
+
+
+def add_car_catalog_indexes(conn):
+    """Composite indexes behind the catalog filters and keyset sort orders"""
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_cars_status_rate ON cars(status, daily_rate_cents)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_cars_status_year ON cars(status, year)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_cars_make_model_year
+        ON cars(make COLLATE NOCASE, model COLLATE NOCASE, year)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_cars_rate ON cars(daily_rate_cents)
+    """)
+
+
+CAR_FEATURE_MASK_TRIGGERS = [
+    """
+CREATE TRIGGER IF NOT EXISTS trg_car_features_mask_insert AFTER INSERT ON car_features
+WHEN NEW.feature_id BETWEEN 1 AND 63
+BEGIN
+  UPDATE cars SET feature_mask = feature_mask | (1 << (NEW.feature_id - 1)) WHERE id = NEW.car_id;
+END
+    """,
+    """
+CREATE TRIGGER IF NOT EXISTS trg_car_features_mask_delete AFTER DELETE ON car_features
+WHEN OLD.feature_id BETWEEN 1 AND 63
+BEGIN
+  UPDATE cars SET feature_mask = feature_mask & ~(1 << (OLD.feature_id - 1)) WHERE id = OLD.car_id;
+END
+    """,
+    """
+CREATE TRIGGER IF NOT EXISTS trg_car_features_mask_update AFTER UPDATE ON car_features
+BEGIN
+  UPDATE cars
+  SET feature_mask = (
+    SELECT COALESCE(SUM(1 << (feature_id - 1)), 0)
+    FROM car_features
+    WHERE car_id = cars.id AND feature_id BETWEEN 1 AND 63
+  )
+  WHERE id IN (OLD.car_id, NEW.car_id);
+END
+    """,
+]
+
+
+def add_car_feature_mask(conn):
+    """Per-car feature bitmask column kept in sync with car_features"""
+    if "feature_mask" not in column_names(conn, "cars"):
+        conn.execute("ALTER TABLE cars ADD COLUMN feature_mask INTEGER NOT NULL DEFAULT 0")
+
+    # Each (car, feature) pair is unique, so SUM of distinct bits equals their OR
+    conn.execute("""
+        UPDATE cars
+        SET feature_mask = (
+            SELECT COALESCE(SUM(1 << (feature_id - 1)), 0)
+            FROM car_features
+            WHERE car_id = cars.id AND feature_id BETWEEN 1 AND 63
+        )
+    """)
+    for trigger_sql in CAR_FEATURE_MASK_TRIGGERS:
+        conn.execute(trigger_sql)
+
+
+def add_daily_car_stats(conn):
+    """Daily per-car occupancy and revenue rollup table, filled from existing rows"""
+    from rollups import rebuild
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_car_stats (
+          day             TEXT NOT NULL,
+          car_id          INTEGER NOT NULL,
+          booked_seconds  INTEGER NOT NULL DEFAULT 0,
+          revenue_cents   INTEGER NOT NULL DEFAULT 0,
+          paid_cents      INTEGER NOT NULL DEFAULT 0,
+          PRIMARY KEY (day, car_id)
+        ) WITHOUT ROWID
+    """)
+    rebuild(conn)
+
+
+def add_user_history_index(conn):
+    """Index a user's reservations by start for the paged My Rentals history"""
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reservations_user_start
+        ON reservations(user_id, start_epoch, id, end_epoch, status)
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_reservations_user")
+
+
+def add_payment_queue(conn):
+    """Queue table for asynchronous payment processing, and payments.failure_reason"""
+    if "failure_reason" not in column_names(conn, "payments"):
+        conn.execute("ALTER TABLE payments ADD COLUMN failure_reason TEXT")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS payment_queue (
+          payment_id    INTEGER PRIMARY KEY,
+          submission    TEXT NOT NULL,
+          owner         TEXT NOT NULL,
+          attempts      INTEGER NOT NULL DEFAULT 0,
+          available_at  INTEGER NOT NULL,
+          last_error    TEXT,
+          FOREIGN KEY (payment_id) REFERENCES payments(id) ON DELETE CASCADE
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_payment_queue_due ON payment_queue(owner, available_at)")
+
+
+def clear_legacy_card_numbers(conn):
+    """Remove the card numbers that payments made before the payment queue kept in provider_ref"""
+    # The 'test' provider stored the submitted card number as its reference
+    conn.execute("PRAGMA secure_delete = ON")
+    conn.execute("UPDATE payments SET provider_ref = NULL WHERE provider = 'test'")
+
+
+# (version, migration) pairs, applied in order
+MIGRATIONS = [
+    (1, add_reservation_epochs),
+    (2, add_car_catalog_indexes),
+    (3, add_car_feature_mask),
+    (4, add_daily_car_stats),
+    (5, add_user_history_index),
+    (6, add_payment_queue),
+    (7, clear_legacy_card_numbers),
+]
+
+
+def apply_migrations(conn):
+    """Run every migration newer than the database's user_version"""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    applied = False
+    for version, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN")
+        try:
+            migrate(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"[DB] Applied migration {version}: {migrate.__doc__}")
+        applied = True
+    if applied:
+        # Copy the migrated pages into the database and empty the WAL, so
+        # rows the migrations removed (card details) don't linger in it
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
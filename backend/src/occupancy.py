@@ -0,0 +1,84 @@
+# Compact per-car occupancy bitmaps for the booking calendar
+# GET /api/cars/{car_id}/availability answers "which days (or hours) of this
+# window are taken?" with one bit per slot instead of the car's whole booking
+# list, so the response size depends only on the window, never on history.
+#
+# Bitmaps are built from the in-memory AvailabilityIndex and kept in a small
+# LRU cache. Entries are tagged with the index's per-car version, which every
+# committed reservation write bumps, so a write makes that car's cached
+# windows miss without the cache having to be told.
+
+import base64
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, Optional, Tuple
+
+SLOT_SECONDS = {'day': 86400, 'hour': 3600}
+# Largest window per granularity (about a year of days, two months of hours)
+MAX_SLOTS = {'day': 366, 'hour': 62 * 24}
+
+CACHE_SIZE = int(os.environ.get("CARRENTAL_OCCUPANCY_CACHE_SIZE", "4096"))
+
+
+def occupancy_bitmap(intervals: Iterable[Tuple[int, int]], start: int, slot_seconds: int, slots: int) -> bytes:
+    """One bit per slot, most significant bit first: 1 if any interval touches the slot.
+
+    `intervals` are [start, end) epoch pairs; slot i covers
+    [start + i*slot_seconds, start + (i+1)*slot_seconds).
+    """
+    bits = bytearray((slots + 7) // 8)
+    window_end = start + slots * slot_seconds
+    for interval_start, interval_end in intervals:
+        if interval_end <= start or interval_start >= window_end or interval_end <= interval_start:
+            continue
+        first = max(0, (interval_start - start) // slot_seconds)
+        last = min(slots - 1, (interval_end - 1 - start) // slot_seconds)
+        for i in range(first, last + 1):
+            bits[i >> 3] |= 0x80 >> (i & 7)
+    return bytes(bits)
+
+
+def encode_bitmap(bitmap: bytes) -> str:
+    return base64.b64encode(bitmap).decode("ascii")
+
+
+class OccupancyCache:
+    """Thread-safe LRU of encoded availability responses.
+
+    Keys are (car_id, start, granularity, slots); each value remembers the
+    index version it was built from and is only returned while the car is
+    still at that version.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, Tuple[Any, bytes]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, version) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, version, body: bytes):
+        with self._lock:
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
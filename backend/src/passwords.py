@@ -0,0 +1,151 @@
+# Password hashing and verification off the event loop
+# Passwords are stored as scrypt hashes ("scrypt$<n>$<r>$<p>$<salt>$<hash>",
+# base64 salt/hash). A hash costs tens of milliseconds of CPU by design, so
+# it never runs in an async handler or a DB thread: PasswordHasher hands the
+# work to a small process pool (separate processes, so hashing can't hold the
+# GIL that the event loop and DB threads need, running at a lower CPU
+# priority) and sheds load with a 503 once too many hashes are waiting,
+# instead of letting a login storm queue up.
+#
+# Rows from before hashing hold the password itself. verify() accepts those
+# and returns a fresh hash to store, as it does for hashes made with older
+# cost settings, so every account is upgraded on its next successful login.
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+# scrypt cost: n=2^14, r=8 is ~50 ms and 16 MiB per hash on current hardware
+SCRYPT_N = int(os.environ.get("CARRENTAL_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.environ.get("CARRENTAL_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("CARRENTAL_SCRYPT_P", "1"))
+SALT_BYTES = 16
+HASH_BYTES = 32
+# Hashing processes (0 = a thread pool instead, for platforms without multiprocessing)
+HASH_WORKERS = int(os.environ.get("CARRENTAL_HASH_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+# Most hashes queued or running at once; more are rejected with HasherBusy
+HASH_QUEUE_SIZE = int(os.environ.get("CARRENTAL_HASH_QUEUE_SIZE", "32"))
+# Scheduling priority drop for the hashing processes (POSIX nice increment), so
+# a burst of logins yields the CPU to request handling instead of competing
+HASH_NICENESS = int(os.environ.get("CARRENTAL_HASH_NICENESS", "10"))
+
+PREFIX = "scrypt$"
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full; the caller should answer 503"""
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=2 * 128 * n * r * p + 1024 * 1024, dklen=HASH_BYTES)
+
+
+def hash_password(password: str, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> str:
+    """A new salted scrypt hash of `password` in the stored format"""
+    salt = os.urandom(SALT_BYTES)
+    return f"{PREFIX}{n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(PREFIX)
+
+
+def verify_password(password: str, stored: str, n: int = SCRYPT_N, r: int = SCRYPT_R,
+                    p: int = SCRYPT_P) -> Tuple[bool, Optional[str]]:
+    """(matches, replacement hash or None).
+
+    A replacement is returned when the password matches but `stored` is a
+    legacy plain value or a hash with other cost parameters than n/r/p.
+    """
+    if not is_hashed(stored):
+        matches = hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+        return matches, hash_password(password, n, r, p) if matches else None
+
+    try:
+        stored_n, stored_r, stored_p, salt, expected = stored[len(PREFIX):].split("$")
+        stored_n, stored_r, stored_p = int(stored_n), int(stored_r), int(stored_p)
+        salt, expected = base64.b64decode(salt), base64.b64decode(expected)
+    except ValueError:
+        return False, None
+    matches = hmac.compare_digest(_scrypt(password, salt, stored_n, stored_r, stored_p), expected)
+    outdated = (stored_n, stored_r, stored_p) != (n, r, p)
+    return matches, hash_password(password, n, r, p) if matches and outdated else None
+
+
+def _init_worker(niceness):
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def _warm_up():
+    return os.getpid()
+
+
+class PasswordHasher:
+    """Async front end to a process pool that hashes and verifies passwords.
+
+    At most `queue_size` jobs are queued or running; further calls raise
+    HasherBusy right away rather than waiting behind them.
+    """
+
+    def __init__(self, workers=HASH_WORKERS, queue_size=HASH_QUEUE_SIZE, niceness=HASH_NICENESS,
+                 n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.niceness = niceness
+        self.cost = (n, r, p)
+        self.pending = 0
+        self.rejected = 0
+        self.completed = 0
+        self._executor: Optional[Executor] = None
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            if self.workers > 0:
+                # spawn, not fork: the server process already runs threads. The
+                # workers import the main module (app.py under `python
+                # src/app.py`) without running its __main__ block.
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=_init_worker, initargs=(self.niceness,))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hash")
+        return self._executor
+
+    async def start(self):
+        """Start the worker processes now rather than on the first login"""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool(), _warm_up) for _ in range(max(1, self.workers))))
+
+    async def _run(self, func, *args):
+        if self.pending >= self.queue_size:
+            self.rejected += 1
+            raise HasherBusy(f"{self.pending} password hashes already in progress")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, *self.cost)
+
+    async def verify(self, password: str, stored: str) -> Tuple[bool, Optional[str]]:
+        """(matches, replacement hash to store or None); see verify_password()"""
+        return await self._run(verify_password, password, stored, *self.cost)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,433 @@
+# Asynchronous payment processing
+# POST /api/payments only records the payment as 'pending' and queues it in
+# the payment_queue table (one short write, so the request never waits on
+# the payment provider). PaymentProcessor, a small pool of asyncio workers,
+# claims due jobs, charges them through the configured PaymentProvider and
+# settles the payment as 'paid' or 'failed'. Clients poll
+# GET /api/payments/{id} (optionally long-polling with `wait`) for the result.
+#
+# Card details are never written to the database (nor, through it, to the
+# WAL, statement listeners or the slow-query log): the processor of the
+# server that accepted the payment holds them in memory under a random
+# submission id, and the queue row only names that submission and the
+# processor owning it. Each processor claims only its own jobs. A job whose
+# owner has stopped can't be charged any more; once it has been due for
+# PAYMENT_ORPHAN_SECONDS another processor fails it as
+# 'card_details_unavailable', and the client can pay again. The queue is
+# therefore not durable across restarts: it keeps pending payments visible
+# and settles each exactly once, but one interrupted by a restart fails.
+#
+# A claimed job is leased, not removed: its available_at is pushed out by
+# PAYMENT_LEASE_SECONDS, and only settling deletes it. If settling fails the
+# job becomes due again when its lease runs out, and providers get a stable
+# idempotency key so such a retry can't charge twice. Provider errors and
+# timeouts are retried with exponential backoff up to PAYMENT_MAX_ATTEMPTS;
+# a decline fails the payment at once.
+#
+# CARRENTAL_PAYMENT_PROVIDER selects the provider: "simulated" (the default,
+# a local stand-in with configurable latency and failure rate) or
+# "package.module:ClassName" for any PaymentProvider subclass.
+
+import asyncio
+import importlib
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+from rollups import rollup_payment
+
+logger = logging.getLogger("carrental.payments")
+
+PAYMENT_PROVIDER = os.environ.get("CARRENTAL_PAYMENT_PROVIDER", "simulated")
+# Charges in flight at once
+PAYMENT_WORKERS = int(os.environ.get("CARRENTAL_PAYMENT_WORKERS", "8"))
+# Seconds a provider call may take before it counts as a (retryable) error
+PAYMENT_TIMEOUT_SECONDS = float(os.environ.get("CARRENTAL_PAYMENT_TIMEOUT_SECONDS", "30"))
+# How long a claimed job stays hidden from other workers; must exceed the timeout
+PAYMENT_LEASE_SECONDS = int(os.environ.get("CARRENTAL_PAYMENT_LEASE_SECONDS", "60"))
+PAYMENT_MAX_ATTEMPTS = int(os.environ.get("CARRENTAL_PAYMENT_MAX_ATTEMPTS", "5"))
+PAYMENT_RETRY_BASE_SECONDS = float(os.environ.get("CARRENTAL_PAYMENT_RETRY_BASE_SECONDS", "2"))
+# Fallback check for due retries and expired leases when nothing wakes the dispatcher
+PAYMENT_POLL_SECONDS = float(os.environ.get("CARRENTAL_PAYMENT_POLL_SECONDS", "1"))
+# How long a job may sit due before it counts as abandoned by its (stopped) processor;
+# must comfortably exceed the time a busy processor takes to get to a due job
+PAYMENT_ORPHAN_SECONDS = int(os.environ.get("CARRENTAL_PAYMENT_ORPHAN_SECONDS", "300"))
+
+# Simulated provider: mean latency, +/- jitter, share of declined cards and
+# share of calls failing with a (retryable) provider error
+SIMULATED_LATENCY_MS = float(os.environ.get("CARRENTAL_PAYMENT_SIM_LATENCY_MS", "300"))
+SIMULATED_JITTER_MS = float(os.environ.get("CARRENTAL_PAYMENT_SIM_JITTER_MS", "100"))
+SIMULATED_FAILURE_RATE = float(os.environ.get("CARRENTAL_PAYMENT_SIM_FAILURE_RATE", "0"))
+SIMULATED_ERROR_RATE = float(os.environ.get("CARRENTAL_PAYMENT_SIM_ERROR_RATE", "0"))
+# Card numbers ending in this are always declined by the simulated provider
+SIMULATED_DECLINE_SUFFIX = "0002"
+SIMULATED_REMEMBERED_CHARGES = 100_000  # idempotency keys kept, oldest forgotten first
+
+# payments.status values
+PENDING, PAID, FAILED = 'pending', 'paid', 'failed'
+# failure_reason of a payment whose card details were lost with the processor holding them
+CARD_DETAILS_UNAVAILABLE = 'card_details_unavailable'
+
+
+# ===== Providers =====
+
+class ChargeRequest:
+    """What a provider needs to charge a card once"""
+
+    __slots__ = ('payment_id', 'idempotency_key', 'amount_cents', 'currency', 'card')
+
+    def __init__(self, payment_id: int, submission: str, amount_cents: int, currency: str, card: Dict[str, str]):
+        self.payment_id = payment_id
+        # Same key for every retry of a submission, so a retried call can't charge twice; a
+        # failed payment paid again (same payment_id) is a new submission and a new charge
+        self.idempotency_key = f"payment-{payment_id}-{submission}"
+        self.amount_cents = amount_cents
+        self.currency = currency
+        self.card = card
+
+
+class ChargeResult:
+    """A provider's final answer: approved (with its reference) or declined (with a reason)"""
+
+    __slots__ = ('approved', 'provider_ref', 'reason')
+
+    def __init__(self, approved: bool, provider_ref: Optional[str] = None, reason: Optional[str] = None):
+        self.approved = approved
+        self.provider_ref = provider_ref
+        self.reason = reason
+
+
+class ProviderError(Exception):
+    """The provider couldn't give an answer (outage, rate limit); the charge is retried"""
+
+
+class PaymentProvider:
+    """Interface of a payment processor.
+
+    charge() returns a ChargeResult for approvals and declines and raises
+    ProviderError (or any exception) when the outcome is unknown, in which
+    case it is called again later with the same idempotency key.
+    """
+
+    name = "provider"
+
+    async def charge(self, request: ChargeRequest) -> ChargeResult:
+        raise NotImplementedError
+
+
+class SimulatedProvider(PaymentProvider):
+    """Local stand-in processor with configurable latency and failure rates"""
+
+    name = "simulated"
+
+    def __init__(self, latency_ms: float = SIMULATED_LATENCY_MS, jitter_ms: float = SIMULATED_JITTER_MS,
+                 failure_rate: float = SIMULATED_FAILURE_RATE, error_rate: float = SIMULATED_ERROR_RATE,
+                 seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._charged: Dict[str, str] = {}  # idempotency key -> provider ref
+
+    async def charge(self, request: ChargeRequest) -> ChargeResult:
+        delay = self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+        await asyncio.sleep(max(0.0, delay) / 1000)
+
+        if request.idempotency_key in self._charged:
+            return ChargeResult(True, self._charged[request.idempotency_key])
+        if self._rng.random() < self.error_rate:
+            raise ProviderError("Simulated provider error")
+        if (request.card.get('card_number', '').endswith(SIMULATED_DECLINE_SUFFIX)
+                or self._rng.random() < self.failure_rate):
+            return ChargeResult(False, reason="card_declined")
+        provider_ref = self._charged[request.idempotency_key] = f"sim_{uuid.uuid4().hex[:16]}"
+        if len(self._charged) > SIMULATED_REMEMBERED_CHARGES:
+            del self._charged[next(iter(self._charged))]
+        return ChargeResult(True, provider_ref)
+
+
+def load_provider(spec: str = PAYMENT_PROVIDER) -> PaymentProvider:
+    """"simulated" or "package.module:ClassName" -> a provider instance"""
+    if spec == "simulated":
+        return SimulatedProvider()
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise ValueError(f"CARRENTAL_PAYMENT_PROVIDER must be 'simulated' or 'module:Class', not {spec!r}")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+# ===== Queue table =====
+
+class PaymentJob:
+    __slots__ = ('payment_id', 'submission', 'attempts', 'amount_cents', 'currency')
+
+    def __init__(self, payment_id: int, submission: str, attempts: int, amount_cents: int, currency: str):
+        self.payment_id = payment_id
+        self.submission = submission
+        self.attempts = attempts
+        self.amount_cents = amount_cents
+        self.currency = currency
+
+
+def enqueue_payment(conn, payment_id: int, submission: str, owner: str, now: int):
+    """Queue a pending payment for the processor `owner` (inside the write that created it).
+
+    `submission` is what the owner holds the card details under
+    (PaymentProcessor.hold()); they are not stored here.
+    """
+    conn.execute("""
+        INSERT INTO payment_queue (payment_id, submission, owner, attempts, available_at)
+        VALUES (?, ?, ?, 0, ?)
+        ON CONFLICT (payment_id) DO UPDATE SET
+            submission = excluded.submission, owner = excluded.owner, attempts = 0,
+            available_at = excluded.available_at, last_error = NULL
+    """, (payment_id, submission, owner, now))
+
+
+def claim_payments(conn, owner: str, limit: int, now: int,
+                   lease_seconds: int = PAYMENT_LEASE_SECONDS) -> List[PaymentJob]:
+    """Lease up to `limit` of `owner`'s due jobs: hide them for `lease_seconds` and count the attempt"""
+    # CROSS JOIN keeps the (small) queue as the outer loop; with the queue
+    # empty at ANALYZE time the planner would otherwise scan payments
+    rows = conn.execute("""
+        SELECT q.payment_id, q.submission, q.attempts, p.amount_cents, p.currency
+        FROM payment_queue q
+        CROSS JOIN payments p ON p.id = q.payment_id
+        WHERE q.owner = ? AND q.available_at <= ?
+        ORDER BY q.available_at
+        LIMIT ?
+    """, (owner, now, limit)).fetchall()
+    jobs = []
+    for payment_id, submission, attempts, amount_cents, currency in rows:
+        conn.execute("UPDATE payment_queue SET available_at = ?, attempts = attempts + 1 WHERE payment_id = ?",
+                     (now + lease_seconds, payment_id))
+        jobs.append(PaymentJob(payment_id, submission, attempts + 1, amount_cents, currency))
+    return jobs
+
+
+def settle_payment(conn, payment_id: int, submission: str, provider: str, result: ChargeResult) -> bool:
+    """Record the provider's answer for `submission` and drop its job.
+
+    False if the job is gone: the submission was already settled, e.g.
+    failed as abandoned while its charge was still running.
+    """
+    cursor = conn.execute("DELETE FROM payment_queue WHERE payment_id = ? AND submission = ?",
+                          (payment_id, submission))
+    if not cursor.rowcount:
+        return False
+    status = PAID if result.approved else FAILED
+    cursor = conn.execute("""
+        UPDATE payments SET status = ?, provider = ?, provider_ref = ?, failure_reason = ?
+        WHERE id = ? AND status = 'pending'
+    """, (status, provider, result.provider_ref, result.reason, payment_id))
+    if cursor.rowcount and status == PAID:
+        rollup_payment(conn, payment_id)
+    return True
+
+
+def retry_payment(conn, payment_id: int, submission: str, error: str, available_at: int):
+    conn.execute("UPDATE payment_queue SET available_at = ?, last_error = ? WHERE payment_id = ? AND submission = ?",
+                 (available_at, error, payment_id, submission))
+
+
+def fail_orphaned_payments(conn, owner: str, provider: str, due_before: int) -> List[int]:
+    """Fail the jobs of processors other than `owner` that have been due since before `due_before`.
+
+    Their card details were only ever in the memory of a processor that
+    has stopped, so they can't be charged; the ids of the failed payments
+    are returned.
+    """
+    rows = conn.execute("SELECT payment_id, submission FROM payment_queue WHERE owner != ? AND available_at < ?",
+                        (owner, due_before)).fetchall()
+    failed = ChargeResult(False, reason=CARD_DETAILS_UNAVAILABLE)
+    return [payment_id for payment_id, submission in rows
+            if settle_payment(conn, payment_id, submission, provider, failed)]
+
+
+def payment_status(conn, payment_id: int) -> Optional[Dict[str, Any]]:
+    """The payment's state and the id of the user who booked the reservation it pays for.
+
+    provider_ref is left out: rows from before the payment queue hold the
+    card number there.
+    """
+    row = conn.execute("""
+        SELECT p.id, p.reservation_id, r.user_id, p.amount_cents, p.currency, p.status, p.provider,
+               p.failure_reason, p.created_at, q.attempts, q.last_error
+        FROM payments p
+        JOIN reservations r ON r.id = p.reservation_id
+        LEFT JOIN payment_queue q ON q.payment_id = p.id
+        WHERE p.id = ?
+    """, (payment_id,)).fetchone()
+    return dict(row) if row is not None else None
+
+
+# ===== Processor =====
+
+class PaymentProcessor:
+    """Pool of asyncio workers settling queued payments through `provider`.
+
+    A dispatcher task claims as many due jobs as there are idle workers and
+    sleeps until notify() (a new payment was queued), a worker frees up, or
+    PAYMENT_POLL_SECONDS pass (retries coming due, expired leases). Once per
+    lease period it also fails other processors' abandoned jobs.
+
+    Card details are held in memory from hold() until their job is settled
+    (or release() when queueing it failed).
+    """
+
+    def __init__(self, writer, provider: Optional[PaymentProvider] = None, workers: int = PAYMENT_WORKERS,
+                 timeout: float = PAYMENT_TIMEOUT_SECONDS, max_attempts: int = PAYMENT_MAX_ATTEMPTS):
+        self.writer = writer
+        self.provider = provider
+        self.workers = workers
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.in_flight = 0
+        self.settled = {PAID: 0, FAILED: 0}
+        self.retries = 0
+        self.owner = uuid.uuid4().hex  # names this processor's jobs in payment_queue
+        self._cards: Dict[str, Dict[str, str]] = {}  # submission -> card details
+        self._next_orphan_check = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self._watchers: Dict[int, List[asyncio.Event]] = {}
+
+    def start(self):
+        if self.provider is None:
+            self.provider = load_provider()
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._dispatcher = self._loop.create_task(self._dispatch())
+
+    async def stop(self):
+        """Stop handing out work; charges in flight are abandoned with the card details held in memory.
+
+        Their jobs can't be charged by any other processor, so another one
+        fails them as 'card_details_unavailable' once they have been due for
+        PAYMENT_ORPHAN_SECONDS.
+        """
+        tasks = [self._dispatcher, *self._running] if self._dispatcher is not None else []
+        self._dispatcher = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def hold(self, card: Dict[str, str]) -> str:
+        """Keep `card` for a new submission; queue the payment under the returned submission id"""
+        submission = uuid.uuid4().hex
+        self._cards[submission] = card
+        return submission
+
+    def release(self, submission: str):
+        self._cards.pop(submission, None)
+
+    def notify(self):
+        """Wake the dispatcher; safe to call from any thread (e.g. an after_commit callback)"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def watch(self, payment_id: int) -> asyncio.Event:
+        """An event set when this process settles `payment_id`; pair with unwatch()"""
+        event = asyncio.Event()
+        self._watchers.setdefault(payment_id, []).append(event)
+        return event
+
+    def unwatch(self, payment_id: int, event: asyncio.Event):
+        events = self._watchers.get(payment_id)
+        if events is not None:
+            events.remove(event)
+            if not events:
+                del self._watchers[payment_id]
+
+    async def _dispatch(self):
+        while True:
+            self._wake.clear()
+            if time.time() >= self._next_orphan_check:
+                await self._fail_orphans()
+            idle = self.workers - self.in_flight
+            jobs = []
+            if idle > 0:
+                try:
+                    jobs = await self.writer.submit(claim_payments, self.owner, idle, int(time.time()))
+                except Exception:
+                    logger.exception("Could not claim queued payments")
+            for job in jobs:
+                self.in_flight += 1
+                task = self._loop.create_task(self._process(job))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            if len(jobs) < idle or idle <= 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), PAYMENT_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _fail_orphans(self):
+        self._next_orphan_check = time.time() + PAYMENT_LEASE_SECONDS
+        try:
+            failed = await self.writer.submit(fail_orphaned_payments, self.owner, self.provider.name,
+                                              int(time.time()) - PAYMENT_ORPHAN_SECONDS)
+        except Exception:
+            logger.exception("Could not fail abandoned payments")
+            return
+        if failed:
+            logger.warning("Failed %d payments queued by a stopped server: %s", len(failed), failed)
+        for payment_id in failed:
+            self._settled(payment_id, FAILED)
+
+    async def _process(self, job: PaymentJob):
+        try:
+            card = self._cards.get(job.submission)
+            if card is None:
+                # Not held by this processor any more; nothing to charge
+                result = ChargeResult(False, reason=CARD_DETAILS_UNAVAILABLE)
+            else:
+                request = ChargeRequest(job.payment_id, job.submission, job.amount_cents, job.currency, card)
+                try:
+                    result = await asyncio.wait_for(self.provider.charge(request), self.timeout)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    await self._retry_or_fail(job, f"{type(e).__name__}: {e}" if str(e) else type(e).__name__)
+                    return
+            await self._settle(job, result)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The lease runs out and the job is claimed again
+            logger.exception("Could not settle payment %s", job.payment_id)
+        finally:
+            self.in_flight -= 1
+            self._wake.set()
+
+    async def _retry_or_fail(self, job: PaymentJob, error: str):
+        if job.attempts >= self.max_attempts:
+            logger.warning("Payment %s failed after %d attempts: %s", job.payment_id, job.attempts, error)
+            await self._settle(job, ChargeResult(False, reason="provider_unavailable"))
+            return
+        delay = PAYMENT_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1)
+        await self.writer.submit(retry_payment, job.payment_id, job.submission, error, int(time.time() + delay))
+        self.retries += 1
+
+    async def _settle(self, job: PaymentJob, result: ChargeResult):
+        settled = await self.writer.submit(settle_payment, job.payment_id, job.submission, self.provider.name,
+                                           result)
+        # Kept until now so a job whose settling failed can be charged again after its lease
+        self.release(job.submission)
+        if settled:
+            self._settled(job.payment_id, PAID if result.approved else FAILED)
+
+    def _settled(self, payment_id: int, status: str):
+        self.settled[status] += 1
+        for event in self._watchers.get(payment_id, ()):
+            event.set()
+
+    def stats(self):
+        return {'in_flight': self.in_flight, 'paid': self.settled[PAID], 'failed': self.settled[FAILED],
+                'retries': self.retries, 'held_cards': len(self._cards)}
@@ -0,0 +1,126 @@
+# A user's rental history for My Rentals (GET /api/reservations/user/{id})
+# Histories are paged with a keyset on (start_epoch, id) over
+# idx_reservations_user_start, which is in that order and also carries
+# end_epoch and status, so the upcoming/past split and the cursor are both
+# checked on the index and a page reads only its own rows. The first pages
+# are what My Rentals asks for on every visit; RentalsCache keeps them per
+# user until one of that user's reservations is written (or a short TTL
+# passes, since reservations move from upcoming to past as time goes by).
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# upcoming: not cancelled and not yet ended, soonest first
+# past: cancelled or ended, most recent first
+RENTAL_SCOPES = ('upcoming', 'past')
+RENTALS_MAX_PAGE_SIZE = 200
+
+RENTALS_CACHE_USERS = int(os.environ.get("CARRENTAL_RENTALS_CACHE_USERS", "5000"))
+RENTALS_CACHE_TTL_SECONDS = float(os.environ.get("CARRENTAL_RENTALS_CACHE_TTL_SECONDS", "60"))
+
+# start_epoch comes last so the cursor can be taken from a page's final row
+# and the column dropped before encoding
+RENTAL_COLUMNS = """
+    r.id,
+    r.user_id,
+    r.car_id,
+    r.start_datetime,
+    r.end_datetime,
+    r.status,
+    r.daily_rate_cents,
+    r.created_at,
+    c.make,
+    c.model,
+    c.year,
+    c.color,
+    c.transmission,
+    c.image_url,
+    r.start_epoch
+"""
+
+
+def build_rentals_query(user_id: int, scope: Optional[str], now: int, after=None):
+    """SQL + params for a user's reservations joined with their cars.
+
+    `scope` is None (everything, most recent first) or one of RENTAL_SCOPES;
+    `after` is a decoded (start_epoch, id) cursor, and rows strictly after it
+    in the scope's order are returned.
+    """
+    clauses = ["r.user_id = ?"]
+    params: List[Any] = [user_id]
+    if scope == 'upcoming':
+        clauses.append("r.status != 'cancelled' AND r.end_epoch > ?")
+        params.append(now)
+    elif scope == 'past':
+        clauses.append("(r.status = 'cancelled' OR r.end_epoch <= ?)")
+        params.append(now)
+
+    ascending = scope == 'upcoming'
+    if after is not None:
+        clauses.append(f"(r.start_epoch, r.id) {'>' if ascending else '<'} (?, ?)")
+        params += [after[0], after[1]]
+
+    order = "ASC" if ascending else "DESC"
+    sql = f"""
+        SELECT {RENTAL_COLUMNS}
+        FROM reservations r
+        JOIN cars c ON r.car_id = c.id
+        WHERE {" AND ".join(clauses)}
+        ORDER BY r.start_epoch {order}, r.id {order}
+    """
+    return sql, params
+
+
+class RentalsCache:
+    """Thread-safe LRU of users' first history pages, each kept at most `ttl_seconds`.
+
+    get() hands out a ticket with every miss; put() only stores the page if
+    the user wasn't invalidated in between, so a page read before a write
+    can't be cached after it.
+    """
+
+    def __init__(self, maxsize: int = RENTALS_CACHE_USERS, ttl_seconds: float = RENTALS_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        # user id -> {page key: (expires, page)}
+        self._users: "OrderedDict[int, Dict[tuple, Tuple[float, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, key: tuple):
+        """(cached page or None, ticket for put())"""
+        with self._lock:
+            pages = self._users.get(user_id)
+            if pages is None:
+                pages = self._users[user_id] = {}
+                while len(self._users) > self.maxsize:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(user_id)
+            entry = pages.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None, pages
+            self.hits += 1
+            return entry[1], pages
+
+    def put(self, user_id: int, key: tuple, ticket, page):
+        with self._lock:
+            if self._users.get(user_id) is ticket:
+                ticket[key] = (time.monotonic() + self.ttl, page)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'users': len(self._users), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
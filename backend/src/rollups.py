@@ -0,0 +1,221 @@
+# Daily per-car occupancy and revenue rollups (daily_car_stats)
+# One row per (day, car) with:
+#   booked_seconds - seconds of that UTC day covered by the car's reservations
+#   revenue_cents  - booked revenue: daily_rate_cents pro rata to booked_seconds
+#   paid_cents     - payments with status 'paid', on the day they were made
+# Reservations count while confirmed, pending or completed; cancelling one
+# takes its days back out.
+#
+# The API keeps the table current from inside each write transaction (see the
+# reservation/payment writers in app.py), so a rollup change commits or rolls
+# back together with the row it describes. `python src/rollups.py rebuild`
+# recomputes everything from reservations and payments, e.g. after seeding
+# data directly into the database; `check` reports any drift.
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+SECONDS_PER_DAY = 86400
+# Reservation statuses whose days count as booked
+BOOKED_STATUSES = ('confirmed', 'pending', 'completed')
+BOOKED_STATUS_SQL = "('confirmed', 'pending', 'completed')"
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+UPSERT_BOOKED_SQL = """
+    INSERT INTO daily_car_stats (day, car_id, booked_seconds, revenue_cents, paid_cents)
+    VALUES (?, ?, ?, ?, 0)
+    ON CONFLICT (day, car_id) DO UPDATE SET
+        booked_seconds = booked_seconds + excluded.booked_seconds,
+        revenue_cents = revenue_cents + excluded.revenue_cents
+"""
+
+DELETE_EMPTY_SQL = """
+    DELETE FROM daily_car_stats
+    WHERE day = ? AND car_id = ?
+    AND booked_seconds = 0 AND revenue_cents = 0 AND paid_cents = 0
+"""
+
+# The whole rollup computed from scratch. Each reservation is cut into UTC
+# days by a recursive CTE; per (reservation, day) the revenue is
+# rate * seconds / 86400 rounded down, exactly as day_slices() does it.
+ROLLUP_SELECT_SQL = f"""
+    WITH RECURSIVE span(car_id, rate, s, e, day_start) AS (
+        SELECT car_id, daily_rate_cents, start_epoch, end_epoch,
+               start_epoch - start_epoch % {SECONDS_PER_DAY}
+        FROM reservations
+        WHERE status IN {BOOKED_STATUS_SQL} AND end_epoch > start_epoch
+        UNION ALL
+        SELECT car_id, rate, s, e, day_start + {SECONDS_PER_DAY}
+        FROM span
+        WHERE day_start + {SECONDS_PER_DAY} < e
+    ),
+    booked(day, car_id, booked_seconds, revenue_cents) AS (
+        SELECT date(day_start, 'unixepoch'), car_id, SUM(secs), SUM(rate * secs / {SECONDS_PER_DAY})
+        FROM (
+            SELECT car_id, rate, day_start, MIN(e, day_start + {SECONDS_PER_DAY}) - MAX(s, day_start) AS secs
+            FROM span
+        )
+        GROUP BY day_start, car_id
+    ),
+    paid(day, car_id, paid_cents) AS (
+        SELECT substr(p.created_at, 1, 10), r.car_id, SUM(p.amount_cents)
+        FROM payments p
+        JOIN reservations r ON r.id = p.reservation_id
+        WHERE p.status = 'paid'
+        GROUP BY 1, 2
+    )
+    SELECT day, car_id, SUM(booked_seconds), SUM(revenue_cents), SUM(paid_cents)
+    FROM (
+        SELECT day, car_id, booked_seconds, revenue_cents, 0 AS paid_cents FROM booked
+        UNION ALL
+        SELECT day, car_id, 0, 0, paid_cents FROM paid
+    )
+    GROUP BY day, car_id
+"""
+
+
+def day_slices(start_epoch: int, end_epoch: int) -> List[Tuple[str, int]]:
+    """(YYYY-MM-DD, seconds) for each UTC day [start, end) touches"""
+    slices = []
+    day_start = start_epoch - start_epoch % SECONDS_PER_DAY
+    while day_start < end_epoch:
+        day_end = day_start + SECONDS_PER_DAY
+        seconds = min(end_epoch, day_end) - max(start_epoch, day_start)
+        slices.append((day_label(day_start), seconds))
+        day_start = day_end
+    return slices
+
+
+def day_label(epoch: int) -> str:
+    """YYYY-MM-DD of the UTC day containing `epoch`"""
+    return date.fromordinal(EPOCH_ORDINAL + epoch // SECONDS_PER_DAY).isoformat()
+
+
+def rollup_booking(conn, car_id: int, start_epoch: int, end_epoch: int, daily_rate_cents: int, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) one reservation's days for a car"""
+    rows = [
+        (day, car_id, sign * seconds, sign * (daily_rate_cents * seconds // SECONDS_PER_DAY))
+        for day, seconds in day_slices(start_epoch, end_epoch)
+    ]
+    conn.executemany(UPSERT_BOOKED_SQL, rows)
+    if sign < 0:
+        conn.executemany(DELETE_EMPTY_SQL, [(day, car_id) for day, car_id, _, _ in rows])
+
+
+def rollup_reservation(conn, reservation_id: int, sign: int = 1):
+    """Add or remove a reservation's days, reading its current row"""
+    row = conn.execute(
+        "SELECT car_id, start_epoch, end_epoch, daily_rate_cents, status FROM reservations WHERE id = ?",
+        (reservation_id,)
+    ).fetchone()
+    if row is not None and row[4] in BOOKED_STATUSES:
+        rollup_booking(conn, row[0], row[1], row[2], row[3], sign)
+
+
+def rollup_payment(conn, payment_id: int):
+    """Count a newly recorded payment on the day it was made"""
+    conn.execute("""
+        INSERT INTO daily_car_stats (day, car_id, booked_seconds, revenue_cents, paid_cents)
+        SELECT substr(p.created_at, 1, 10), r.car_id, 0, 0, p.amount_cents
+        FROM payments p
+        JOIN reservations r ON r.id = p.reservation_id
+        WHERE p.id = ? AND p.status = 'paid'
+        ON CONFLICT (day, car_id) DO UPDATE SET paid_cents = paid_cents + excluded.paid_cents
+    """, (payment_id,))
+
+
+def rebuild(conn) -> int:
+    """Recompute daily_car_stats from reservations and payments; returns the row count.
+
+    Runs as plain statements so it can share the caller's transaction.
+    """
+    conn.execute("DELETE FROM daily_car_stats")
+    conn.execute(f"INSERT INTO daily_car_stats (day, car_id, booked_seconds, revenue_cents, paid_cents) "
+                 f"{ROLLUP_SELECT_SQL}")
+    return conn.execute("SELECT COUNT(*) FROM daily_car_stats").fetchone()[0]
+
+
+def daily_totals(conn, first_day: str, last_day: str, car_id: Optional[int] = None) -> List[Dict[str, object]]:
+    """Fleet (or one car's) totals per day in [first_day, last_day], days with no activity omitted"""
+    sql = """
+        SELECT day, COUNT(*) AS cars_active, SUM(booked_seconds) AS booked_seconds,
+               SUM(revenue_cents) AS revenue_cents, SUM(paid_cents) AS paid_cents
+        FROM daily_car_stats
+        WHERE day BETWEEN ? AND ?
+    """
+    params: List[object] = [first_day, last_day]
+    if car_id is not None:
+        sql += " AND car_id = ?"
+        params.append(car_id)
+    sql += " GROUP BY day ORDER BY day"
+    columns = ('day', 'cars_active', 'booked_seconds', 'revenue_cents', 'paid_cents')
+    return [dict(zip(columns, row)) for row in conn.execute(sql, params)]
+
+
+def car_totals(conn, first_day: str, last_day: str) -> List[Dict[str, object]]:
+    """Per-car totals over [first_day, last_day], most revenue first"""
+    columns = ('car_id', 'days_booked', 'booked_seconds', 'revenue_cents', 'paid_cents')
+    rows = conn.execute("""
+        SELECT car_id, SUM(booked_seconds > 0), SUM(booked_seconds), SUM(revenue_cents), SUM(paid_cents)
+        FROM daily_car_stats
+        WHERE day BETWEEN ? AND ?
+        GROUP BY car_id
+        ORDER BY SUM(revenue_cents) DESC, car_id
+    """, (first_day, last_day))
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def verify(conn) -> List[Dict[str, object]]:
+    """Rows where daily_car_stats differs from a fresh computation (empty if none)"""
+    columns = ('day', 'car_id', 'booked_seconds', 'revenue_cents', 'paid_cents')
+    problems = []
+    expected = {(row[0], row[1]): row[2:] for row in conn.execute(ROLLUP_SELECT_SQL)}
+    actual = {(row[0], row[1]): row[2:] for row in conn.execute(
+        f"SELECT {', '.join(columns)} FROM daily_car_stats")}
+    for key in sorted(expected.keys() | actual.keys()):
+        if expected.get(key) != actual.get(key):
+            problems.append({
+                'day': key[0], 'car_id': key[1],
+                'expected': list(expected[key]) if key in expected else None,
+                'actual': list(actual[key]) if key in actual else None,
+            })
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild or check the daily_car_stats rollup")
+    parser.add_argument("command", choices=("rebuild", "check"))
+    parser.add_argument("--db", type=Path, default=Path(os.environ.get(
+        "CARRENTAL_DB_PATH", Path(__file__).parent.parent / "db" / "carrental.db")))
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(str(args.db), isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 5000")
+    try:
+        if args.command == "rebuild":
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                count = rebuild(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            print(f"[STATS] Rebuilt daily_car_stats: {count} rows")
+            return 0
+        problems = verify(conn)
+    finally:
+        conn.close()
+    for problem in problems[:50]:
+        print(f"[STATS] {problem['day']} car {problem['car_id']}: "
+              f"expected {problem['expected']}, found {problem['actual']}")
+    print(f"[STATS] {len(problems)} mismatched rows" if problems else "[STATS] daily_car_stats is up to date")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
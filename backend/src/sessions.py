@@ -0,0 +1,140 @@
+# Signed session tokens and the cache of who they belong to
+# /api/login issues "<user_id>.<expires>.<signature>" tokens, the signature
+# being a truncated HMAC-SHA256 of the rest under CARRENTAL_SESSION_SECRET.
+# Checking one is a hash and a comparison, no database access. The account
+# behind the token (name, email, role) comes from PrincipalCache, an LRU whose
+# entries also expire after a few minutes and are dropped as soon as the
+# user row changes, so an authenticated request normally runs no user query.
+#
+# Without CARRENTAL_SESSION_SECRET a random secret is made at startup: tokens
+# then stop working on restart and are not shared between server processes.
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger("carrental.sessions")
+
+SESSION_SECRET = os.environ.get("CARRENTAL_SESSION_SECRET", "")
+SESSION_TTL_SECONDS = int(os.environ.get("CARRENTAL_SESSION_TTL_SECONDS", str(12 * 3600)))
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("CARRENTAL_PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("CARRENTAL_PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+# Reject requests without a token; while off, a token is optional but enforced when sent
+REQUIRE_AUTH = os.environ.get("CARRENTAL_REQUIRE_AUTH", "0").lower() in ("1", "true", "yes", "on")
+
+SIGNATURE_BYTES = 16  # 128 bits of HMAC-SHA256 is plenty against forgery and keeps tokens short
+
+
+class InvalidToken(Exception):
+    """The token is malformed, forged or expired"""
+
+
+class Principal:
+    """The account a request is authenticated as"""
+
+    __slots__ = ('id', 'full_name', 'email', 'role')
+
+    def __init__(self, id: int, full_name: str, email: str, role: str):
+        self.id = id
+        self.full_name = full_name
+        self.email = email
+        self.role = role
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == 'admin'
+
+
+class SessionTokens:
+    """Issues and checks HMAC-signed session tokens"""
+
+    def __init__(self, secret: str = SESSION_SECRET, ttl_seconds: int = SESSION_TTL_SECONDS):
+        # A random key means tokens die with the process (see ephemeral)
+        self.ephemeral = not secret
+        self._key = os.urandom(32) if self.ephemeral else secret.encode("utf-8")
+        self.ttl = ttl_seconds
+
+    def warn_if_ephemeral(self):
+        if self.ephemeral:
+            logger.warning("CARRENTAL_SESSION_SECRET is not set; sessions will not survive a restart")
+
+    def _sign(self, payload: bytes) -> bytes:
+        digest = hmac.new(self._key, payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+        return base64.urlsafe_b64encode(digest).rstrip(b"=")
+
+    def issue(self, user_id: int, now: Optional[float] = None) -> Tuple[str, int]:
+        """(token, expiry as a Unix timestamp) for `user_id`"""
+        expires = int(now if now is not None else time.time()) + self.ttl
+        payload = f"{user_id}.{expires}"
+        return f"{payload}.{self._sign(payload.encode('ascii')).decode('ascii')}", expires
+
+    def verify(self, token: str, now: Optional[float] = None) -> int:
+        """The user id the token was issued to; InvalidToken if it isn't valid (any more)"""
+        # Issued tokens are ASCII; anything else can't be one (and can't be compared as bytes)
+        try:
+            raw = token.encode("ascii")
+        except UnicodeEncodeError:
+            raise InvalidToken("Invalid session token")
+        payload, _, signature = raw.rpartition(b".")
+        if not payload or not hmac.compare_digest(self._sign(payload), signature):
+            raise InvalidToken("Invalid session token")
+        user_id, _, expires = payload.partition(b".")
+        try:
+            user_id, expires = int(user_id), int(expires)
+        except ValueError:
+            raise InvalidToken("Invalid session token")
+        if expires <= (now if now is not None else time.time()):
+            raise InvalidToken("Session expired")
+        return user_id
+
+
+class PrincipalCache:
+    """Thread-safe LRU of Principals by user id, each entry kept at most `ttl_seconds`.
+
+    Call invalidate(user_id) whenever that user's row changes.
+    """
+
+    def __init__(self, maxsize: int = PRINCIPAL_CACHE_SIZE, ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[float, Principal]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, principal: Principal):
+        with self._lock:
+            self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,175 @@
+# Static file serving for /uploads with HTTP caching built in
+# Adds to Starlette's StaticFiles:
+#   - strong ETags from the file content (the hash in the name for derived
+#     images, a cached SHA-256 otherwise) instead of mtime/size guesses
+#   - Cache-Control: immutable for content-hashed files, a short max-age for
+#     originals that can be replaced in place
+#   - If-None-Match / If-Modified-Since -> 304
+#   - single byte ranges (206 / 416), honouring If-Range
+# Whole files go out through FileResponse, which hands the path to the server
+# (ASGI pathsend) when it supports that; byte ranges use the ASGI zero-copy
+# send extension when offered and 64 KiB reads otherwise.
+
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from images import HASH_LENGTH
+
+# Cache lifetime of files that are not content-hashed (they may be replaced in place)
+STATIC_MAX_AGE = int(os.environ.get("CARRENTAL_STATIC_MAX_AGE", "3600"))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Content-hash ETags kept in memory, keyed by path, size and mtime
+ETAG_CACHE_SIZE = 4096
+
+HASHED_NAME = re.compile(r"\.([0-9a-f]{%d})\.[A-Za-z0-9]+$" % HASH_LENGTH)
+SINGLE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(name):
+    """The content hash embedded in a derived file name, or None"""
+    match = HASHED_NAME.search(name)
+    return match.group(1) if match else None
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single `bytes=` range.
+
+    Returns None when the header should be ignored (malformed or multiple
+    ranges, which we answer with the whole file) and raises ValueError when
+    the range lies entirely past the end of the file.
+    """
+    match = SINGLE_RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise ValueError("range starts past the end of the file")
+    if end < start:
+        return None
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """206 response carrying bytes [start, end] of a file"""
+
+    def __init__(self, path, start, end, size, headers):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.status_code = 206
+        self.media_type = mimetypes.guess_type(str(path))[0] or "application/octet-stream"
+        self.background = None
+        self.init_headers(headers)
+        self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        count = self.end - self.start + 1
+        with open(self.path, "rb") as f:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": f,
+                            "offset": self.start, "count": count, "more_body": False})
+                return
+            await anyio.to_thread.run_sync(f.seek, self.start)
+            while count > 0:
+                chunk = await anyio.to_thread.run_sync(f.read, min(CHUNK_SIZE, count))
+                if not chunk:
+                    break
+                count -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": count > 0})
+            if count > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with strong ETags, long-lived caching of hashed files and byte ranges"""
+
+    def __init__(self, *args, max_age=STATIC_MAX_AGE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_age = max_age
+        self._etags = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup_path(self, path):
+        # Runs on a worker thread, so hashing a file seen for the first time
+        # happens here rather than on the event loop
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+            self.etag_for(full_path, stat_result)
+        return full_path, stat_result
+
+    def etag_for(self, full_path, stat_result):
+        digest = content_hash(os.path.basename(full_path))
+        if digest is not None:
+            return f'"{digest}"'
+        key = (str(full_path), stat_result.st_size, stat_result.st_mtime_ns)
+        with self._lock:
+            etag = self._etags.get(key)
+            if etag is not None:
+                self._etags.move_to_end(key)
+                return etag
+        sha256 = hashlib.sha256()
+        with open(full_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(block)
+        etag = f'"{sha256.hexdigest()[:HASH_LENGTH * 2]}"'
+        with self._lock:
+            self._etags[key] = etag
+            if len(self._etags) > ETAG_CACHE_SIZE:
+                self._etags.popitem(last=False)
+        return etag
+
+    def cache_control(self, full_path):
+        if content_hash(os.path.basename(full_path)) is not None:
+            return IMMUTABLE_CACHE_CONTROL
+        return f"public, max-age={self.max_age}"
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        etag = self.etag_for(full_path, stat_result)
+        headers = {
+            "etag": etag,
+            "cache-control": self.cache_control(full_path),
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "accept-ranges": "bytes",
+        }
+        response_headers = Headers(headers)
+        if status_code == 200 and self.is_not_modified(response_headers, request_headers):
+            return NotModifiedResponse(response_headers)
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if status_code == 200 and range_header and (if_range is None or if_range.strip() == etag):
+            size = stat_result.st_size
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+            if byte_range is not None:
+                return FileRangeResponse(full_path, *byte_range, size, headers)
+
+        return FileResponse(full_path, status_code=status_code, headers=headers, stat_result=stat_result)
@@ -0,0 +1,244 @@
+# Single-writer queue for all mutating database work
+# One dedicated thread owns the only write connection. Handlers submit write
+# operations and await a future; the writer drains whatever is queued, runs
+# the operations back to back inside one BEGIN IMMEDIATE transaction (each in
+# its own SAVEPOINT so a failing one doesn't take the others down) and then
+# commits them together. Writes can no longer race each other or hit
+# "database is locked", and a burst of N writes costs one commit, not N.
+# Whatever goes wrong with a batch (a savepoint that can't be rolled back, a
+# failed COMMIT, a raising after_commit callback), every operation in it is
+# answered and the thread keeps serving the queue.
+
+import asyncio
+import contextvars
+import logging
+import os
+import queue
+import sqlite3
+import threading
+
+from db import BUSY_TIMEOUT_MS, configure_connection
+from metrics import METRICS_ENABLED, end_statement, forget_connection
+
+# Most operations to group into one transaction
+WRITER_MAX_BATCH = int(os.environ.get("CARRENTAL_WRITER_MAX_BATCH", "64"))
+# Extra time to wait for more writes before committing (0 = only take what is already queued)
+WRITER_GROUP_WAIT_MS = float(os.environ.get("CARRENTAL_WRITER_GROUP_WAIT_MS", "0"))
+
+_STOP = object()
+_current = threading.local()
+
+logger = logging.getLogger("carrental.writer")
+
+
+def after_commit(callback, even_if_rolled_back=False):
+    """Run `callback()` once the current write operation has been committed.
+
+    Use this for in-memory side effects (caches, indexes) that must not be
+    applied if the operation is rolled back. With `even_if_rolled_back` the
+    callback also runs when the operation itself raised, once the rest of
+    its batch is committed: for resyncing in-memory state with the database
+    from an operation that fails. Outside the writer thread the callback
+    runs immediately.
+    """
+    op = getattr(_current, "op", None)
+    if op is None:
+        callback()
+    elif even_if_rolled_back:
+        op.resync_callbacks.append(callback)
+    else:
+        op.callbacks.append(callback)
+
+
+class WriteOperation:
+    __slots__ = ("func", "args", "kwargs", "loop", "future", "callbacks", "resync_callbacks", "context", "resolved")
+
+    def __init__(self, func, args, kwargs, loop, future):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.loop = loop
+        self.future = future
+        self.callbacks = []
+        self.resync_callbacks = []
+        # The submitting request's context, so its SQL timings land under its route
+        self.context = contextvars.copy_context() if METRICS_ENABLED else None
+        self.resolved = False
+
+
+class SingleWriter:
+    """Serializes write operations onto one connection with group commit.
+
+    An operation is a plain function `func(conn, *args, **kwargs)` that runs
+    its statements without committing; raising aborts just that operation.
+    """
+
+    def __init__(self, db_path, max_batch=WRITER_MAX_BATCH, group_wait_ms=WRITER_GROUP_WAIT_MS):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.group_wait = group_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self.transactions = 0
+        self.operations = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    async def submit(self, func, *args, **kwargs):
+        """Queue `func(conn, *args, **kwargs)` for the writer and await its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Queued first: a writer whose connection failed clears _thread before failing the queue
+        self._queue.put(WriteOperation(func, args, kwargs, loop, future))
+        if self._thread is None:
+            self.start()
+        return await future
+
+    def _connect(self):
+        # isolation_level=None: transactions are managed explicitly below
+        conn = sqlite3.connect(str(self.db_path), timeout=BUSY_TIMEOUT_MS / 1000,
+                               isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        configure_connection(conn)
+        return conn
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None, True
+        batch = [first]
+        stop = False
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=self.group_wait) if self.group_wait else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self):
+        try:
+            conn = self._connect()
+        except BaseException as e:
+            # Fail what is queued; the next submit() starts a new thread and tries again
+            logger.exception("Could not open the write connection")
+            self._thread = None
+            self._fail_queued(e)
+            return
+        try:
+            stop = False
+            while not stop:
+                batch, stop = self._next_batch()
+                if not batch:
+                    continue
+                try:
+                    self._execute(conn, batch)
+                    end_statement(conn)
+                except BaseException as e:
+                    # Not expected; answer the batch rather than leave its requests hanging
+                    logger.exception("Write batch failed")
+                    self._abort(conn, batch, e)
+        finally:
+            forget_connection(conn)
+            conn.close()
+
+    def _execute(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            for op in batch:
+                self._resolve(op, error=e)
+            return
+
+        for op in batch:
+            _current.op = op
+            try:
+                conn.execute("SAVEPOINT write_op")
+            except sqlite3.Error as e:
+                _current.op = None
+                self._abort(conn, batch, e)
+                return
+            try:
+                if op.context is not None:
+                    result = op.context.run(op.func, conn, *op.args, **op.kwargs)
+                else:
+                    result = op.func(conn, *op.args, **op.kwargs)
+                conn.execute("RELEASE write_op")
+                outcomes.append((op, result, None))
+            except BaseException as e:
+                op.callbacks.clear()
+                try:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                except sqlite3.Error as rollback_error:
+                    # This operation can't be undone on its own, so nothing in the batch is kept
+                    self._resolve(op, error=e)
+                    self._abort(conn, batch, rollback_error)
+                    return
+                outcomes.append((op, None, e))
+            finally:
+                _current.op = None
+
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self._abort(conn, batch, e)
+            return
+
+        self.transactions += 1
+        self.operations += len(batch)
+        for op, result, error in outcomes:
+            for callback in (op.callbacks + op.resync_callbacks if error is None else op.resync_callbacks):
+                try:
+                    callback()
+                except Exception:
+                    # The write is committed; its result stands
+                    logger.exception("after_commit callback of %s failed", op.func)
+            self._resolve(op, result, error)
+
+    def _fail_queued(self, error):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP:
+                self._resolve(item, error=error)
+
+    def _abort(self, conn, batch, error):
+        """Roll back whatever the batch left open and fail its unanswered operations with `error`"""
+        if conn.in_transaction:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                logger.exception("Could not roll back a failed write batch")
+        for op in batch:
+            self._resolve(op, error=error)
+
+    @staticmethod
+    def _resolve(op, result=None, error=None):
+        if op.resolved:
+            return
+        op.resolved = True
+
+        def settle():
+            if op.future.cancelled():
+                return
+            if error is not None:
+                op.future.set_exception(error)
+            else:
+                op.future.set_result(result)
+        op.loop.call_soon_threadsafe(settle)
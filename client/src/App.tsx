@@ -20,13 +20,28 @@ interface Car {
   daily_rate_cents: number
   status: string
   image_url: string
+  images?: CarImages | null
   features?: string[]
 }
 
+interface ImageVariant {
+  width: number
+  height: number
+  webp: string
+  jpeg: string
+}
+
+interface CarImages {
+  thumb: ImageVariant
+  card: ImageVariant
+  detail: ImageVariant
+}
+
 interface User {
   id: number
   full_name: string
   email: string
+  token: string
 }
 
 interface NewUser {
@@ -604,13 +619,21 @@ function App() {
                 {sortCars(cars.filter(car => car.status === 'available')).map(car => (
                   <div key={car.id} className="car-card">
                     <div className="car-image">
-                      <img 
-                        src={car.image_url ? `http://localhost:3001${car.image_url}` : '/placeholder-car.jpg'}
-                        alt={`${car.make} ${car.model}`}
-                        onError={(e) => {
-                          e.currentTarget.src = 'https://placehold.co/400x300/png?text=No+Image'
-                        }}
-                      />
+                      <picture>
+                        {car.images && (
+                          <source type="image/webp" srcSet={`http://localhost:3001${car.images.card.webp}`} />
+                        )}
+                        <img 
+                          src={car.images
+                            ? `http://localhost:3001${car.images.card.jpeg}`
+                            : car.image_url ? `http://localhost:3001${car.image_url}` : '/placeholder-car.jpg'}
+                          alt={`${car.make} ${car.model}`}
+                          loading="lazy"
+                          onError={(e) => {
+                            e.currentTarget.src = 'https://placehold.co/400x300/png?text=No+Image'
+                          }}
+                        />
+                      </picture>
                     </div>
                   
                     <div className="car-header">
@@ -667,8 +690,9 @@ function App() {
       )}
       </main>
 
-      {showPayment && pendingReservation && selectedCar && (
+      {showPayment && pendingReservation && selectedCar && currentUser && (
         <Payment
+          token={currentUser.token}
           reservationId={pendingReservation.id}
           totalAmount={pendingReservation.totalAmount}
           carInfo={{
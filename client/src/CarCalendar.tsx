@@ -1,11 +1,10 @@
 import { useState, useEffect } from 'react'
 import './CarCalendar.css'
 
-interface Booking {
-  id: number
-  start_datetime: string
-  end_datetime: string
-  status: string
+interface Availability {
+  from: string
+  slots: number
+  bitmap: string
 }
 
 interface CarCalendarProps {
@@ -17,7 +16,8 @@ interface CarCalendarProps {
 
 export default function CarCalendar({ carId, selectedStartDate, selectedEndDate, onDateSelect }: CarCalendarProps) {
   const [currentMonth, setCurrentMonth] = useState(new Date())
-  const [bookings, setBookings] = useState<Booking[]>([])
+  // YYYY-MM-DD -> booked, filled in month by month from the availability bitmap
+  const [bookedDays, setBookedDays] = useState<Map<string, boolean>>(new Map())
   const [selectingStart, setSelectingStart] = useState(true)
   const [tempStartDate, setTempStartDate] = useState<Date | null>(
     selectedStartDate ? new Date(selectedStartDate) : null
@@ -26,29 +26,46 @@ export default function CarCalendar({ carId, selectedStartDate, selectedEndDate,
     selectedEndDate ? new Date(selectedEndDate) : null
   )
 
+  const dayKey = (date: Date): string => {
+    const month = String(date.getMonth() + 1).padStart(2, '0')
+    const day = String(date.getDate()).padStart(2, '0')
+    return `${date.getFullYear()}-${month}-${day}`
+  }
+
   useEffect(() => {
-    loadBookings()
+    setBookedDays(new Map())
   }, [carId])
 
-  const loadBookings = async () => {
+  useEffect(() => {
+    loadMonth(currentMonth)
+  }, [carId, currentMonth])
+
+  const loadMonth = async (month: Date) => {
+    const first = new Date(month.getFullYear(), month.getMonth(), 1)
+    const days = new Date(month.getFullYear(), month.getMonth() + 1, 0).getDate()
     try {
-      const response = await fetch(`http://localhost:3001/api/cars/${carId}/bookings`)
+      const response = await fetch(
+        `http://localhost:3001/api/cars/${carId}/availability?from=${dayKey(first)}&days=${days}`
+      )
       if (response.ok) {
-        const data = await response.json()
-        setBookings(data)
+        const data: Availability = await response.json()
+        const bits = atob(data.bitmap)
+        setBookedDays(previous => {
+          const next = new Map(previous)
+          for (let i = 0; i < data.slots; i++) {
+            const booked = (bits.charCodeAt(i >> 3) & (0x80 >> (i & 7))) !== 0
+            next.set(dayKey(new Date(first.getFullYear(), first.getMonth(), first.getDate() + i)), booked)
+          }
+          return next
+        })
       }
     } catch (error) {
-      console.error('Failed to load bookings:', error)
+      console.error('Failed to load availability:', error)
     }
   }
 
   const isDateBooked = (date: Date): boolean => {
-    const dateStr = date.toISOString().split('T')[0]
-    return bookings.some(booking => {
-      const start = booking.start_datetime.split('T')[0]
-      const end = booking.end_datetime.split('T')[0]
-      return dateStr >= start && dateStr <= end
-    })
+    return bookedDays.get(dayKey(date)) ?? false
   }
 
   const isDateSelected = (date: Date): boolean => {
@@ -25,17 +25,33 @@ interface Reservation {
   image_url: string
 }
 
+interface ReservationPage {
+  items: Reservation[]
+  nextCursor: string | null
+}
+
+// Both lists are paged; "Show more" fetches the next page with the last cursor
+const UPCOMING_PAGE_SIZE = 50
+const HISTORY_PAGE_SIZE = 20
+
 interface MyRentalsProps {
   currentUser: User | null
 }
 
 const api = {
-  async getUserReservations(userId: number): Promise<Reservation[]> {
-    const response = await fetch(`http://localhost:3001/api/reservations/user/${userId}`)
+  async getUserReservations(
+    userId: number,
+    scope: 'upcoming' | 'past',
+    limit: number,
+    cursor: string | null = null
+  ): Promise<ReservationPage> {
+    const params = new URLSearchParams({ scope, limit: String(limit) })
+    if (cursor) params.set('cursor', cursor)
+    const response = await fetch(`http://localhost:3001/api/reservations/user/${userId}?${params}`)
     if (!response.ok) {
       throw new Error(`Failed to fetch reservations: ${response.statusText}`)
     }
-    return response.json()
+    return { items: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') }
   },
 
   async updateReservation(reservationId: number, startDate: string, endDate: string): Promise<void> {
@@ -67,7 +83,11 @@ const api = {
 }
 
 function MyRentals({ currentUser }: MyRentalsProps) {
-  const [reservations, setReservations] = useState<Reservation[]>([])
+  const [upcomingReservations, setUpcomingReservations] = useState<Reservation[]>([])
+  const [pastReservations, setPastReservations] = useState<Reservation[]>([])
+  const [upcomingCursor, setUpcomingCursor] = useState<string | null>(null)
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState<'upcoming' | 'past' | null>(null)
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState<string | null>(null)
   const [editingId, setEditingId] = useState<number | null>(null)
@@ -90,8 +110,14 @@ function MyRentals({ currentUser }: MyRentalsProps) {
     try {
       setLoading(true)
       setError(null)
-      const data = await api.getUserReservations(currentUser.id)
-      setReservations(data)
+      const [upcoming, past] = await Promise.all([
+        api.getUserReservations(currentUser.id, 'upcoming', UPCOMING_PAGE_SIZE),
+        api.getUserReservations(currentUser.id, 'past', HISTORY_PAGE_SIZE),
+      ])
+      setUpcomingReservations(upcoming.items)
+      setUpcomingCursor(upcoming.nextCursor)
+      setPastReservations(past.items)
+      setHistoryCursor(past.nextCursor)
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Failed to load reservations')
     } finally {
@@ -99,6 +125,36 @@ function MyRentals({ currentUser }: MyRentalsProps) {
     }
   }
 
+  const loadMoreUpcoming = async () => {
+    if (!currentUser || !upcomingCursor) return
+
+    try {
+      setLoadingMore('upcoming')
+      const page = await api.getUserReservations(currentUser.id, 'upcoming', UPCOMING_PAGE_SIZE, upcomingCursor)
+      setUpcomingReservations((loaded) => [...loaded, ...page.items])
+      setUpcomingCursor(page.nextCursor)
+    } catch (err) {
+      setError(err instanceof Error ? err.message : 'Failed to load reservations')
+    } finally {
+      setLoadingMore(null)
+    }
+  }
+
+  const loadMoreHistory = async () => {
+    if (!currentUser || !historyCursor) return
+
+    try {
+      setLoadingMore('past')
+      const page = await api.getUserReservations(currentUser.id, 'past', HISTORY_PAGE_SIZE, historyCursor)
+      setPastReservations((loaded) => [...loaded, ...page.items])
+      setHistoryCursor(page.nextCursor)
+    } catch (err) {
+      setError(err instanceof Error ? err.message : 'Failed to load reservations')
+    } finally {
+      setLoadingMore(null)
+    }
+  }
+
   const handleEdit = (reservation: Reservation) => {
     setEditingId(reservation.id)
     setEditForm({
@@ -180,17 +236,6 @@ function MyRentals({ currentUser }: MyRentalsProps) {
     }
   }
 
-  const isActive = (endDate: string) => {
-    return new Date(endDate) > new Date()
-  }
-
-  const upcomingReservations = reservations.filter(
-    (r) => r.status !== 'cancelled' && isActive(r.end_datetime)
-  )
-  const pastReservations = reservations.filter(
-    (r) => r.status === 'cancelled' || !isActive(r.end_datetime)
-  )
-
   if (!currentUser) {
     return (
       <div className="my-rentals">
@@ -353,6 +398,13 @@ function MyRentals({ currentUser }: MyRentalsProps) {
             ))}
           </div>
         )}
+        {upcomingCursor && (
+          <div className="load-more">
+            <button className="btn-secondary" onClick={loadMoreUpcoming} disabled={loadingMore !== null}>
+              {loadingMore === 'upcoming' ? 'Loading...' : 'Show later rentals'}
+            </button>
+          </div>
+        )}
       </section>
 
       {/* Rental History */}
@@ -412,6 +464,13 @@ function MyRentals({ currentUser }: MyRentalsProps) {
             ))}
           </div>
         )}
+        {historyCursor && (
+          <div className="load-more">
+            <button className="btn-secondary" onClick={loadMoreHistory} disabled={loadingMore !== null}>
+              {loadingMore === 'past' ? 'Loading...' : 'Show older rentals'}
+            </button>
+          </div>
+        )}
       </section>
 
       {showPickupInstructions && selectedReservation && (
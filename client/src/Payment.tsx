@@ -2,6 +2,7 @@ import { useState } from 'react'
 import './Payment.css'
 
 interface PaymentProps {
+  token: string
   reservationId: number
   totalAmount: number
   carInfo: {
@@ -24,8 +25,18 @@ interface PaymentForm {
   cvv: string
 }
 
+interface PaymentStatus {
+  id: number
+  reservation_id: number
+  status: string
+  failure_reason: string | null
+}
+
+// Seconds the server holds each status request open while the payment is pending
+const PAYMENT_WAIT_SECONDS = 25
+
 const api = {
-  async processPayment(paymentData: {
+  async processPayment(token: string, paymentData: {
     reservation_id: number
     amount_cents: number
     card_number: string
@@ -37,6 +48,7 @@ const api = {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        Authorization: `Bearer ${token}`,
       },
       body: JSON.stringify(paymentData),
     })
@@ -48,9 +60,24 @@ const api = {
 
     return response.json()
   },
+
+  async waitForPayment(token: string, paymentId: number): Promise<PaymentStatus> {
+    for (;;) {
+      const response = await fetch(
+        `http://localhost:3001/api/payments/${paymentId}?wait=${PAYMENT_WAIT_SECONDS}`,
+        { headers: { Authorization: `Bearer ${token}` } }
+      )
+      if (!response.ok) {
+        throw new Error(`Failed to check payment status (HTTP ${response.status})`)
+      }
+      const payment: PaymentStatus = await response.json()
+      if (payment.status !== 'pending') return payment
+    }
+  },
 }
 
 function Payment({
+  token,
   reservationId,
   totalAmount,
   carInfo,
@@ -95,7 +122,7 @@ function Payment({
     setProcessing(true)
 
     try {
-      await api.processPayment({
+      const accepted = await api.processPayment(token, {
         reservation_id: reservationId,
         amount_cents: totalAmount,
         card_number: paymentForm.card_number.replace(/-/g, ''),
@@ -104,6 +131,16 @@ function Payment({
         cvv: paymentForm.cvv,
       })
 
+      // The payment is charged in the background; wait for the outcome
+      const payment = await api.waitForPayment(token, accepted.id)
+      if (payment.status !== 'paid') {
+        throw new Error(
+          payment.failure_reason === 'card_declined'
+            ? 'Your card was declined. Please try another card.'
+            : 'Payment could not be processed. Please try again.'
+        )
+      }
+
       onPaymentSuccess()
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Payment processing failed')